@@ -1,13 +1,37 @@
 import argparse
 import logging
 from datetime import datetime, timedelta
+from functools import partial
+from pathlib import Path
 
-from mlops.aws import put_csv_to_dynamodb, upload_file_to_s3
-from mlops.const import FEATURE_DYNAMODB_TABLE, FEATURE_S3_BUCKET
-from mlops.data_loader import compose_sql, extract_dataframe_from_athena
+import pandas as pd
+
+from mlops.aws import (
+    download_file_from_s3,
+    put_csv_to_dynamodb,
+    put_latest_feature_version,
+    upload_dir_to_s3,
+    upload_file_to_s3,
+)
+from mlops.const import FEATURE_DYNAMODB_TABLE, FEATURE_S3_BUCKET, LOG_PARTITION_COLUMN
+from mlops.data_loader import (
+    AthenaCache,
+    AthenaLoader,
+    BaseLoader,
+    ParquetLoader,
+    TableQuery,
+    extract_dataframes_in_parallel,
+)
 from mlops.data_validator import IMPRESSION_LOG_SCHEMA, MST_ITEM_SCHEMA, VIEW_LOG_SCHEMA
-from mlops.middleware import Artifact, set_logger_config
-from mlops.model import get_impression_feature, get_model_config
+from mlops.middleware import FILE_FORMATS, Artifact, DataFrameWriter, FileFormat, save_dataframe, set_logger_config
+from mlops.model import (
+    FeatureState,
+    get_impression_feature,
+    get_incremental_impression_feature,
+    get_model_config,
+    get_source_columns,
+    iter_impression_feature,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -40,6 +64,14 @@ ONLINE_FEATURES = [
     "category_3",
     "product_type",
 ]
+# Only the columns of the source tables which the features use are read and validated
+SOURCE_SCHEMAS = {
+    schema.name: schema.select_columns(get_source_columns(list(schema.columns), OFFLINE_FEATURES))
+    for schema in [IMPRESSION_LOG_SCHEMA, VIEW_LOG_SCHEMA, MST_ITEM_SCHEMA]
+}
+QUERY_MST_ITEM = TableQuery(table="mst_item", columns=list(SOURCE_SCHEMAS["mst_item"].columns))
+FEATURE_STATE_KEY_PREFIX = "feature_state"
+FEATURE_STATE_FILES = ["metadata.json", "impression_log.parquet", "view_log.parquet"]
 
 
 def load_options() -> argparse.Namespace:
@@ -48,10 +80,206 @@ def load_options() -> argparse.Namespace:
     """
     parser = argparse.ArgumentParser(description=description)
     parser.add_argument("-t", "--datetime_ub", type=str, default="2018-12-10 00:00:00")
+    parser.add_argument("--workers", type=int, default=1, help="Number of processes of the preprocess sharded by user_id")
+    parser.add_argument("--cache", action="store_true", help="Reuse results of the same Athena queries of the day")
+    parser.add_argument(
+        "--cache_token",
+        type=str,
+        default=None,
+        help="Freshness token of the Athena cache, e.g. the latest partition, the date of the run by default",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Extract features of impressions after the latest feature state, reading only the new logs",
+    )
+    parser.add_argument(
+        "--chunk_days",
+        type=int,
+        default=0,
+        help="Read logs and extract features in chunks of the days to bound the memory, 0 reads the whole period at once",
+    )
+    parser.add_argument("--max_queries", type=int, default=3, help="Number of Athena queries running at the same time")
+    parser.add_argument(
+        "--data_source",
+        type=str,
+        default="athena",
+        choices=["athena", "parquet"],
+        help="Read the tables from Athena, or from local Parquet files in data_dir",
+    )
+    parser.add_argument("--data_dir", type=Path, default=Path("data"), help="Directory of the tables of the parquet source")
+    parser.add_argument(
+        "--artifact_format",
+        type=str,
+        default="parquet",
+        choices=FILE_FORMATS,
+        help="File format of the offline features, csv for the readers of the previous versions",
+    )
 
     return parser.parse_args()
 
 
+def load_latest_feature_state(dir_path: Path, lookback_days: int) -> FeatureState | None:
+    dir_path.mkdir(parents=True, exist_ok=True)
+    try:
+        for file_name in FEATURE_STATE_FILES:
+            download_file_from_s3(
+                s3_bucket=FEATURE_S3_BUCKET,
+                s3_key=f"{FEATURE_STATE_KEY_PREFIX}/latest/{file_name}",
+                file_path=str(dir_path / file_name),
+            )
+        feature_state = FeatureState.load(dir_path)
+    except Exception as e:
+        logger.info(f"Failed to load latest feature state. Error: {e}")
+        return None
+
+    if feature_state.lookback_days != lookback_days:
+        logger.info(f"Lookback days of feature state does not match. {feature_state.lookback_days=}, {lookback_days=}")
+        return None
+    return feature_state
+
+
+def get_log_queries(
+    to_datetime: datetime,
+    lookback_days: int,
+    train_interval_days: int,
+    feature_state: FeatureState | None = None,
+) -> tuple[TableQuery, TableQuery]:
+    if feature_state is not None:
+        # Only logs after the feature state are read, the history before them is in the state
+        impression_from_datetime = view_from_datetime = feature_state.to_datetime
+    else:
+        impression_from_datetime = to_datetime - timedelta(days=train_interval_days)
+        view_from_datetime = to_datetime - timedelta(days=train_interval_days + lookback_days)
+    query_impression_log = TableQuery(
+        table="impression_log",
+        from_datetime=impression_from_datetime,
+        to_datetime=to_datetime,
+        columns=list(SOURCE_SCHEMAS["impression_log"].columns),
+        include_from_datetime=feature_state is None,
+    )
+    query_view_log = TableQuery(
+        table="view_log",
+        from_datetime=view_from_datetime,
+        to_datetime=to_datetime,
+        columns=list(SOURCE_SCHEMAS["view_log"].columns),
+        include_from_datetime=feature_state is None,
+    )
+    return query_impression_log, query_view_log
+
+
+def extract_feature(
+    loader: BaseLoader,
+    to_datetime: datetime,
+    lookback_days: int,
+    train_interval_days: int,
+    feature_state: FeatureState | None = None,
+    workers: int = 1,
+    max_queries: int = 3,
+) -> tuple[pd.DataFrame, FeatureState]:
+    query_impression_log, query_view_log = get_log_queries(
+        to_datetime=to_datetime,
+        lookback_days=lookback_days,
+        train_interval_days=train_interval_days,
+        feature_state=feature_state,
+    )
+
+    # -----------------------------
+    # Extract and Validate Data
+    # -----------------------------
+    # Queries run concurrently, and each table is validated as soon as it is extracted
+    queries = [query_impression_log, query_view_log, QUERY_MST_ITEM]
+    dfs = {}
+    for table, df in extract_dataframes_in_parallel(
+        {query.table: partial(loader.extract, query) for query in queries}, max_workers=max_queries
+    ):
+        dfs[table] = SOURCE_SCHEMAS[table].validate(df)
+    logger.info(f"Extracted data. {loader.stats_dict()=}")
+    df_impression_log, df_view_log, df_item = dfs["impression_log"], dfs["view_log"], dfs["mst_item"]
+
+    # -----------------------------
+    # Preprocess Data
+    # -----------------------------
+    if feature_state is not None:
+        df_feature = get_incremental_impression_feature(
+            df_impression_log=df_impression_log,
+            df_view_log=df_view_log,
+            df_item=df_item,
+            feature_state=feature_state,
+            workers=workers,
+        )
+        feature_state = feature_state.update(df_impression_log, df_view_log, to_datetime=to_datetime)
+    else:
+        df_feature = get_impression_feature(
+            df_impression_log=df_impression_log,
+            df_view_log=df_view_log,
+            df_item=df_item,
+            lookback_days=lookback_days,
+            workers=workers,
+        )
+        feature_state = FeatureState.from_logs(
+            df_impression_log, df_view_log, to_datetime=to_datetime, lookback_days=lookback_days
+        )
+    return df_feature, feature_state
+
+
+def extract_feature_in_chunks(
+    loader: BaseLoader,
+    df_item: pd.DataFrame,
+    to_datetime: datetime,
+    chunk_interval: timedelta,
+    lookback_days: int,
+    train_interval_days: int,
+    file_path: Path,
+    file_format: FileFormat = "parquet",
+    feature_state: FeatureState | None = None,
+    workers: int = 1,
+) -> tuple[pd.DataFrame, FeatureState]:
+    query_impression_log, query_view_log = get_log_queries(
+        to_datetime=to_datetime,
+        lookback_days=lookback_days,
+        train_interval_days=train_interval_days,
+        feature_state=feature_state,
+    )
+    impression_log_chunks = loader.extract_chunks(query_impression_log, chunk_interval=chunk_interval)
+    view_log_chunks = loader.extract_chunks(query_view_log, chunk_interval=chunk_interval)
+    # Chunks are validated as they are read. The uniqueness of impression_id is only checked in each chunk.
+    feature_chunks = iter_impression_feature(
+        impression_log_chunks=(
+            (chunk_to, SOURCE_SCHEMAS["impression_log"].validate(df)) for chunk_to, df in impression_log_chunks
+        ),
+        view_log_chunks=((chunk_to, SOURCE_SCHEMAS["view_log"].validate(df)) for chunk_to, df in view_log_chunks),
+        df_item=df_item,
+        lookback_days=lookback_days,
+        feature_state=feature_state,
+        workers=workers,
+    )
+
+    df_feature_latest = None
+    with DataFrameWriter(file_path, file_format=file_format) as writer:
+        for df_feature, chunk_feature_state in feature_chunks:
+            feature_state = chunk_feature_state
+            writer.write(df_feature[OFFLINE_FEATURES])
+            df_feature = pd.concat([df_feature_latest, df_feature], ignore_index=True)
+            df_feature_latest = df_feature.sort_values("logged_at", ascending=False).drop_duplicates("user_id", keep="first")
+    if df_feature_latest is None or feature_state is None:
+        raise ValueError(f"No chunks are extracted. {query_impression_log=}")
+    return df_feature_latest, feature_state
+
+
+def put_online_features(df_feature: pd.DataFrame, table_name: str, version: str, expired_at: datetime) -> None:
+    # The latest features of the users in df_feature overwrite their rows. Incremental runs only have the users with
+    # new impressions, the other users keep their rows of the previous versions, which predictors read as the latest
+    # row of each user.
+    df_feature_latest = df_feature.sort_values("logged_at", ascending=False).drop_duplicates("user_id", keep="first")
+    df_feature_latest = df_feature_latest[ONLINE_FEATURES]
+    df_feature_latest["version"] = version
+    df_feature_latest["expired_at"] = int(expired_at.timestamp())
+    put_csv_to_dynamodb(df=df_feature_latest, table_name=table_name)
+    # Publish the version after all features are written, so that predictors invalidate their feature cache
+    put_latest_feature_version(table_name=table_name, version=version)
+
+
 def main() -> None:
     args = load_options()
 
@@ -73,61 +301,79 @@ def main() -> None:
     else:
         to_datetime = current_time
 
-    sql = compose_sql(
-        table="impression_log",
-        from_datetime=to_datetime - timedelta(days=model_config.train_interval_days),
-        to_datetime=to_datetime,
-    )
-    df_impression_log = extract_dataframe_from_athena(sql=sql)
-
-    sql = compose_sql(
-        table="view_log",
-        from_datetime=to_datetime - timedelta(days=model_config.train_interval_days + model_config.lookback_days),
-        to_datetime=to_datetime,
-    )
-    df_view_log = extract_dataframe_from_athena(sql=sql)
+    loader: BaseLoader
+    if args.data_source == "parquet":
+        loader = ParquetLoader(root_dir=args.data_dir)
+    else:
+        loader = AthenaLoader(
+            athena_cache=AthenaCache(s3_bucket=FEATURE_S3_BUCKET or None, enabled=args.cache),
+            freshness_token=args.cache_token or current_time.strftime("%Y-%m-%d"),
+            partition_column=LOG_PARTITION_COLUMN or None,
+            s3_output=f"s3://{FEATURE_S3_BUCKET}/athena_unload" if FEATURE_S3_BUCKET else None,
+        )
+    feature_state = None
+    if args.incremental:
+        feature_state = load_latest_feature_state(
+            dir_path=artifact.file_path("previous_feature_state"), lookback_days=model_config.lookback_days
+        )
+        if feature_state is not None and feature_state.to_datetime >= to_datetime:
+            raise ValueError(f"Features are already extracted. {feature_state.to_datetime=}, {to_datetime=}")
+        logger.info(f"Incremental feature extraction. {feature_state is not None=}")
 
-    sql = compose_sql(
-        table="mst_item",
-    )
-    df_item = extract_dataframe_from_athena(sql=sql)
+    feature_file_name = f"df_feature.{args.artifact_format}"
+    if args.chunk_days > 0:
+        df_item = SOURCE_SCHEMAS["mst_item"].validate(loader.extract(QUERY_MST_ITEM))
 
-    # -----------------------------
-    # Validate Data
-    # -----------------------------
-    df_impression_log = IMPRESSION_LOG_SCHEMA.validate(df_impression_log)
-    df_view_log = VIEW_LOG_SCHEMA.validate(df_view_log)
-    df_item = MST_ITEM_SCHEMA.validate(df_item)
+        # Features are appended to the file chunk by chunk, and only the latest features of users are kept in memory
+        df_feature, feature_state = extract_feature_in_chunks(
+            loader=loader,
+            df_item=df_item,
+            to_datetime=to_datetime,
+            chunk_interval=timedelta(days=args.chunk_days),
+            lookback_days=model_config.lookback_days,
+            train_interval_days=model_config.train_interval_days,
+            file_path=artifact.file_path(feature_file_name),
+            file_format=args.artifact_format,
+            feature_state=feature_state,
+            workers=args.workers,
+        )
+    else:
+        df_feature, feature_state = extract_feature(
+            loader=loader,
+            to_datetime=to_datetime,
+            lookback_days=model_config.lookback_days,
+            train_interval_days=model_config.train_interval_days,
+            feature_state=feature_state,
+            workers=args.workers,
+            max_queries=args.max_queries,
+        )
+        save_dataframe(df_feature[OFFLINE_FEATURES], artifact.file_path(feature_file_name), file_format=args.artifact_format)
 
     # -----------------------------
-    # Preprocess Data
+    # Save Feature State
     # -----------------------------
-    df_feature = get_impression_feature(
-        df_impression_log=df_impression_log,
-        df_view_log=df_view_log,
-        df_item=df_item,
-        lookback_days=model_config.lookback_days,
-    )
+    feature_state_dir_path = artifact.file_path("feature_state")
+    feature_state.save(feature_state_dir_path)
+    for key_prefix in [f"{FEATURE_STATE_KEY_PREFIX}/version={version}", f"{FEATURE_STATE_KEY_PREFIX}/latest"]:
+        upload_dir_to_s3(
+            dir_path=feature_state_dir_path, s3_bucket=FEATURE_S3_BUCKET, key_prefix=key_prefix
+        ).raise_for_failures()
 
     # -----------------------------
     # Save Offline Feature Store
     # -----------------------------
-    df_feature_transaction = df_feature[OFFLINE_FEATURES]
-    df_feature_transaction.to_csv(artifact.file_path("df_feature.csv"), index=False)
     upload_file_to_s3(
         s3_bucket=FEATURE_S3_BUCKET,
-        file_path=artifact.file_path("df_feature.csv"),
-        s3_key=f"impression_feature/version={version}/df_feature.csv",
-    )
+        file_path=artifact.file_path(feature_file_name),
+        s3_key=f"impression_feature/version={version}/{feature_file_name}",
+    ).raise_for_failures()
 
     # -----------------------------
     # Save Online Feature Store
     # -----------------------------
-    df_feature_latest = df_feature.sort_values("logged_at", ascending=False).drop_duplicates("user_id", keep="first")
-    df_feature_latest = df_feature_latest[ONLINE_FEATURES]
-    df_feature_latest["version"] = version
-    df_feature_latest["expired_at"] = int((current_time + timedelta(days=7)).timestamp())
-    put_csv_to_dynamodb(df=df_feature_latest, table_name=FEATURE_DYNAMODB_TABLE)
+    put_online_features(
+        df_feature=df_feature, table_name=FEATURE_DYNAMODB_TABLE, version=version, expired_at=current_time + timedelta(days=7)
+    )
 
     logger.info("Finished Feature Extraction.")
 
@@ -0,0 +1,65 @@
+import argparse
+import logging
+from datetime import datetime
+from pathlib import Path
+
+from mlops.data_loader import ParquetLoader, SyntheticDataConfig, generate_synthetic_data
+from mlops.middleware import Artifact, set_logger_config
+
+logger = logging.getLogger(__name__)
+
+
+def load_options() -> argparse.Namespace:
+    description = """
+    Generate synthetic impression_log, view_log and mst_item as the tables of the parquet data source
+    """
+    default = SyntheticDataConfig()
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--data_dir", type=Path, default=Path("data"), help="Directory of the tables of the parquet source")
+    parser.add_argument("--n_users", type=int, default=default.n_users)
+    parser.add_argument("--n_items", type=int, default=default.n_items)
+    parser.add_argument("--n_impressions", type=int, default=default.n_impressions)
+    parser.add_argument("--views_per_impression", type=float, default=default.views_per_impression)
+    parser.add_argument("--click_rate", type=float, default=default.click_rate)
+    parser.add_argument(
+        "--zipf_exponent", type=float, default=default.zipf_exponent, help="Skew of the activity of users and items"
+    )
+    parser.add_argument("--from_date", type=str, default=default.from_datetime.strftime("%Y-%m-%d"))
+    parser.add_argument("--days", type=int, default=default.days)
+    parser.add_argument(
+        "--chunk_rows", type=int, default=default.chunk_rows, help="Rows generated and written at once, which bound the memory"
+    )
+    parser.add_argument("--seed", type=int, default=default.seed)
+
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = load_options()
+
+    version = datetime.now().strftime("%Y%m%d%H%M%S")
+    artifact = Artifact(version=version, job_type="synthetic_data")
+    set_logger_config(log_file_path=artifact.file_path("log.txt"))
+    logger.info(f"{artifact=}, {args=}")
+
+    if args.data_dir.exists() and any(args.data_dir.iterdir()):
+        # Rows are appended to the tables, so that generating into the same directory twice would duplicate them
+        raise ValueError(f"Data directory is not empty. {args.data_dir=}")
+
+    config = SyntheticDataConfig(
+        n_users=args.n_users,
+        n_items=args.n_items,
+        n_impressions=args.n_impressions,
+        views_per_impression=args.views_per_impression,
+        click_rate=args.click_rate,
+        zipf_exponent=args.zipf_exponent,
+        from_datetime=datetime.strptime(args.from_date, "%Y-%m-%d"),
+        days=args.days,
+        chunk_rows=args.chunk_rows,
+        seed=args.seed,
+    )
+    generate_synthetic_data(ParquetLoader(root_dir=args.data_dir), config)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,17 @@
 from .controller import (
+    LATEST_FEATURE_VERSION_USER_ID,
     OnlineFeatureStoreDynamoDB,
+    S3Uploader,
+    UploadSummary,
     download_file_from_s3,
     get_latest_model_version,
     get_model_s3_key,
+    get_s3_uploader,
     put_csv_to_dynamodb,
+    put_latest_feature_version,
     register_model_registry,
     run_task,
     upload_dir_to_s3,
     upload_file_to_s3,
+    upload_files_to_s3,
 )
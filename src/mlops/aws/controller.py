@@ -1,4 +1,10 @@
+import asyncio
 import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
 from pathlib import Path
 from typing import Any
 
@@ -6,43 +12,166 @@ import boto3
 import numpy as np
 import pandas as pd
 from boto3.dynamodb.types import TypeSerializer
+from boto3.s3.transfer import TransferConfig, create_transfer_manager
+from botocore.config import Config
+from botocore.exceptions import ConnectTimeoutError, ReadTimeoutError
 from tqdm import tqdm
 
 from mlops.const import PUBLIC_SUBNET_1A, TRAIN_SECURITY_GROUP
 
 logger = logging.getLogger(__name__)
 
+# Item of the online feature store which holds the latest published feature version (user_id is never negative).
+# It is a row of the feature table, so that scans and exports of the table exclude it with user_id >= 0.
+LATEST_FEATURE_VERSION_USER_ID = -1
+
+
+@dataclass
+class UploadSummary:
+    n_files: int = 0
+    n_bytes: int = 0
+    duration_seconds: float = 0.0
+    retry_count: int = 0
+    # Error of each file which failed in all attempts
+    failures: dict[str, str] = field(default_factory=dict)
+
+    @property
+    def is_succeeded(self) -> bool:
+        return not self.failures
+
+    def stats_dict(self) -> dict[str, Any]:
+        mib_per_second = self.n_bytes / 1024**2 / self.duration_seconds if self.duration_seconds > 0 else 0.0
+        return {
+            "n_files": self.n_files,
+            "n_bytes": self.n_bytes,
+            "duration_seconds": round(self.duration_seconds, 3),
+            "mib_per_second": round(mib_per_second, 1),
+            "retry_count": self.retry_count,
+            "failure_count": len(self.failures),
+        }
+
+    def raise_for_failures(self) -> None:
+        if self.failures:
+            raise RuntimeError(f"Failed to upload files to S3. {self.failures=}")
+
+
+class S3Uploader:
+    # Uploads files concurrently on one transfer manager, which shares a pool of threads and connections between the
+    # files and the parts of multipart uploads. Files failing in all the retries of botocore are uploaded again with
+    # exponential backoff.
+    def __init__(
+        self,
+        max_concurrency: int = 10,
+        multipart_threshold: int = 8 * 1024**2,
+        multipart_chunksize: int = 8 * 1024**2,
+        max_attempts: int = 3,
+        backoff_seconds: float = 0.5,
+    ) -> None:
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.client = boto3.client(
+            "s3",
+            config=Config(
+                max_pool_connections=max_concurrency, tcp_keepalive=True, retries={"mode": "standard", "max_attempts": 3}
+            ),
+        )
+        # The classic client, the CRT client does not share the connections of the botocore client
+        self.transfer_config = TransferConfig(
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=multipart_chunksize,
+            max_concurrency=max_concurrency,
+            preferred_transfer_client="classic",
+        )
+        self.transfer_manager = create_transfer_manager(self.client, self.transfer_config)
+
+    def close(self) -> None:
+        self.transfer_manager.shutdown()
+
+    def upload_files(self, s3_bucket: str, files: dict[Path, str], extra_args: dict[str, Any] | None = None) -> UploadSummary:
+        # files are file paths and their S3 keys, extra_args such as Metadata are applied to all the files
+        summary = UploadSummary()
+        start = time.perf_counter()
+        pending = dict(files)
+        errors: dict[Path, str] = {}
+        for attempt in range(self.max_attempts):
+            if not pending:
+                break
+            if attempt > 0:
+                summary.retry_count += len(pending)
+                time.sleep(self.backoff_seconds * 2 ** (attempt - 1))
+            futures = {
+                file_path: self.transfer_manager.upload(str(file_path), s3_bucket, s3_key, extra_args=extra_args)
+                for file_path, s3_key in pending.items()
+            }
+            for file_path, future in futures.items():
+                try:
+                    future.result()
+                except Exception as e:
+                    errors[file_path] = str(e)
+                    logger.info(f"Failed to upload {file_path}. {attempt=}, Error: {e}")
+                    continue
+                s3_key = pending.pop(file_path)
+                summary.n_files += 1
+                summary.n_bytes += file_path.stat().st_size
+                logger.info(f"Uploaded {file_path} to s3://{s3_bucket}/{s3_key}")
+        summary.failures = {str(file_path): errors[file_path] for file_path in pending}
+        summary.duration_seconds = time.perf_counter() - start
+        logger.info(f"Finished uploading files to S3. {s3_bucket=}, {summary.stats_dict()=}")
+        if summary.failures:
+            logger.warning(f"Failed to upload files to S3. {summary.failures=}")
+        return summary
+
+
+_s3_uploader: S3Uploader | None = None
+_s3_uploader_lock = threading.Lock()
+
+
+def get_s3_uploader() -> S3Uploader:
+    # One uploader per process, so that the client and its connections are reused between calls
+    global _s3_uploader
+    with _s3_uploader_lock:
+        if _s3_uploader is None:
+            _s3_uploader = S3Uploader()
+        return _s3_uploader
+
+
+def _reset_s3_uploader_after_fork() -> None:
+    # Workers of the prefork server are forked after the model is downloaded. The connections and the threads of the
+    # transfer manager of the parent can not be shared, so that each worker creates its own uploader.
+    global _s3_uploader, _s3_uploader_lock
+    _s3_uploader = None
+    _s3_uploader_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_s3_uploader_after_fork)
+
 
 def download_file_from_s3(s3_bucket: str, s3_key: str, file_path: str) -> None:
     logger.info(f"Start download model file: {s3_key}, file_path: {file_path}")
-    s3_client = boto3.client("s3")
-    s3_client.download_file(s3_bucket, s3_key, file_path)
+    get_s3_uploader().client.download_file(s3_bucket, s3_key, file_path)
     logger.info(f"Finished download model file: {s3_key}, file_path: {file_path}")
 
 
-def upload_dir_to_s3(dir_path: Path, s3_bucket: str, key_prefix: str) -> None:
-    s3_client = boto3.client("s3")
-    for file_path in dir_path.rglob("*"):
-        if file_path.is_file():
-            s3_key = key_prefix + "/" + str(file_path.relative_to(dir_path))
-            try:
-                s3_client.upload_file(str(file_path), s3_bucket, s3_key)
-                logger.info(f"Uploaded {file_path} to s3://{s3_bucket}/{s3_key}")
-            except Exception as e:
-                logger.info(f"Failed to upload {file_path}. Error: {e}")
+def upload_files_to_s3(s3_bucket: str, files: dict[Path, str], extra_args: dict[str, Any] | None = None) -> UploadSummary:
+    return get_s3_uploader().upload_files(s3_bucket=s3_bucket, files=files, extra_args=extra_args)
+
+
+def upload_dir_to_s3(dir_path: Path, s3_bucket: str, key_prefix: str) -> UploadSummary:
+    files = {
+        file_path: key_prefix + "/" + str(file_path.relative_to(dir_path))
+        for file_path in sorted(dir_path.rglob("*"))
+        if file_path.is_file()
+    }
+    return upload_files_to_s3(s3_bucket=s3_bucket, files=files)
 
 
 def upload_file_to_s3(
     s3_bucket: str,
     file_path: Path,
     s3_key: str,
-) -> None:
-    s3_client = boto3.client("s3")
-    try:
-        s3_client.upload_file(str(file_path), s3_bucket, s3_key)
-        logger.info(f"Succeed to upload {file_path} to s3://{s3_bucket}/{s3_key}")
-    except Exception as e:
-        logger.info(f"Failed to upload {file_path}. Error: {e}")
+    extra_args: dict[str, Any] | None = None,
+) -> UploadSummary:
+    return upload_files_to_s3(s3_bucket=s3_bucket, files={file_path: s3_key}, extra_args=extra_args)
 
 
 def register_model_registry(table_name: str, model_name: str, version: str, metadata: dict[str, Any]) -> None:
@@ -121,13 +250,88 @@ def put_csv_to_dynamodb(df: pd.DataFrame, table_name: str) -> None:
             batch.put_item(Item=item)
 
 
+def put_latest_feature_version(table_name: str, version: str) -> None:
+    logger.info(f"Start put latest feature version {table_name=}, {version=}")
+    client = boto3.client("dynamodb")
+    client.put_item(
+        TableName=table_name,
+        Item={"user_id": {"N": str(LATEST_FEATURE_VERSION_USER_ID)}, "version": {"N": str(version)}},
+    )
+
+
+@dataclass
+class OnlineFeatureStoreStats:
+    timeouts: int = 0
+    errors: int = 0
+
+
 class OnlineFeatureStoreDynamoDB:
-    def __init__(self, table: str, version: str):
+    # BatchGetItem accepts up to 100 keys per request
+    BATCH_GET_ITEM_SIZE = 100
+    BATCH_GET_ITEM_MAX_ATTEMPTS = 5
+
+    def __init__(
+        self, table: str, version: str, max_pool_connections: int = 10, timeout: float | None = None, max_attempts: int = 2
+    ):
         self.table = table
         self.version = version
-        self.client = boto3.client("dynamodb")
+        self.timeout = timeout
+        # Requests which exceed the timeout are aborted by the client, since a timeout of the awaiting coroutine does
+        # not stop the request and it would keep its executor thread and connection
+        timeout_config: dict[str, Any] = {}
+        if timeout is not None:
+            timeout_config = dict(
+                connect_timeout=timeout, read_timeout=timeout, retries={"mode": "standard", "total_max_attempts": max_attempts}
+            )
+        # One connection per executor thread, so that async calls never wait for a free connection
+        self.client = boto3.client(
+            "dynamodb", config=Config(max_pool_connections=max_pool_connections, tcp_keepalive=True, **timeout_config)
+        )
+        self.executor = ThreadPoolExecutor(max_workers=max_pool_connections, thread_name_prefix="online_feature_store")
+        # Failed lookups are served as empty features, so they are counted to be monitored
+        self.stats = OnlineFeatureStoreStats()
+        self._stats_lock = threading.Lock()
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _count_failure(self, e: Exception) -> None:
+        with self._stats_lock:
+            if isinstance(e, TimeoutError | ConnectTimeoutError | ReadTimeoutError):
+                self.stats.timeouts += 1
+            else:
+                self.stats.errors += 1
+            stats = asdict(self.stats)
+        logger.warning(f"Failed to get impression features, which are served empty. Error: {e!r}, {stats=}")
+
+    def stats_dict(self) -> dict[str, int]:
+        with self._stats_lock:
+            return asdict(self.stats)
 
     def get_impression_feature(self, user_id: int) -> dict[str, str | int]:
+        try:
+            return self._get_impression_feature(user_id)
+        except Exception as e:
+            self._count_failure(e)
+            return {}
+
+    def get_impression_features(self, user_ids: list[int]) -> dict[int, dict[str, str | int]]:
+        unique_user_ids = list(dict.fromkeys(user_ids))
+
+        # The latest version differs per user, so it can not be expressed as a BatchGetItem key
+        if self.version == "latest":
+            return {user_id: self.get_impression_feature(user_id=user_id) for user_id in unique_user_ids}
+
+        records: dict[int, dict[str, str | int]] = {user_id: {} for user_id in unique_user_ids}
+        try:
+            self._get_impression_features(unique_user_ids, records)
+        except Exception as e:
+            self._count_failure(e)
+        return records
+
+    # Failures are raised to the public methods, which count each failed lookup once. Failures of lookups which the
+    # async methods have already given up on are not counted again.
+    def _get_impression_feature(self, user_id: int) -> dict[str, str | int]:
         if self.version == "latest":
             options = {
                 "TableName": self.table,
@@ -143,27 +347,95 @@ class OnlineFeatureStoreDynamoDB:
                 "ExpressionAttributeValues": {":user_id": {"N": str(user_id)}, ":version": {"N": str(self.version)}},
             }
 
-        record = {}
+        record: dict[str, str | int] = {}
+        response = self.client.query(**options)
+        if response["Items"]:
+            logger.info(f"{response=}")
+            item = response["Items"][0]
+            logger.info(f"{item=}")
+            record = _deserialize_item(item)
+        logger.info(f"{record=}")
+        return record
+
+    def _get_impression_features(self, user_ids: list[int], records: dict[int, dict[str, str | int]]) -> None:
+        # records are filled in place, so that users of the batches before a failure are still served
+        for i in range(0, len(user_ids), self.BATCH_GET_ITEM_SIZE):
+            keys = [
+                {"user_id": {"N": str(user_id)}, "version": {"N": str(self.version)}}
+                for user_id in user_ids[i : i + self.BATCH_GET_ITEM_SIZE]
+            ]
+            request_items = {self.table: {"Keys": keys}}
+            # Retry unprocessed keys (e.g. throttled) with exponential backoff
+            for attempt in range(self.BATCH_GET_ITEM_MAX_ATTEMPTS):
+                if not request_items:
+                    break
+                if attempt > 0:
+                    time.sleep(0.05 * 2**attempt)
+                response = self.client.batch_get_item(RequestItems=request_items)
+                for item in response["Responses"].get(self.table, []):
+                    records[int(item["user_id"]["N"])] = _deserialize_item(item)
+                request_items = response.get("UnprocessedKeys", {})
+
+        logger.info(f"Finished batch get impression features. {len(user_ids)=}")
+
+    async def get_impression_feature_async(self, user_id: int, timeout: float | None = None) -> dict[str, str | int]:
+        timeout = self.timeout if timeout is None else timeout
+        loop = asyncio.get_running_loop()
         try:
-            response = self.client.query(**options)
-            if response["Items"]:
-                logger.info(f"{response=}")
-                item = response["Items"][0]
-                logger.info(f"{item=}")
-                for key, value_type in item.items():
-                    if "N" in value_type:
-                        value = value_type["N"]
-                    elif "S" in value_type:
-                        value = value_type["S"]
-                    else:
-                        value = np.nan
-                    record[key] = value
-            logger.info(f"{record=}")
-            return record
+            return await asyncio.wait_for(
+                loop.run_in_executor(self.executor, self._get_impression_feature, user_id), timeout=timeout
+            )
+        except Exception as e:
+            if isinstance(e, TimeoutError):
+                logger.info(f"Timeout to get impression feature. {user_id=}, {timeout=}")
+            self._count_failure(e)
+            return {}
+
+    async def get_impression_features_async(
+        self, user_ids: list[int], timeout: float | None = None
+    ) -> dict[int, dict[str, str | int]]:
+        timeout = self.timeout if timeout is None else timeout
+        unique_user_ids = list(dict.fromkeys(user_ids))
+
+        # Queries for the latest version run concurrently on the executor
+        if self.version == "latest":
+            records = await asyncio.gather(
+                *[self.get_impression_feature_async(user_id, timeout=timeout) for user_id in unique_user_ids]
+            )
+            return dict(zip(unique_user_ids, records, strict=True))
 
+        loop = asyncio.get_running_loop()
+        batch_records: dict[int, dict[str, str | int]] = {user_id: {} for user_id in unique_user_ids}
+        try:
+            await asyncio.wait_for(
+                loop.run_in_executor(self.executor, self._get_impression_features, unique_user_ids, batch_records),
+                timeout=timeout,
+            )
         except Exception as e:
-            logger.info(f"Error: {e}")
-            return record
+            self._count_failure(e)
+            if isinstance(e, TimeoutError):
+                logger.info(f"Timeout to get impression features. {len(unique_user_ids)=}, {timeout=}")
+                # The executor may still be filling the records
+                return {user_id: {} for user_id in unique_user_ids}
+        return batch_records
+
+    async def get_latest_feature_version_async(self) -> str | None:
+        record = await self.get_impression_feature_async(user_id=LATEST_FEATURE_VERSION_USER_ID)
+        version = record.get("version")
+        return None if version is None else str(version)
+
+
+def _deserialize_item(item: dict[str, dict[str, Any]]) -> dict[str, str | int]:
+    record = {}
+    for key, value_type in item.items():
+        if "N" in value_type:
+            value = value_type["N"]
+        elif "S" in value_type:
+            value = value_type["S"]
+        else:
+            value = np.nan
+        record[key] = value
+    return record
 
 
 def run_task(command: list[str], cpu: int = 1024, memory: int = 2048) -> None:
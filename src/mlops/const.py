@@ -8,3 +8,5 @@ FEATURE_DYNAMODB_TABLE: Final = "mlops-impression-feature"
 MODEL_REGISTRY_DYNAMODB_TABLE: Final = "mlops-model-registry"
 PUBLIC_SUBNET_1A: Final = ""
 TRAIN_SECURITY_GROUP: Final = ""
+# Date partition column (yyyy-mm-dd) of impression_log and view_log, empty when the tables are not partitioned
+LOG_PARTITION_COLUMN: Final = ""
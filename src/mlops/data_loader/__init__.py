@@ -1 +1,7 @@
-from .from_athena import compose_sql, extract_dataframe_from_athena
+from .athena_loader import AthenaLoader
+from .base_loader import BaseLoader, TableQuery
+from .cache import AthenaCache
+from .from_athena import compose_sql, extract_dataframe_chunks_from_athena, extract_dataframe_from_athena
+from .parallel import extract_dataframes_in_parallel
+from .parquet_loader import ParquetLoader
+from .synthetic import SyntheticDataConfig, generate_synthetic_data, iter_impression_log, iter_view_log
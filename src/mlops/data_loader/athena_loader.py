@@ -0,0 +1,69 @@
+from collections.abc import Iterator
+from datetime import datetime, timedelta
+from typing import Literal
+
+import pandas as pd
+
+from mlops.const import GLUE_DATABASE
+
+from .base_loader import BaseLoader, TableQuery
+from .cache import AthenaCache
+from .from_athena import compose_sql, extract_dataframe_chunks_from_athena
+
+
+class AthenaLoader(BaseLoader):
+    def __init__(
+        self,
+        athena_cache: AthenaCache | None = None,
+        database: str = GLUE_DATABASE,
+        freshness_token: str = "",
+        dtype_backend: Literal["numpy_nullable", "pyarrow"] = "numpy_nullable",
+        partition_column: str | None = None,
+        s3_output: str | None = None,
+    ) -> None:
+        self.athena_cache = athena_cache if athena_cache is not None else AthenaCache(enabled=False)
+        self.database = database
+        self.freshness_token = freshness_token
+        self.dtype_backend = dtype_backend
+        self.partition_column = partition_column
+        # Chunks are unloaded to Parquet under this S3 prefix
+        self.s3_output = s3_output
+
+    def describe(self, query: TableQuery) -> str:
+        return compose_sql(
+            table=query.table,
+            from_datetime=query.from_datetime,
+            to_datetime=query.to_datetime,
+            columns=query.columns,
+            partition_column=self.partition_column,
+            include_from_datetime=query.include_from_datetime,
+        )
+
+    def extract(self, query: TableQuery) -> pd.DataFrame:
+        return self.athena_cache.extract(
+            sql=self.describe(query),
+            database=self.database,
+            freshness_token=self.freshness_token,
+            dtype_backend=self.dtype_backend,
+        )
+
+    def extract_chunks(
+        self, query: TableQuery, chunk_interval: timedelta = timedelta(days=1)
+    ) -> Iterator[tuple[datetime, pd.DataFrame]]:
+        if query.from_datetime is None or query.to_datetime is None:
+            raise ValueError(f"Chunks need both from_datetime and to_datetime. {query=}")
+        return extract_dataframe_chunks_from_athena(
+            table=query.table,
+            from_datetime=query.from_datetime,
+            to_datetime=query.to_datetime,
+            chunk_interval=chunk_interval,
+            database=self.database,
+            s3_output=self.s3_output,
+            dtype_backend=self.dtype_backend,
+            include_from_datetime=query.include_from_datetime,
+            columns=query.columns,
+            partition_column=self.partition_column,
+        )
+
+    def stats_dict(self) -> dict[str, int]:
+        return self.athena_cache.stats_dict()
@@ -0,0 +1,50 @@
+from abc import ABC, abstractmethod
+from collections.abc import Iterator
+from dataclasses import dataclass, replace
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from .from_athena import get_chunk_intervals
+
+
+@dataclass(frozen=True)
+class TableQuery:
+    # Rows of the table with logged_at in [from_datetime, to_datetime], or (from_datetime, to_datetime] unless
+    # include_from_datetime, as in compose_sql
+    table: str
+    from_datetime: datetime | None = None
+    to_datetime: datetime | None = None
+    columns: list[str] | None = None
+    include_from_datetime: bool = True
+
+
+class BaseLoader(ABC):
+    @abstractmethod
+    def extract(self, query: TableQuery) -> pd.DataFrame:
+        raise NotImplementedError
+
+    @abstractmethod
+    def describe(self, query: TableQuery) -> str:
+        # Query run by the loader, which is saved with the artifacts
+        raise NotImplementedError
+
+    def extract_chunks(
+        self, query: TableQuery, chunk_interval: timedelta = timedelta(days=1)
+    ) -> Iterator[tuple[datetime, pd.DataFrame]]:
+        # Yields (chunk_to, rows of the table in the chunk) in order of logged_at, with the same chunks as
+        # extract_dataframe_chunks_from_athena
+        if query.from_datetime is None or query.to_datetime is None:
+            raise ValueError(f"Chunks need both from_datetime and to_datetime. {query=}")
+        intervals = get_chunk_intervals(query.from_datetime, query.to_datetime, chunk_interval)
+        for i, (chunk_from, chunk_to) in enumerate(intervals):
+            chunk_query = replace(
+                query,
+                from_datetime=chunk_from,
+                to_datetime=chunk_to,
+                include_from_datetime=query.include_from_datetime and i == 0,
+            )
+            yield chunk_to, self.extract(chunk_query)
+
+    def stats_dict(self) -> dict[str, int]:
+        return {}
@@ -0,0 +1,158 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections.abc import Callable
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any
+
+import pandas as pd
+
+from mlops.aws import download_file_from_s3, get_s3_uploader, upload_file_to_s3
+from mlops.const import GLUE_DATABASE
+
+from .from_athena import extract_dataframe_from_athena
+
+logger = logging.getLogger(__name__)
+
+ATHENA_CACHE_DIR = Path(tempfile.gettempdir()) / "mlops_athena_cache"
+
+
+@dataclass
+class AthenaCacheStats:
+    hit_count: int = 0
+    s3_hit_count: int = 0
+    miss_count: int = 0
+    expired_count: int = 0
+    evicted_count: int = 0
+
+
+class AthenaCache:
+    # Caches query results as compressed Parquet files named by the hash of the query, so that reruns and parallel
+    # pipelines with the same query do not run it on Athena again. The freshness token, such as the latest partition
+    # of the table, is a part of the key and invalidates results of data which has been updated since. Results older
+    # than max_age are not reused whatever the token, since tables without a time filter such as mst_item change
+    # under the same query.
+    def __init__(
+        self,
+        cache_dir: Path = ATHENA_CACHE_DIR,
+        max_size_bytes: int = 10 * 1024**3,
+        max_age: timedelta = timedelta(days=1),
+        s3_bucket: str | None = None,
+        key_prefix: str = "athena_cache",
+        enabled: bool = False,
+    ) -> None:
+        self.cache_dir = cache_dir
+        self.max_size_bytes = max_size_bytes
+        self.max_age = max_age
+        # Results are shared through S3 by pipelines running on different hosts
+        self.s3_bucket = s3_bucket
+        self.key_prefix = key_prefix
+        self.enabled = enabled
+        self.stats = AthenaCacheStats()
+        # Queries are extracted in parallel threads sharing the cache
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_key(sql: str, database: str, freshness_token: str = "", **kwargs: Any) -> str:
+        key = {"sql": sql, "database": database, "freshness_token": freshness_token} | kwargs
+        return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+    def file_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.parquet"
+
+    def s3_key(self, key: str) -> str:
+        return f"{self.key_prefix}/{key}.parquet"
+
+    def is_expired(self, created_at: datetime) -> bool:
+        return datetime.now(created_at.tzinfo) - created_at > self.max_age
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            setattr(self.stats, name, getattr(self.stats, name) + 1)
+
+    def get(self, key: str) -> pd.DataFrame | None:
+        file_path = self.file_path(key)
+        if file_path.exists():
+            # The modified time is the time the result was created, and the access time is the last access time for
+            # the eviction. Accesses do not extend the age of the result.
+            stat = file_path.stat()
+            if not self.is_expired(datetime.fromtimestamp(stat.st_mtime)):
+                os.utime(file_path, (datetime.now().timestamp(), stat.st_mtime))
+                self._count("hit_count")
+                return pd.read_parquet(file_path)
+            self._count("expired_count")
+            logger.info(f"Athena cache is expired. {key=}, {self.max_age=}")
+            file_path.unlink(missing_ok=True)
+
+        if self.s3_bucket:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            try:
+                created_at = get_s3_uploader().client.head_object(Bucket=self.s3_bucket, Key=self.s3_key(key))["LastModified"]
+                if self.is_expired(created_at):
+                    self._count("expired_count")
+                    logger.info(f"Athena cache in S3 is expired. {key=}, {created_at=}, {self.max_age=}")
+                    return None
+                download_file_from_s3(s3_bucket=self.s3_bucket, s3_key=self.s3_key(key), file_path=str(file_path))
+            except Exception as e:
+                logger.info(f"Athena cache is not found in S3. {key=}, Error: {e}")
+            else:
+                # The local copy expires at the same time as the result in S3
+                os.utime(file_path, (datetime.now().timestamp(), created_at.timestamp()))
+                self._count("s3_hit_count")
+                return pd.read_parquet(file_path)
+        return None
+
+    def put(self, key: str, df: pd.DataFrame) -> None:
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        file_path = self.file_path(key)
+        # Written to a temporary file first, so that concurrent readers do not see a partial file
+        tmp_file_path = file_path.with_suffix(f".{os.getpid()}.tmp")
+        df.to_parquet(tmp_file_path, compression="zstd")
+        tmp_file_path.rename(file_path)
+        if self.s3_bucket:
+            upload_file_to_s3(s3_bucket=self.s3_bucket, file_path=file_path, s3_key=self.s3_key(key))
+        self.evict()
+
+    def evict(self) -> None:
+        # Least recently used files are removed until the cache fits in max_size_bytes
+        with self._lock:
+            file_paths = sorted(self.cache_dir.glob("*.parquet"), key=lambda file_path: file_path.stat().st_atime)
+            size_bytes = sum(file_path.stat().st_size for file_path in file_paths)
+            for file_path in file_paths:
+                if size_bytes <= self.max_size_bytes:
+                    break
+                size_bytes -= file_path.stat().st_size
+                file_path.unlink(missing_ok=True)
+                self.stats.evicted_count += 1
+                logger.info(f"Evicted Athena cache. {file_path=}, {size_bytes=}")
+
+    def extract(
+        self,
+        sql: str,
+        database: str = GLUE_DATABASE,
+        freshness_token: str = "",
+        loader: Callable[..., pd.DataFrame] = extract_dataframe_from_athena,
+        **kwargs: Any,
+    ) -> pd.DataFrame:
+        if not self.enabled:
+            return loader(sql=sql, database=database, **kwargs)
+
+        key = self.get_key(sql, database, freshness_token, **kwargs)
+        df = self.get(key)
+        if df is not None:
+            logger.info(f"Athena cache hit. {key=}, {sql=}, {len(df)=}")
+            return df
+
+        self._count("miss_count")
+        logger.info(f"Athena cache miss. {key=}, {sql=}")
+        df = loader(sql=sql, database=database, **kwargs)
+        self.put(key, df)
+        return df
+
+    def stats_dict(self) -> dict[str, int]:
+        return asdict(self.stats)
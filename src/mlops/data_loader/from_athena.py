@@ -1,5 +1,8 @@
 import logging
-from datetime import datetime
+import uuid
+from collections.abc import Iterator
+from datetime import datetime, timedelta
+from typing import Literal
 
 import awswrangler as wr
 import pandas as pd
@@ -8,6 +11,7 @@ from mlops.const import GLUE_DATABASE
 
 logger = logging.getLogger(__name__)
 DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+PARTITION_DATE_FORMAT = "%Y-%m-%d"
 
 
 def compose_sql(
@@ -15,14 +19,24 @@ def compose_sql(
     from_datetime: datetime | None = None,
     to_datetime: datetime | None = None,
     additional_where_clause: str | None = None,
+    columns: list[str] | None = None,
+    partition_column: str | None = None,
+    include_from_datetime: bool = True,
 ) -> str:
-    logger.info(f"Start compose sql. {table=}, {from_datetime=}, {to_datetime=}.")
-    sql = f"SELECT * FROM {table}"
+    logger.info(f"Start compose sql. {table=}, {from_datetime=}, {to_datetime=}, {columns=}, {partition_column=}.")
+    # Only the columns used are scanned and transferred
+    sql = f"SELECT {', '.join(columns) if columns else '*'} FROM {table}"
 
     # データ取得の開始時刻と終了時刻からwhere句を作成
     where_clause = []
+    # The date partition of the logged_at range, so that Athena only scans the partitions in the range
+    if partition_column and from_datetime is not None:
+        where_clause += [f"{partition_column} >= '{from_datetime.strftime(PARTITION_DATE_FORMAT)}'"]
+    if partition_column and to_datetime is not None:
+        where_clause += [f"{partition_column} <= '{to_datetime.strftime(PARTITION_DATE_FORMAT)}'"]
     if from_datetime is not None:
-        where_clause += [f"logged_at >= '{from_datetime.strftime(DATETIME_FORMAT)}'"]
+        operator = ">=" if include_from_datetime else ">"
+        where_clause += [f"logged_at {operator} '{from_datetime.strftime(DATETIME_FORMAT)}'"]
     if to_datetime is not None:
         where_clause += [f"logged_at <= '{to_datetime.strftime(DATETIME_FORMAT)}'"]
     # 指定したwhere句を追加
@@ -36,11 +50,68 @@ def compose_sql(
     return sql
 
 
-def extract_dataframe_from_athena(sql: str, database: str = GLUE_DATABASE) -> pd.DataFrame:
-    logger.info(f"Start extracting data from Athena. {sql=}, {database=}.")
-    df = wr.athena.read_sql_query(sql, database=database, ctas_approach=False, workgroup="mlops")
+def extract_dataframe_from_athena(
+    sql: str,
+    database: str = GLUE_DATABASE,
+    dtype_backend: Literal["numpy_nullable", "pyarrow"] = "numpy_nullable",
+) -> pd.DataFrame:
+    logger.info(f"Start extracting data from Athena. {sql=}, {database=}, {dtype_backend=}.")
+    df = wr.athena.read_sql_query(sql, database=database, ctas_approach=False, workgroup="mlops", dtype_backend=dtype_backend)
     assert len(df) != 0
 
     logger.info(f"Finish extracting data from Athena. {len(df)=}.")
 
     return df
+
+
+def get_chunk_intervals(
+    from_datetime: datetime, to_datetime: datetime, chunk_interval: timedelta
+) -> list[tuple[datetime, datetime]]:
+    # Intervals (chunk_from, chunk_to] ending at to_datetime, so that chunks of tables read from different
+    # from_datetime have the same boundaries.
+    intervals = []
+    chunk_to = to_datetime
+    while chunk_to > from_datetime:
+        intervals.append((max(chunk_to - chunk_interval, from_datetime), chunk_to))
+        chunk_to -= chunk_interval
+    return intervals[::-1]
+
+
+def extract_dataframe_chunks_from_athena(
+    table: str,
+    from_datetime: datetime,
+    to_datetime: datetime,
+    chunk_interval: timedelta = timedelta(days=1),
+    database: str = GLUE_DATABASE,
+    s3_output: str | None = None,
+    dtype_backend: Literal["numpy_nullable", "pyarrow"] = "numpy_nullable",
+    include_from_datetime: bool = True,
+    columns: list[str] | None = None,
+    partition_column: str | None = None,
+) -> Iterator[tuple[datetime, pd.DataFrame]]:
+    # Yields (chunk_to, rows of the table in the chunk) in order of logged_at with one query per chunk, so that only one
+    # chunk is in memory. With s3_output, results are unloaded to Parquet in S3 instead of the CSV of the query result.
+    # Rows at from_datetime are in the first chunk as in compose_sql, unless include_from_datetime is False.
+    intervals = get_chunk_intervals(from_datetime, to_datetime, chunk_interval)
+    logger.info(f"Start extracting data chunks from Athena. {table=}, {len(intervals)=}, {s3_output=}")
+    for i, (chunk_from, chunk_to) in enumerate(intervals):
+        sql = compose_sql(
+            table=table,
+            from_datetime=chunk_from,
+            to_datetime=chunk_to,
+            columns=columns,
+            partition_column=partition_column,
+            include_from_datetime=include_from_datetime and i == 0,
+        )
+        df = wr.athena.read_sql_query(
+            sql,
+            database=database,
+            ctas_approach=False,
+            unload_approach=s3_output is not None,
+            # UNLOAD fails unless the output path is empty
+            s3_output=f"{s3_output.rstrip('/')}/{uuid.uuid4().hex}/" if s3_output else None,
+            workgroup="mlops",
+            dtype_backend=dtype_backend,
+        )
+        logger.info(f"Extracted data chunk from Athena. {table=}, {chunk_from=}, {chunk_to=}, {len(df)=}")
+        yield chunk_to, df
@@ -0,0 +1,44 @@
+import logging
+import time
+from collections.abc import Callable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+def extract_dataframes_in_parallel(
+    extractors: dict[str, Callable[[], pd.DataFrame]],
+    max_workers: int = 3,
+) -> Iterator[tuple[str, pd.DataFrame]]:
+    # Runs independent queries at the same time and yields (name, df) in order of completion, so that callers can
+    # validate a table while the others are still running. max_workers bounds the concurrent queries on Athena.
+    logger.info(f"Start extracting data in parallel. {list(extractors)=}, {max_workers=}")
+    start_time = time.perf_counter()
+    elapsed_seconds = {}
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="extract")
+    try:
+        futures: dict[Future[tuple[pd.DataFrame, float]], str] = {
+            executor.submit(_extract_with_time, extractor): name for name, extractor in extractors.items()
+        }
+        for future in as_completed(futures):
+            name = futures[future]
+            df, elapsed_seconds[name] = future.result()
+            logger.info(f"Extracted data. {name=}, {elapsed_seconds[name]=:.2f}, {len(df)=}")
+            yield name, df
+    finally:
+        # Queries not started yet are cancelled when a query or the caller fails
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    wall_clock_seconds = time.perf_counter() - start_time
+    logger.info(
+        f"Finished extracting data in parallel. {wall_clock_seconds=:.2f}, {sum(elapsed_seconds.values())=:.2f}, "
+        f"{elapsed_seconds=}"
+    )
+
+
+def _extract_with_time(extractor: Callable[[], pd.DataFrame]) -> tuple[pd.DataFrame, float]:
+    start_time = time.perf_counter()
+    df = extractor()
+    return df, time.perf_counter() - start_time
@@ -0,0 +1,141 @@
+import logging
+from collections.abc import Iterator
+from dataclasses import asdict, dataclass
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from .parquet_loader import ParquetLoader
+
+logger = logging.getLogger(__name__)
+
+OS_VERSIONS = np.array(["old", "latest", "intermediate"])
+DEVICE_TYPES = np.array(["android", "iphone", "web"])
+# Independent random streams of the seed, so that the rows of a table do not depend on how the others are generated
+RANDOM_STREAMS = {"users": 0, "mst_item": 1, "impression_log": 2, "view_log": 3}
+
+
+@dataclass(frozen=True)
+class SyntheticDataConfig:
+    # Logs of impression_log and view_log in [from_datetime, from_datetime + days), with users and items drawn from
+    # Zipf distributions, in which the k-th most active user has a weight of 1 / k ** zipf_exponent
+    n_users: int = 100_000
+    n_items: int = 10_000
+    n_impressions: int = 1_000_000
+    views_per_impression: float = 2.0
+    click_rate: float = 0.05
+    zipf_exponent: float = 1.1
+    from_datetime: datetime = datetime(2018, 11, 15)
+    days: int = 28
+    chunk_rows: int = 1_000_000
+    seed: int = 0
+
+    @property
+    def n_views(self) -> int:
+        return round(self.n_impressions * self.views_per_impression)
+
+
+def get_zipf_probabilities(n: int, exponent: float, rng: np.random.Generator) -> np.ndarray:
+    # Probabilities of ids 0..n-1, with the ranks shuffled so that the most active ids are spread over the id range
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    return rng.permutation(weights / weights.sum())
+
+
+def get_chunk_bounds(n_rows: int, chunk_rows: int) -> list[tuple[int, int]]:
+    n_chunks = max(1, -(-n_rows // chunk_rows))
+    bounds = np.linspace(0, n_rows, n_chunks + 1).round().astype(int)
+    return [(int(start), int(stop)) for start, stop in zip(bounds[:-1], bounds[1:], strict=True)]
+
+
+def _get_logged_at(
+    config: SyntheticDataConfig, rng: np.random.Generator, n_rows: int, start: int, stop: int
+) -> pd.DatetimeIndex:
+    # Rows start..stop of n_rows fall in the same share of the time span, so chunks are consecutive in time
+    span_seconds = config.days * 86400
+    chunk_from, chunk_to = span_seconds * start // n_rows, span_seconds * stop // n_rows
+    seconds = np.sort(rng.integers(chunk_from, max(chunk_from + 1, chunk_to), stop - start))
+    return pd.Timestamp(config.from_datetime) + pd.to_timedelta(seconds, unit="s")
+
+
+def get_user_probabilities(config: SyntheticDataConfig) -> np.ndarray:
+    # Same activity of the users in both logs, so that the active users also have long view histories
+    rng = np.random.default_rng([config.seed, RANDOM_STREAMS["users"]])
+    return get_zipf_probabilities(config.n_users, config.zipf_exponent, rng)
+
+
+def generate_mst_item(config: SyntheticDataConfig) -> pd.DataFrame:
+    rng = np.random.default_rng([config.seed, RANDOM_STREAMS["mst_item"]])
+    n_items = config.n_items
+    return pd.DataFrame(
+        {
+            "item_id": pd.array(np.arange(n_items), dtype="Int64"),
+            "item_price": pd.array(rng.lognormal(mean=8.0, sigma=1.0, size=n_items).astype(int) + 1, dtype="Int64"),
+            "category_1": pd.array(rng.integers(0, 20, n_items), dtype="Int64"),
+            "category_2": pd.array(rng.integers(0, 80, n_items), dtype="Int64"),
+            "category_3": pd.array(rng.integers(0, 300, n_items), dtype="Int64"),
+            "product_type": pd.array(rng.integers(0, 10_000, n_items), dtype="Int64"),
+        }
+    )
+
+
+def iter_impression_log(config: SyntheticDataConfig) -> Iterator[pd.DataFrame]:
+    rng = np.random.default_rng([config.seed, RANDOM_STREAMS["impression_log"]])
+    user_probabilities = get_user_probabilities(config)
+    # Attributes of the users, which do not change over the span
+    user_app_code = rng.zipf(1.5, config.n_users).clip(max=500) - 1
+    user_os_version = rng.choice(OS_VERSIONS, config.n_users, p=[0.2, 0.5, 0.3])
+    user_is_4g = (rng.random(config.n_users) < 0.4).astype(int)
+
+    for i, (start, stop) in enumerate(get_chunk_bounds(config.n_impressions, config.chunk_rows)):
+        chunk_rng = np.random.default_rng([config.seed, RANDOM_STREAMS["impression_log"], i])
+        n_rows = stop - start
+        user_id = chunk_rng.choice(config.n_users, n_rows, p=user_probabilities)
+        # Unique ids with the length of the md5 hex ids of the real logs. Strings are kept in arrow, millions of
+        # python str objects per chunk fragment the heap, and the memory grows chunk by chunk.
+        impression_id = pc.utf8_lpad(pa.array(np.arange(start, stop)).cast(pa.string()), width=32, padding="0")
+        yield pd.DataFrame(
+            {
+                "impression_id": pd.array(impression_id, dtype=pd.StringDtype("pyarrow")),
+                "logged_at": _get_logged_at(config, chunk_rng, config.n_impressions, start, stop),
+                "user_id": user_id,
+                "app_code": user_app_code[user_id],
+                "os_version": user_os_version[user_id],
+                "is_4g": user_is_4g[user_id],
+                "is_click": (chunk_rng.random(n_rows) < config.click_rate).astype(int),
+            }
+        )
+
+
+def iter_view_log(config: SyntheticDataConfig) -> Iterator[pd.DataFrame]:
+    rng = np.random.default_rng([config.seed, RANDOM_STREAMS["view_log"]])
+    user_probabilities = get_user_probabilities(config)
+    item_probabilities = get_zipf_probabilities(config.n_items, config.zipf_exponent, rng)
+    user_device_type = rng.choice(DEVICE_TYPES, config.n_users, p=[0.6, 0.3, 0.1])
+
+    for i, (start, stop) in enumerate(get_chunk_bounds(config.n_views, config.chunk_rows)):
+        chunk_rng = np.random.default_rng([config.seed, RANDOM_STREAMS["view_log"], i])
+        n_rows = stop - start
+        user_id = chunk_rng.choice(config.n_users, n_rows, p=user_probabilities)
+        yield pd.DataFrame(
+            {
+                "logged_at": _get_logged_at(config, chunk_rng, config.n_views, start, stop),
+                "device_type": pd.array(user_device_type[user_id], dtype=pd.StringDtype("pyarrow")),
+                "session_id": pd.array(np.arange(start, stop), dtype="Int64"),
+                "user_id": pd.array(user_id, dtype="Int64"),
+                "item_id": pd.array(chunk_rng.choice(config.n_items, n_rows, p=item_probabilities), dtype="Int64"),
+            }
+        )
+
+
+def generate_synthetic_data(loader: ParquetLoader, config: SyntheticDataConfig, row_group_size: int = 100_000) -> None:
+    # Writes the tables chunk by chunk, so that the memory is bounded by chunk_rows whatever the number of rows.
+    # The data only depends on the config, so that benchmarks on the same config are comparable.
+    logger.info(f"Start generating synthetic data. {loader.root_dir=}, {asdict(config)=}")
+    loader.write("mst_item", generate_mst_item(config), row_group_size=row_group_size)
+    for table, chunks in [("impression_log", iter_impression_log(config)), ("view_log", iter_view_log(config))]:
+        for df in chunks:
+            loader.write(table, df, row_group_size=row_group_size)
+    logger.info(f"Finish generating synthetic data. {config.n_impressions=}, {config.n_views=}")
@@ -1,6 +1,7 @@
 from datetime import datetime
 
 import pandas as pd
+import pyarrow as pa
 from pandera import Check, Column, DataFrameSchema, Index
 
 IMPRESSION_LOG_SCHEMA = DataFrameSchema(
@@ -47,3 +48,17 @@ MST_ITEM_SCHEMA = DataFrameSchema(
     strict=True,
     coerce=True,
 )
+
+# Arrow types of the column dtypes above, which keep strings and nullable integers columnar
+ARROW_DTYPES = {
+    "str": pd.ArrowDtype(pa.string()),
+    "string[python]": pd.ArrowDtype(pa.string()),
+    "int64": pd.ArrowDtype(pa.int64()),
+    "Int64": pd.ArrowDtype(pa.int64()),
+    "datetime64[ns]": pd.ArrowDtype(pa.timestamp("ns")),
+}
+
+
+def to_arrow_schema(schema: DataFrameSchema) -> DataFrameSchema:
+    # Same checks as the schema, coercing the columns to arrow dtypes instead of object and numpy dtypes
+    return schema.update_columns({name: {"dtype": ARROW_DTYPES[str(column.dtype)]} for name, column in schema.columns.items()})
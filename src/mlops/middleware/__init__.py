@@ -1,2 +1,3 @@
+from .dataframe_writer import FILE_FORMATS, DataFrameWriter, FileFormat, save_dataframe
 from .logging import set_logger_config
 from .path import Artifact
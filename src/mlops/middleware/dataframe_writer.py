@@ -0,0 +1,83 @@
+import logging
+from pathlib import Path
+from types import TracebackType
+from typing import Literal, Self
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+FileFormat = Literal["parquet", "csv"]
+FILE_FORMATS: list[FileFormat] = ["parquet", "csv"]
+# Row groups of about 100MB for a dozen columns, which Athena splits its scans by
+DEFAULT_ROW_GROUP_SIZE = 1_000_000
+
+
+class DataFrameWriter:
+    # Writes data frames to one file chunk by chunk. Parquet keeps the dtypes including categories, and is compressed
+    # with zstd. Timestamps are written in milliseconds, Athena does not read nanoseconds.
+    def __init__(
+        self, file_path: Path, file_format: FileFormat = "parquet", row_group_size: int = DEFAULT_ROW_GROUP_SIZE
+    ) -> None:
+        self.file_path = file_path
+        self.file_format = file_format
+        self.row_group_size = row_group_size
+        self.n_rows = 0
+        self.n_chunks = 0
+        self._parquet_writer: pq.ParquetWriter | None = None
+        self._empty_table: pa.Table | None = None
+
+    def write(self, df: pd.DataFrame) -> None:
+        if self.file_format == "csv":
+            df.to_csv(self.file_path, index=False, mode="w" if self.n_chunks == 0 else "a", header=self.n_chunks == 0)
+        else:
+            # Pandas columns are converted to arrow with multiple threads
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self._parquet_writer is None and len(table) == 0:
+                # Object columns of an empty chunk have the null type, the schema is taken from the first rows instead
+                if self._empty_table is None:
+                    self._empty_table = table
+            else:
+                self._write_parquet(table)
+        self.n_rows += len(df)
+        self.n_chunks += 1
+
+    def _write_parquet(self, table: pa.Table) -> None:
+        if self._parquet_writer is None:
+            self._parquet_writer = pq.ParquetWriter(
+                self.file_path,
+                table.schema,
+                compression="zstd",
+                coerce_timestamps="ms",
+                allow_truncated_timestamps=True,
+            )
+        else:
+            # Types of chunks may differ, e.g. a nullable column which is all null in a chunk
+            table = table.cast(self._parquet_writer.schema)
+        self._parquet_writer.write_table(table, row_group_size=self.row_group_size)
+
+    def close(self) -> None:
+        if self._parquet_writer is None and self._empty_table is not None:
+            # The file is written even if all chunks are empty
+            self._write_parquet(self._empty_table)
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+            self._parquet_writer = None
+        logger.info(f"Wrote data frame. {self.file_path=}, {self.n_rows=}, {self.n_chunks=}")
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(
+        self, exc_type: type[BaseException] | None, exc_value: BaseException | None, traceback: TracebackType | None
+    ) -> None:
+        self.close()
+
+
+def save_dataframe(
+    df: pd.DataFrame, file_path: Path, file_format: FileFormat = "parquet", row_group_size: int = DEFAULT_ROW_GROUP_SIZE
+) -> None:
+    with DataFrameWriter(file_path, file_format=file_format, row_group_size=row_group_size) as writer:
+        writer.write(df)
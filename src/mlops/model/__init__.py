@@ -1,12 +1,17 @@
+from .feature_state import FeatureState
 from .metadata import MetaDeta
 from .model_config import ModelConfig, get_model_config
 from .models.lightgbm import LightGBMModel
 from .models.sgd_classifier import SGDClassifierModel
 from .preprocess import (
     add_impression_time_feature,
+    apply_date_split,
     apply_preprocess,
     apply_schema,
     apply_train_test_split,
     get_impression_feature,
+    get_incremental_impression_feature,
+    get_source_columns,
+    iter_impression_feature,
 )
 from .schema import Schema
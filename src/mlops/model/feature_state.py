@@ -0,0 +1,92 @@
+import json
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+IMPRESSION_STATE_COLUMNS = ["impression_id", "user_id", "logged_at"]
+VIEW_STATE_COLUMNS = ["user_id", "logged_at", "item_id", "device_type"]
+
+
+@dataclass
+class FeatureState:
+    # Impressions and deduplicated views in the lookback window before to_datetime. History features of impressions
+    # after to_datetime only depend on them, so that an incremental run does not read older logs.
+    to_datetime: datetime
+    lookback_days: int
+    df_impression_log: pd.DataFrame
+    df_view_log: pd.DataFrame
+
+    @classmethod
+    def from_logs(
+        cls,
+        df_impression_log: pd.DataFrame,
+        df_view_log: pd.DataFrame,
+        to_datetime: datetime,
+        lookback_days: int = 7,
+    ) -> "FeatureState":
+        feature_state = cls(
+            to_datetime=datetime.min,
+            lookback_days=lookback_days,
+            df_impression_log=df_impression_log[IMPRESSION_STATE_COLUMNS].iloc[:0],
+            df_view_log=df_view_log[VIEW_STATE_COLUMNS].iloc[:0],
+        )
+        return feature_state.update(df_impression_log, df_view_log, to_datetime=to_datetime)
+
+    @property
+    def window_start(self) -> datetime:
+        # Logs at or before this time are out of the lookback window of every impression after to_datetime
+        return self.to_datetime - timedelta(days=self.lookback_days + 1)
+
+    def update(
+        self,
+        df_impression_log: pd.DataFrame,
+        df_view_log: pd.DataFrame,
+        to_datetime: datetime,
+    ) -> "FeatureState":
+        logger.info(f"Start update feature state. {self.to_datetime=}, {to_datetime=}, {len(df_impression_log)=}")
+        df_impression_log = pd.concat([self.df_impression_log, df_impression_log[IMPRESSION_STATE_COLUMNS]], ignore_index=True)
+        # Same deduplication as the view history feature
+        df_view_log = pd.concat([self.df_view_log, df_view_log[VIEW_STATE_COLUMNS]], ignore_index=True)
+        df_view_log = df_view_log.drop_duplicates(subset=["user_id", "logged_at"], keep="last")
+
+        feature_state = FeatureState(
+            to_datetime=to_datetime,
+            lookback_days=self.lookback_days,
+            df_impression_log=df_impression_log,
+            df_view_log=df_view_log,
+        )
+        window_start = pd.Timestamp(feature_state.window_start)
+        feature_state.df_impression_log = df_impression_log[df_impression_log["logged_at"] > window_start].reset_index(
+            drop=True
+        )
+        feature_state.df_view_log = df_view_log[df_view_log["logged_at"] > window_start].reset_index(drop=True)
+
+        logger.info(
+            f"Finished update feature state. {len(feature_state.df_impression_log)=}, {len(feature_state.df_view_log)=}"
+        )
+        return feature_state
+
+    def save(self, dir_path: Path) -> None:
+        logger.info(f"Save feature state at {dir_path}.")
+        dir_path.mkdir(parents=True, exist_ok=True)
+        with open(dir_path / "metadata.json", "w") as f:
+            json.dump({"to_datetime": self.to_datetime.isoformat(), "lookback_days": self.lookback_days}, f)
+        self.df_impression_log.to_parquet(dir_path / "impression_log.parquet", index=False)
+        self.df_view_log.to_parquet(dir_path / "view_log.parquet", index=False)
+
+    @classmethod
+    def load(cls, dir_path: Path) -> "FeatureState":
+        logger.info(f"Load feature state from {dir_path}.")
+        with open(dir_path / "metadata.json") as f:
+            metadata = json.load(f)
+        return cls(
+            to_datetime=datetime.fromisoformat(metadata["to_datetime"]),
+            lookback_days=metadata["lookback_days"],
+            df_impression_log=pd.read_parquet(dir_path / "impression_log.parquet"),
+            df_view_log=pd.read_parquet(dir_path / "view_log.parquet"),
+        )
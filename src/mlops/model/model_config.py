@@ -8,6 +8,10 @@ from .schema import Schema
 
 logger = logging.getLogger(__name__)
 
+# Values allowed by the data validator and the null value of the schema
+OS_VERSIONS = ["intermediate", "latest", "old", "null"]
+DEVICE_TYPES = ["android", "iphone", "web", "null"]
+
 
 @dataclass
 class ModelConfig:
@@ -18,6 +22,7 @@ class ModelConfig:
     train_interval_days: int
     lookback_days: int
     test_valid_ratio: dict[str, float]
+    split_interval_days: dict[str, int]
 
     @property
     def feature_columns(self) -> list[str]:
@@ -31,44 +36,45 @@ model_configs = [
             is_optuna=True, args=dict(max_iter=1000, loss="log_loss", penalty="l2", random_state=42)
         ),
         schemas=[
-            Schema(name="impression_hour", dtype="int", null_value=-1),
-            Schema(name="impression_day", dtype="int", null_value=-1),
-            Schema(name="impression_weekday", dtype="int", null_value=-1),
-            Schema(name="user_id", dtype="int", null_value=-1),
-            Schema(name="app_code", dtype="int", null_value=-1),
-            Schema(name="os_version", dtype="str", null_value="null"),
-            Schema(name="is_4g", dtype="int", null_value=-1),
-            Schema(name="previous_impression_count", dtype="int", null_value=-1),
-            Schema(name="previous_view_count", dtype="int", null_value=-1),
-            Schema(name="item_id", dtype="int", null_value=-1),
-            Schema(name="device_type", dtype="str", null_value="null"),
-            Schema(name="item_price", dtype="int", null_value=-1),
-            Schema(name="category_1", dtype="int", null_value=-1),
-            Schema(name="category_2", dtype="int", null_value=-1),
-            Schema(name="category_3", dtype="int", null_value=-1),
-            Schema(name="product_type", dtype="int", null_value=-1),
+            Schema(name="impression_hour", dtype="int8", null_value=-1),
+            Schema(name="impression_day", dtype="int8", null_value=-1),
+            Schema(name="impression_weekday", dtype="int8", null_value=-1),
+            Schema(name="user_id", dtype="int32", null_value=-1),
+            Schema(name="app_code", dtype="int16", null_value=-1),
+            Schema(name="os_version", dtype="category", null_value="null", categories=OS_VERSIONS),
+            Schema(name="is_4g", dtype="int8", null_value=-1),
+            Schema(name="previous_impression_count", dtype="int32", null_value=-1),
+            Schema(name="previous_view_count", dtype="int32", null_value=-1),
+            Schema(name="item_id", dtype="int32", null_value=-1),
+            Schema(name="device_type", dtype="category", null_value="null", categories=DEVICE_TYPES),
+            Schema(name="item_price", dtype="int32", null_value=-1),
+            Schema(name="category_1", dtype="int16", null_value=-1),
+            Schema(name="category_2", dtype="int16", null_value=-1),
+            Schema(name="category_3", dtype="int16", null_value=-1),
+            Schema(name="product_type", dtype="int32", null_value=-1),
         ],
         target="is_click",
         train_interval_days=28,
         lookback_days=7,
         test_valid_ratio={"test_size": 0.2, "valid_size": 0.1},
+        split_interval_days={"valid_interval_days": 2, "test_interval_days": 5},
     ),
     ModelConfig(
         name="lightgbm_ctr",
         model_class=LightGBMModel(args=dict(num_leaves=31, objective="binary")),
         schemas=[
-            Schema(name="impression_hour", dtype="int", null_value=-1),
-            Schema(name="impression_day", dtype="int", null_value=-1),
-            Schema(name="impression_weekday", dtype="int", null_value=-1),
+            Schema(name="impression_hour", dtype="int8", null_value=-1),
+            Schema(name="impression_day", dtype="int8", null_value=-1),
+            Schema(name="impression_weekday", dtype="int8", null_value=-1),
             Schema(name="user_id", dtype="category", null_value=-1),
             Schema(name="app_code", dtype="category", null_value=-1),
-            Schema(name="os_version", dtype="category", null_value="null"),
-            Schema(name="is_4g", dtype="int", null_value=-1),
-            Schema(name="previous_impression_count", dtype="int", null_value=-1),
-            Schema(name="previous_view_count", dtype="int", null_value=-1),
+            Schema(name="os_version", dtype="category", null_value="null", categories=OS_VERSIONS),
+            Schema(name="is_4g", dtype="int8", null_value=-1),
+            Schema(name="previous_impression_count", dtype="int32", null_value=-1),
+            Schema(name="previous_view_count", dtype="int32", null_value=-1),
             Schema(name="item_id", dtype="category", null_value=-1),
-            Schema(name="device_type", dtype="category", null_value="null"),
-            Schema(name="item_price", dtype="int", null_value=-1),
+            Schema(name="device_type", dtype="category", null_value="null", categories=DEVICE_TYPES),
+            Schema(name="item_price", dtype="int32", null_value=-1),
             Schema(name="category_1", dtype="category", null_value=-1),
             Schema(name="category_2", dtype="category", null_value=-1),
             Schema(name="category_3", dtype="category", null_value=-1),
@@ -78,6 +84,7 @@ model_configs = [
         train_interval_days=28,
         lookback_days=7,
         test_valid_ratio={"test_size": 0.2, "valid_size": 0.1},
+        split_interval_days={"valid_interval_days": 2, "test_interval_days": 5},
     ),
 ]
 
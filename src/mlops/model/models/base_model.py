@@ -22,6 +22,11 @@ class BaseModel(ABC):
     def predict_proba(self, X: PdNpType) -> npt.NDArray:
         raise NotImplementedError
 
+    def predict_proba_online(self, X: PdNpType) -> npt.NDArray:
+        # Prediction path used by the predictor. Models may override it with a faster implementation
+        # which returns the same result as predict_proba.
+        return self.predict_proba(X)
+
     @abstractmethod
     def save(self, file_path: Path) -> None:
         raise NotImplementedError
@@ -1,19 +1,28 @@
+import fcntl
+import hashlib
+import importlib.metadata
 import logging
+import os
+import platform
 import tempfile
 from pathlib import Path
+from typing import Any
 
 import lightgbm as lgb
 import numpy as np
 import numpy.typing as npt
 import pandas as pd
 
-from mlops.aws import download_file_from_s3
+from mlops.aws import download_file_from_s3, get_s3_uploader, upload_file_to_s3
 from mlops.const import MODEL_S3_BUCKET
 
 from .base_model import BaseModel, PdNpType
 
 logger = logging.getLogger(__name__)
 
+# Local copies of the compiled libraries of models, which are loaded from here
+MODEL_CACHE_DIR = Path(tempfile.gettempdir()) / "mlops_model_cache"
+
 
 class LightGBMModel(BaseModel):
     def __init__(
@@ -27,6 +36,8 @@ class LightGBMModel(BaseModel):
             args = {}
         self.args = args | {"objective": "binary"}
         self.num_round = num_round
+        # tl2cgen.Predictor of the model compiled to a shared library, None when predicting with the Booster
+        self.compiled_model: Any | None = None
 
     def train(
         self,
@@ -49,13 +60,78 @@ class LightGBMModel(BaseModel):
         )
         model = lgb.train(self.args, train_data, self.num_round, valid_sets=[valid_data])
         self.model = model
+        self.compiled_model = None
 
     def predict_proba(self, X: PdNpType) -> npt.NDArray:
         if self.model is None:
             raise ValueError("Model is not instantiated.")
+        if self.compiled_model is not None:
+            try:
+                return self._predict_proba_compiled(self.compiled_model, X)
+            except Exception as e:
+                logger.info(f"Failed to predict with compiled model. Fall back to booster. Error: {e}")
+                self.compiled_model = None
         y_pred = np.asarray(self.model.predict(X))
         return y_pred
 
+    def _predict_proba_compiled(self, compiled_model: Any, X: PdNpType) -> npt.NDArray:
+        import tl2cgen
+
+        dmatrix = tl2cgen.DMatrix(self._to_numeric(X), dtype="float64")
+        return np.asarray(compiled_model.predict(dmatrix)).reshape(-1)
+
+    def _to_numeric(self, X: PdNpType) -> npt.NDArray:
+        if not isinstance(X, pd.DataFrame):
+            return np.asarray(X, dtype=np.float64)
+
+        # Same encoding of category columns as Booster.predict on a DataFrame
+        X = X.copy()
+        category_columns = [column for column in X.columns if isinstance(X[column].dtype, pd.CategoricalDtype)]
+        pandas_categorical = self.model.pandas_categorical if self.model is not None else None
+        if pandas_categorical is None or len(category_columns) != len(pandas_categorical):
+            raise ValueError("Category columns do not match the model.")
+        for column, categories in zip(category_columns, pandas_categorical, strict=True):
+            codes = X[column].cat.set_categories(categories).cat.codes
+            X[column] = codes.where(codes >= 0, np.nan)
+        return X.to_numpy(dtype=np.float64)
+
+    def compile(self, lib_path: Path) -> bool:
+        # Compile the booster to a shared library with the system C compiler, and reuse it if it is already compiled.
+        # Predictions fall back to the Booster when the model can not be compiled or loaded.
+        if self.model is None:
+            raise ValueError("Model is not instantiated.")
+        try:
+            import tl2cgen
+
+            if not lib_path.exists():
+                lib_path.parent.mkdir(parents=True, exist_ok=True)
+                # Workers loading the same model at the same time compile it once, the others wait for the lock
+                with open(lib_path.with_name(f"{lib_path.name}.lock"), "w") as lock_file:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                    if not lib_path.exists():
+                        self._export_lib(lib_path)
+            self.compiled_model = tl2cgen.Predictor(lib_path, nthread=1)
+        except Exception as e:
+            logger.info(f"Failed to compile model. Predict with booster. Error: {e}")
+            self.compiled_model = None
+            return False
+        return True
+
+    def _export_lib(self, lib_path: Path) -> None:
+        import tl2cgen
+        import treelite
+
+        logger.info(f"Compile model to {lib_path}.")
+        # A temporary file of the process, which is renamed atomically so that a partial library is never loaded
+        fd, tmp_lib_path = tempfile.mkstemp(dir=lib_path.parent, prefix=f".{lib_path.stem}.", suffix=lib_path.suffix)
+        os.close(fd)
+        try:
+            treelite_model = treelite.frontend.from_lightgbm(self.model)
+            tl2cgen.export_lib(treelite_model, toolchain="gcc", libpath=tmp_lib_path, params={}, verbose=False)
+            os.replace(tmp_lib_path, lib_path)
+        finally:
+            Path(tmp_lib_path).unlink(missing_ok=True)
+
     def save(self, file_path: Path) -> None:
         logger.info(f"Save model file at {file_path}.")
         if self.model is None:
@@ -66,6 +142,8 @@ class LightGBMModel(BaseModel):
     def from_pretrained(
         cls,
         s3_key: str,
+        compile: bool = True,
+        cache_dir: Path = MODEL_CACHE_DIR,
     ) -> "LightGBMModel":
         logger.info(f"Loading model from s3://{MODEL_S3_BUCKET}/{s3_key}")
         with tempfile.NamedTemporaryFile() as temp_file:
@@ -75,4 +153,73 @@ class LightGBMModel(BaseModel):
                 file_path=temp_file.name,
             )
             model = lgb.Booster(model_file=temp_file.name)
-        return cls(model)
+            model_hash = hashlib.sha256(Path(temp_file.name).read_bytes()).hexdigest()
+
+        lightgbm_model = cls(model)
+        if compile:
+            # The compiled library is stored next to the model artifact, so that it is built once per model and
+            # platform, and it is cached locally by the hash of the model file and the platform
+            build_platform = get_build_platform()
+            lib_path = cache_dir / f"{model_hash}.{build_platform}.so"
+            lib_s3_key = get_compiled_lib_s3_key(s3_key=s3_key, model_hash=model_hash, build_platform=build_platform)
+            metadata = {"model-sha256": model_hash, "build-platform": build_platform}
+            if not lib_path.exists() and not _download_compiled_lib(
+                lib_s3_key=lib_s3_key, lib_path=lib_path, metadata=metadata
+            ):
+                logger.warning(f"Compiled library does not match the model. Predict with booster. {lib_s3_key=}")
+                return lightgbm_model
+            is_compiled_here = not lib_path.exists()
+            if lightgbm_model.compile(lib_path=lib_path) and is_compiled_here:
+                # Other hosts compile the model by themselves if the upload fails
+                lib_hash = hashlib.sha256(lib_path.read_bytes()).hexdigest()
+                summary = upload_file_to_s3(
+                    s3_bucket=MODEL_S3_BUCKET,
+                    file_path=lib_path,
+                    s3_key=lib_s3_key,
+                    extra_args={"Metadata": metadata | {"lib-sha256": lib_hash}},
+                )
+                logger.info(f"Uploaded compiled library. {lib_s3_key=}, {summary.stats_dict()=}")
+        return lightgbm_model
+
+
+def get_build_platform() -> str:
+    # Libraries are native code of the machine, the C library and the tl2cgen runtime they are compiled with
+    libc, libc_version = platform.libc_ver()
+    try:
+        tl2cgen_version = importlib.metadata.version("tl2cgen")
+    except importlib.metadata.PackageNotFoundError:
+        tl2cgen_version = "none"
+    return f"{platform.system().lower()}_{platform.machine()}_{libc}{libc_version}_tl2cgen{tl2cgen_version}"
+
+
+def get_compiled_lib_s3_key(s3_key: str, model_hash: str, build_platform: str) -> str:
+    return f"{s3_key}.{model_hash}.{build_platform}.so"
+
+
+def _download_compiled_lib(lib_s3_key: str, lib_path: Path, metadata: dict[str, str]) -> bool:
+    # Returns False when the library in S3 is not the one built from the model on this platform, which is never
+    # loaded. A missing library is compiled by the caller.
+    try:
+        s3_metadata = get_s3_uploader().client.head_object(Bucket=MODEL_S3_BUCKET, Key=lib_s3_key)["Metadata"]
+    except Exception as e:
+        logger.info(f"Compiled library is not found next to the model. Compile it. {lib_s3_key=}, Error: {e}")
+        return True
+    if any(s3_metadata.get(key) != value for key, value in metadata.items()):
+        logger.warning(f"Compiled library is built from another model or platform. {metadata=}, {s3_metadata=}")
+        return False
+
+    lib_path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_lib_path = tempfile.mkstemp(dir=lib_path.parent, prefix=f".{lib_path.stem}.", suffix=lib_path.suffix)
+    os.close(fd)
+    try:
+        download_file_from_s3(s3_bucket=MODEL_S3_BUCKET, s3_key=lib_s3_key, file_path=tmp_lib_path)
+        lib_hash = hashlib.sha256(Path(tmp_lib_path).read_bytes()).hexdigest()
+        if lib_hash != s3_metadata.get("lib-sha256"):
+            logger.warning(f"Compiled library is corrupted. {lib_s3_key=}, {lib_hash=}, {s3_metadata=}")
+            return False
+        os.replace(tmp_lib_path, lib_path)
+    except Exception as e:
+        logger.info(f"Failed to download compiled library. Compile it. {lib_s3_key=}, Error: {e}")
+    finally:
+        Path(tmp_lib_path).unlink(missing_ok=True)
+    return True
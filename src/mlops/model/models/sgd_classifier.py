@@ -1,15 +1,18 @@
 import logging
 import pickle
 import tempfile
+from functools import lru_cache
 from pathlib import Path
 
 import numpy as np
 import numpy.typing as npt
 import optuna
 import pandas as pd
+from scipy.special import expit
 from sklearn.feature_extraction import FeatureHasher
 from sklearn.linear_model import SGDClassifier
 from sklearn.metrics import log_loss
+from sklearn.utils import murmurhash3_32
 
 from mlops.aws import download_file_from_s3
 from mlops.const import MODEL_S3_BUCKET
@@ -29,6 +32,7 @@ class SGDClassifierModel(BaseModel):
         self.model = model
         self.is_optuna = is_optuna
         self.args = args if args else {}
+        self._scorer: HashedLinearScorer | None = None
 
     def train(
         self,
@@ -54,6 +58,13 @@ class SGDClassifierModel(BaseModel):
         y_pred = self.model.predict_proba(X_hashed)[:, 1]
         return y_pred
 
+    def predict_proba_online(self, X: PdNpType) -> npt.NDArray:
+        if self.model is None:
+            raise ValueError("Model is not instantiated.")
+        if self._scorer is None or self._scorer.model is not self.model:
+            self._scorer = HashedLinearScorer(self.model)
+        return self._scorer.predict_proba(X)
+
     def save(self, file_path: Path) -> None:
         logger.info(f"Save model file at {file_path}.")
         if self.model is None:
@@ -111,3 +122,77 @@ def hashing_feature(df: pd.DataFrame, hash_size: int = 2**18) -> npt.NDArray:
     feature_hasher = FeatureHasher(n_features=hash_size, input_type="string")
     hashed_feature = feature_hasher.fit_transform(np.asanyarray(df.astype(str)))
     return hashed_feature
+
+
+# Batches up to this size are scored row by row in HashedLinearScorer
+ROW_WISE_MAX_ROWS = 8
+
+
+class HashedLinearScorer:
+    # Same result as SGDClassifier.predict_proba(hashing_feature(X))[:, 1], computed as a sparse dot product per row
+    # without building a FeatureHasher and a scipy sparse matrix on every call.
+    def __init__(self, model: SGDClassifier, hash_size: int = 2**18, max_cached_features: int = 2**14) -> None:
+        if model.loss != "log_loss" or model.coef_.shape[0] != 1:
+            raise ValueError("Only binary SGDClassifier with log_loss is supported.")
+        self.model = model
+        self.hash_size = hash_size
+        self.max_cached_features = max_cached_features
+        self.coef = np.ascontiguousarray(model.coef_[0], dtype=np.float64)
+        self.intercept = float(model.intercept_[0])
+        # Hashes of recent feature values, most values of requests such as hours and categories repeat while ids do not
+        self._hash = lru_cache(maxsize=max_cached_features)(self._hash_feature)
+
+    def _hash_feature(self, feature: str) -> tuple[int, int]:
+        # Same index and sign as FeatureHasher(alternate_sign=True)
+        h = murmurhash3_32(feature, seed=0)
+        if h == -(2**31):
+            index = (2**31 - 1 - (self.hash_size - 1)) % self.hash_size
+        else:
+            index = abs(h) % self.hash_size
+        return index, 1 if h >= 0 else -1
+
+    def decision_function(self, X: PdNpType) -> npt.NDArray:
+        if isinstance(X, np.ndarray) and X.dtype == object:
+            features = [str(value) for value in X.ravel()]
+        else:
+            features = np.asanyarray(X.astype(str)).ravel().tolist()
+        n_rows = len(X)
+        if n_rows <= ROW_WISE_MAX_ROWS:
+            return self._decision_function_row_wise(features, n_rows)
+
+        hashed_features = np.array([self._hash(feature) for feature in features], dtype=np.int64).reshape(n_rows, -1, 2)
+        indices, values = hashed_features[:, :, 0], hashed_features[:, :, 1]
+
+        # Sort indices of each row and sum the duplicated ones into the first of them, like csr sum_duplicates
+        order = np.argsort(indices, axis=1, kind="stable")
+        indices = np.take_along_axis(indices, order, axis=1)
+        values = np.take_along_axis(values, order, axis=1)
+        for j in range(indices.shape[1] - 1, 0, -1):
+            is_duplicated = indices[:, j] == indices[:, j - 1]
+            values[:, j - 1] += np.where(is_duplicated, values[:, j], 0)
+            values[:, j] = np.where(is_duplicated, 0, values[:, j])
+
+        # Accumulate column by column, so that each row is summed in the same order as the scipy csr matrix product
+        scores = np.zeros(n_rows, dtype=np.float64)
+        for j in range(indices.shape[1]):
+            scores += values[:, j].astype(np.float64) * self.coef[indices[:, j]]
+        return scores + self.intercept
+
+    def _decision_function_row_wise(self, features: list[str], n_rows: int) -> npt.NDArray:
+        # Small batches are faster without numpy operations per column
+        n_features = len(features) // n_rows if n_rows else 0
+        scores = []
+        for i in range(n_rows):
+            values: dict[int, int] = {}
+            for feature in features[i * n_features : (i + 1) * n_features]:
+                index, sign = self._hash(feature)
+                values[index] = values.get(index, 0) + sign
+
+            score = 0.0
+            for index in sorted(values):
+                score += values[index] * self.coef[index]
+            scores.append(score + self.intercept)
+        return np.asarray(scores, dtype=np.float64)
+
+    def predict_proba(self, X: PdNpType) -> npt.NDArray:
+        return expit(self.decision_function(X))
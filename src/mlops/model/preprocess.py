@@ -1,24 +1,48 @@
 import logging
-
+import math
+from collections.abc import Iterable, Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from datetime import datetime, timedelta
+from typing import Any
+
+import numpy as np
+import numpy.typing as npt
 import pandas as pd
 from sklearn.model_selection import train_test_split
 
+from .feature_state import IMPRESSION_STATE_COLUMNS, VIEW_STATE_COLUMNS, FeatureState
 from .schema import Schema
 
 logger = logging.getLogger(__name__)
 
+DAY_NANOSECONDS = 24 * 60 * 60 * 10**9
+# Upper bound of impressions in a shard of the sharded preprocess, which bounds the memory of a worker
+SHARD_MAX_ROWS = 1_000_000
+
+
+def get_source_columns(table_columns: list[str], output_columns: list[str]) -> list[str]:
+    # Columns of a source table which the preprocess reads to compute output_columns: the keys of the history features
+    # and of the item join, and the output columns themselves
+    source_columns = set(IMPRESSION_STATE_COLUMNS + VIEW_STATE_COLUMNS + output_columns)
+    return [column for column in table_columns if column in source_columns]
+
 
 def apply_preprocess(
     df_impression_log: pd.DataFrame,
     df_view_log: pd.DataFrame,
     df_item: pd.DataFrame,
     lookback_days: int = 7,
+    workers: int = 1,
 ) -> pd.DataFrame:
-    logger.info(f"Start common preprocess {len(df_impression_log)=}, {len(df_view_log)=}, {len(df_item)=}, {lookback_days=}")
+    logger.info(
+        f"Start common preprocess {len(df_impression_log)=}, {len(df_view_log)=}, {len(df_item)=}, {lookback_days=}, "
+        f"{workers=}"
+    )
 
     df_impression_time_feature = _get_impression_time_feature(df_impression_log)
-    df_impression_history_feature = _get_impression_history_feature(df_impression_log, lookback_days=lookback_days)
-    df_view_history_feature = _get_view_history_feature(df_impression_log, df_view_log, lookback_days=lookback_days)
+    df_impression_history_feature, df_view_history_feature = _get_history_features(
+        df_impression_log, df_impression_log, df_view_log, lookback_days=lookback_days, workers=workers
+    )
 
     df = df_impression_log.merge(df_impression_time_feature, how="left", on="impression_id")
     df = df.merge(df_impression_history_feature, how="left", on="impression_id")
@@ -34,13 +58,16 @@ def get_impression_feature(
     df_view_log: pd.DataFrame,
     df_item: pd.DataFrame,
     lookback_days: int = 7,
+    workers: int = 1,
 ) -> pd.DataFrame:
     logger.info(
-        f"Start get impression feature {len(df_impression_log)=}, {len(df_view_log)=}, {len(df_item)=}, {lookback_days=}"
+        f"Start get impression feature {len(df_impression_log)=}, {len(df_view_log)=}, {len(df_item)=}, {lookback_days=}, "
+        f"{workers=}"
     )
 
-    df_impression_history_feature = _get_impression_history_feature(df_impression_log, lookback_days=lookback_days)
-    df_view_history_feature = _get_view_history_feature(df_impression_log, df_view_log, lookback_days=lookback_days)
+    df_impression_history_feature, df_view_history_feature = _get_history_features(
+        df_impression_log, df_impression_log, df_view_log, lookback_days=lookback_days, workers=workers
+    )
 
     df = df_impression_log.merge(df_impression_history_feature, how="left", on="impression_id")
     df = df.merge(df_view_history_feature, how="left", on="impression_id")
@@ -51,17 +78,122 @@ def get_impression_feature(
     return df
 
 
+def get_incremental_impression_feature(
+    df_impression_log: pd.DataFrame,
+    df_view_log: pd.DataFrame,
+    df_item: pd.DataFrame,
+    feature_state: FeatureState,
+    workers: int = 1,
+) -> pd.DataFrame:
+    # Features of new impressions after feature_state.to_datetime. The history features only look back
+    # lookback_days + 1 days, so the logs in the state give the same features as the full logs.
+    lookback_days = feature_state.lookback_days
+    logger.info(
+        f"Start get incremental impression feature {len(df_impression_log)=}, {len(df_view_log)=}, {len(df_item)=}, "
+        f"{feature_state.to_datetime=}, {lookback_days=}, {workers=}"
+    )
+
+    df_impression_log_window = pd.concat(
+        [feature_state.df_impression_log, df_impression_log[IMPRESSION_STATE_COLUMNS]], ignore_index=True
+    )
+    df_view_log_window = pd.concat([feature_state.df_view_log, df_view_log[VIEW_STATE_COLUMNS]], ignore_index=True)
+
+    df_impression_history_feature, df_view_history_feature = _get_history_features(
+        df_impression_log, df_impression_log_window, df_view_log_window, lookback_days=lookback_days, workers=workers
+    )
+
+    df = df_impression_log.merge(df_impression_history_feature, how="left", on="impression_id")
+    df = df.merge(df_view_history_feature, how="left", on="impression_id")
+    df = pd.merge(df, df_item, on="item_id", how="left")
+
+    logger.info(f"Finished incremental impression feature {len(df)=}, {df.head()}")
+
+    return df
+
+
+def iter_impression_feature(
+    impression_log_chunks: Iterable[tuple[datetime, pd.DataFrame]],
+    view_log_chunks: Iterable[tuple[datetime, pd.DataFrame]],
+    df_item: pd.DataFrame,
+    lookback_days: int = 7,
+    feature_state: FeatureState | None = None,
+    workers: int = 1,
+) -> Iterator[tuple[pd.DataFrame, FeatureState]]:
+    # Features of impression chunks of (chunk_to, logs up to chunk_to) in order of time, with the feature state after
+    # each chunk. Only one chunk and the logs in the lookback window are in memory, however long the whole period is.
+    view_log_chunks = iter(view_log_chunks)
+    next_view_log_chunk = next(view_log_chunks, None)
+    for chunk_to, df_impression_log in impression_log_chunks:
+        # Views up to the end of the impression chunk
+        df_view_logs = []
+        while next_view_log_chunk is not None and next_view_log_chunk[0] <= chunk_to:
+            df_view_logs.append(next_view_log_chunk[1])
+            next_view_log_chunk = next(view_log_chunks, None)
+        df_view_log = pd.concat(df_view_logs, ignore_index=True) if df_view_logs else _empty_view_log(feature_state)
+
+        logger.info(f"Start get impression feature of chunk. {chunk_to=}, {len(df_impression_log)=}, {len(df_view_log)=}")
+        if feature_state is None:
+            df_feature = get_impression_feature(
+                df_impression_log, df_view_log, df_item, lookback_days=lookback_days, workers=workers
+            )
+            feature_state = FeatureState.from_logs(df_impression_log, df_view_log, chunk_to, lookback_days=lookback_days)
+        else:
+            df_feature = get_incremental_impression_feature(
+                df_impression_log, df_view_log, df_item, feature_state=feature_state, workers=workers
+            )
+            feature_state = feature_state.update(df_impression_log, df_view_log, chunk_to)
+        yield df_feature, feature_state
+
+
+def _empty_view_log(feature_state: FeatureState | None) -> pd.DataFrame:
+    if feature_state is None:
+        raise ValueError("The first chunk of view logs must be at or before the first chunk of impression logs.")
+    return feature_state.df_view_log.iloc[:0]
+
+
 def apply_schema(
     df: pd.DataFrame,
     schemas: list[Schema],
 ) -> pd.DataFrame:
-    logger.info(f"Start apply schema {len(df)=}, {len(schemas)=}")
+    memory_before_mib = _get_memory_usage_mib(df)
+    logger.info(f"Start apply schema {len(df)=}, {len(schemas)=}, {memory_before_mib=:.1f}")
     for schema in schemas:
-        df[schema.name] = df[schema.name].fillna(schema.null_value)
-        df[schema.name] = df[schema.name].astype(schema.dtype)
+        column = df[schema.name]
+        # fillna and astype copy the column even without missing values or a dtype change
+        if column.hasnans:
+            column = column.fillna(schema.null_value)
+        dtype = schema.pandas_dtype
+        if dtype == "category" and isinstance(column.dtype, pd.ArrowDtype):
+            # Categories would be an arrow array, which is not the category labels of models trained on numpy dtypes
+            column = column.astype(column.dtype.numpy_dtype, copy=False)
+        if isinstance(dtype, str) and dtype in ("int8", "int16", "int32"):
+            column = _mask_out_of_integer_range(column, dtype, schema.null_value)
+        df[schema.name] = column.astype(dtype, copy=False)
+    memory_after_mib = _get_memory_usage_mib(df)
+    logger.info(f"Finished apply schema {memory_before_mib=:.1f}, {memory_after_mib=:.1f}")
     return df
 
 
+def _get_memory_usage_mib(df: pd.DataFrame) -> float:
+    return df.memory_usage(deep=True).sum() / 1024 / 1024
+
+
+def _mask_out_of_integer_range(column: pd.Series, dtype: str, null_value: Any) -> pd.Series:
+    # Values out of the range of a narrow integer dtype are missing, as FeaturePlan casts them online, instead of
+    # wrapped by astype. Strings such as those of the online feature store are parsed first.
+    if not pd.api.types.is_numeric_dtype(column):
+        column = pd.to_numeric(column)
+    iinfo = np.iinfo(dtype)
+    is_out_of_range = (column < iinfo.min) | (column > iinfo.max)
+    if is_out_of_range.any():
+        logger.warning(
+            f"Values of {column.name} out of the range of {dtype} are missing. {is_out_of_range.sum()=}, "
+            f"{column.min()=}, {column.max()=}"
+        )
+        column = column.mask(is_out_of_range, null_value)
+    return column
+
+
 def apply_train_test_split(
     df: pd.DataFrame,
     test_size: float = 0.2,
@@ -70,8 +202,7 @@ def apply_train_test_split(
     logger.info(f"Start get train dataset. {len(df)=}, {test_size=}, {valid_size=}")
 
     # Sort by impression time to split data based on the impression time
-    df = df.sort_values(by="logged_at")
-    # TODO: valid, testを割合ではなく、日にちで分割する。今だと学習データ期間が変わると、valid, testデータが変わってしまう。
+    df = df.sort_values(by="logged_at", kind="stable")
 
     df_train, df_test = train_test_split(df, test_size=test_size, random_state=42, shuffle=False)
     df_train, df_valid = train_test_split(df_train, test_size=valid_size, random_state=42, shuffle=False)
@@ -79,23 +210,151 @@ def apply_train_test_split(
     return df_train, df_valid, df_test
 
 
+def apply_date_split(
+    df: pd.DataFrame,
+    to_datetime: datetime,
+    valid_interval_days: int = 2,
+    test_interval_days: int = 5,
+) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    # Split by absolute dates: test is the last test_interval_days before to_datetime and valid is the
+    # valid_interval_days before test, so that the splits do not move with the length of the training data.
+    test_from = to_datetime - timedelta(days=test_interval_days)
+    valid_from = test_from - timedelta(days=valid_interval_days)
+    logger.info(f"Start date split. {len(df)=}, {valid_from=}, {test_from=}, {to_datetime=}")
+
+    # 0: train, 1: valid, 2: test, 3: missing logged_at
+    logged_at = df["logged_at"]
+    boundaries = np.array([valid_from, test_from], dtype="datetime64[ns]").astype(np.int64)
+    split = np.searchsorted(boundaries, _to_nanoseconds(logged_at), side="right")
+    split[logged_at.isna().to_numpy()] = 3
+    # Rows are reordered by one stable partition only when the splits are not already contiguous, and each split is a
+    # slice of the frame instead of a copy
+    if np.any(split[1:] < split[:-1]):
+        order = np.argsort(split, kind="stable")
+        df, split = df.take(order), split[order]
+    train_end, valid_end, test_end = np.searchsorted(split, [1, 2, 3])
+    df_train, df_valid, df_test = df.iloc[:train_end], df.iloc[train_end:valid_end], df.iloc[valid_end:test_end]
+
+    logger.info(f"Finished date split. {len(df_train)=}, {len(df_valid)=}, {len(df_test)=}, {len(df) - test_end=}")
+    # Logs which do not reach to_datetime, or start after valid_from, would train or evaluate on nothing
+    for name, df_split, boundary in [
+        ("train", df_train, f"before {valid_from}"),
+        ("valid", df_valid, f"from {valid_from} to {test_from}"),
+        ("test", df_test, f"from {test_from} to {to_datetime}"),
+    ]:
+        if df_split.empty:
+            raise ValueError(
+                f"No logs in the {name} split {boundary}. Logs are from {logged_at.min()} to {logged_at.max()}, "
+                "change to_datetime or split by the ratio."
+            )
+    return df_train, df_valid, df_test
+
+
+def _to_nanoseconds(logged_at: pd.Series) -> npt.NDArray[np.int64]:
+    return logged_at.dt.as_unit("ns").astype("int64").to_numpy()
+
+
+def _encode_user_time_keys(keys: list[tuple[pd.Series, npt.NDArray[np.int64]]]) -> list[npt.NDArray[np.int64]]:
+    # Encode pairs of (user_id, time in nanoseconds) into int64 keys, which are ordered by time within a user,
+    # so that windows of a user can be searched in a single sorted array. Missing user_ids are equal like merge keys.
+    user_codes = pd.factorize(
+        pd.concat([pd.Series(user_id) for user_id, _ in keys], ignore_index=True), use_na_sentinel=False
+    )[0].astype("int64")
+    times = np.concatenate([time for _, time in keys])
+    time_codes = np.unique(times, return_inverse=True)[1].reshape(-1)
+    n_time_codes = int(time_codes.max()) + 1 if len(time_codes) else 0
+    encoded_keys = user_codes * n_time_codes + time_codes
+    return np.split(encoded_keys, np.cumsum([len(time) for _, time in keys])[:-1])
+
+
+def _get_history_features(
+    df_impression_log: pd.DataFrame,
+    df_impression_log_window: pd.DataFrame,
+    df_view_log: pd.DataFrame,
+    lookback_days: int = 7,
+    workers: int = 1,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    # History features of df_impression_log, counting previous impressions in df_impression_log_window
+    if workers <= 1:
+        return _get_history_features_of_shard(df_impression_log, df_impression_log_window, df_view_log, lookback_days)
+
+    # Every history feature only looks at logs of the same user, so logs are partitioned by the hash of user_id and
+    # the shards are processed independently. The features are merged on impression_id, so the order of the shards
+    # does not change the result.
+    n_shards = max(workers, math.ceil(len(df_impression_log_window) / SHARD_MAX_ROWS))
+    shards = _split_by_user_id([df_impression_log, df_impression_log_window, df_view_log], n_shards=n_shards)
+    logger.info(f"Start sharded history features. {workers=}, {n_shards=}")
+    # Shards are built when a worker is about to be free, so that the parent holds a few shards besides the logs
+    results: dict[int, tuple[pd.DataFrame, pd.DataFrame]] = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures: dict[Future, int] = {}
+        for i, (df_impression_shard, df_impression_window_shard, df_view_shard) in enumerate(shards):
+            if len(futures) >= 2 * workers:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                results |= {futures.pop(future): future.result() for future in done}
+            future = executor.submit(
+                _get_history_features_of_shard, df_impression_shard, df_impression_window_shard, df_view_shard, lookback_days
+            )
+            futures[future] = i
+        results |= {i: future.result() for future, i in futures.items()}
+
+    df_impression_history_feature = pd.concat([results[i][0] for i in range(n_shards)], ignore_index=True)
+    df_view_history_feature = pd.concat([results[i][1] for i in range(n_shards)], ignore_index=True)
+    return df_impression_history_feature, df_view_history_feature
+
+
+def _get_history_features_of_shard(
+    df_impression_log: pd.DataFrame,
+    df_impression_log_window: pd.DataFrame,
+    df_view_log: pd.DataFrame,
+    lookback_days: int,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    df_impression_history_feature = _get_impression_history_feature(df_impression_log_window, lookback_days=lookback_days)
+    df_view_history_feature = _get_view_history_feature(df_impression_log, df_view_log, lookback_days=lookback_days)
+    return df_impression_history_feature, df_view_history_feature
+
+
+def _split_by_user_id(dfs: list[pd.DataFrame], n_shards: int) -> Iterator[list[pd.DataFrame]]:
+    # Yields the rows of each of dfs in a shard, shard by shard.
+    # user_id of the logs are hashed in one dtype, since the same id in int64 and float64 has different hashes
+    user_id = pd.concat([df["user_id"] for df in dfs], ignore_index=True)
+    shard = pd.util.hash_pandas_object(user_id, index=False).to_numpy() % n_shards
+    df_shards = np.split(shard, np.cumsum([len(df) for df in dfs])[:-1])
+    for i in range(n_shards):
+        yield [df[df_shard == i] for df, df_shard in zip(dfs, df_shards, strict=True)]
+
+
 def _get_impression_history_feature(
     df_impression_log: pd.DataFrame,
     lookback_days: int = 7,
 ) -> pd.DataFrame:
-    df_impression_history = df_impression_log.merge(df_impression_log, how="left", on="user_id", suffixes=("", "_previous"))
-
-    df_impression_history["days_between_impressions"] = (
-        df_impression_history["logged_at"] - df_impression_history["logged_at_previous"]
-    ).dt.days
+    # Count impressions of the same user in (logged_at - (lookback_days + 1) days, logged_at), which is the same
+    # condition as "previous < logged_at and (logged_at - previous).days <= lookback_days" since .days is truncated.
+    # Instead of joining the impressions of a user with themselves, the window edges are searched in the impressions
+    # sorted by (user_id, logged_at).
+    df_impression_log = df_impression_log[df_impression_log["logged_at"].notna()]
+    logged_at = _to_nanoseconds(df_impression_log["logged_at"])
+    user_id = df_impression_log["user_id"]
+    key, key_window_start = _encode_user_time_keys(
+        [(user_id, logged_at), (user_id, logged_at - (lookback_days + 1) * DAY_NANOSECONDS)]
+    )
 
-    df_impression_history = df_impression_history.query(
-        f"(logged_at_previous < logged_at) and (days_between_impressions <= {lookback_days})"
+    sorted_key = np.sort(key)
+    previous_impression_count = np.searchsorted(sorted_key, key, side="left") - np.searchsorted(
+        sorted_key, key_window_start, side="right"
     )
 
+    # Impressions without previous impressions are not included, like the inner filtering of the self join
     df_impression_history_feature = (
-        df_impression_history.groupby("impression_id")["impression_id_previous"]
-        .count()
+        pd.DataFrame(
+            {
+                "impression_id": df_impression_log["impression_id"].array,
+                "previous_impression_count": previous_impression_count,
+            }
+        )
+        .query("previous_impression_count > 0")
+        .groupby("impression_id")["previous_impression_count"]
+        .sum()
         .reset_index(name="previous_impression_count")
     )
 
@@ -110,33 +369,63 @@ def _get_view_history_feature(
     df_view_log: pd.DataFrame,
     lookback_days: int = 7,
 ) -> pd.DataFrame:
+    # Count views of the same user in (logged_at - (lookback_days + 1) days, logged_at) of each impression and take
+    # item_id and device_type of the latest view in the window having the value. The window edges are searched in
+    # the views sorted by (user_id, logged_at), instead of joining every impression with every view of the user.
     df_view_log_drop_duplicated = df_view_log.drop_duplicates(subset=["user_id", "logged_at"], keep="last")
-    df_view_history = df_impression_log.merge(
-        df_view_log_drop_duplicated,
-        how="left",
-        on="user_id",
-        suffixes=("_impression", "_view"),
+    # Columns of the join were missing for impressions of users without views
+    is_all_matched = df_impression_log["user_id"].isin(df_view_log_drop_duplicated["user_id"]).all()
+
+    df_impression_log = df_impression_log[df_impression_log["logged_at"].notna()]
+    df_view_log_drop_duplicated = df_view_log_drop_duplicated[df_view_log_drop_duplicated["logged_at"].notna()]
+    logged_at = _to_nanoseconds(df_impression_log["logged_at"])
+    key, key_window_start, key_view = _encode_user_time_keys(
+        [
+            (df_impression_log["user_id"], logged_at),
+            (df_impression_log["user_id"], logged_at - (lookback_days + 1) * DAY_NANOSECONDS),
+            (df_view_log_drop_duplicated["user_id"], _to_nanoseconds(df_view_log_drop_duplicated["logged_at"])),
+        ]
     )
+    view_order = np.argsort(key_view, kind="stable")
+    sorted_key_view = key_view[view_order]
 
-    df_view_history["days_between_impression_and_session"] = (
-        df_view_history["logged_at_impression"] - df_view_history["logged_at_view"]
-    ).dt.days
-
-    df_view_history = df_view_history.query(
-        f"(logged_at_view < logged_at_impression) and (days_between_impression_and_session <= {lookback_days})"
+    df_view_history_features = pd.DataFrame(
+        {
+            "impression_id": df_impression_log["impression_id"].array,
+            "previous_view_count": np.searchsorted(sorted_key_view, key, side="left")
+            - np.searchsorted(sorted_key_view, key_window_start, side="right"),
+        }
     )
+    # Positions of the last views are aggregated instead of the values, which keeps the aggregation on integers for
+    # any dtype of the values such as arrow strings. Position -1 is not in the index and gives a missing value.
+    values = {}
+    for column in ["item_id", "device_type"]:
+        values[column] = df_view_log_drop_duplicated[column].reset_index(drop=True)
+        is_valid = values[column].notna().to_numpy()[view_order]
+        sorted_key_valid = sorted_key_view[is_valid]
+        last_view = np.searchsorted(sorted_key_valid, key, side="left") - 1
+        has_last_view = last_view >= np.searchsorted(sorted_key_valid, key_window_start, side="right")
+        positions = np.append(view_order[is_valid], -1)[np.where(has_last_view, last_view, -1)]
+        df_view_history_features[column] = pd.arrays.IntegerArray(positions, mask=positions == -1)
+
+    # Impressions without previous views are not included, like the inner filtering of the join
     df_view_history_features = (
-        df_view_history.groupby(
-            "impression_id",
-        )
+        df_view_history_features.query("previous_view_count > 0")
+        .groupby("impression_id")
         .agg(
-            previous_view_count=("logged_at_view", "count"),
+            previous_view_count=("previous_view_count", "sum"),
             item_id=("item_id", "last"),
             device_type=("device_type", "last"),
         )
         .reset_index()
     )
 
+    for column in ["item_id", "device_type"]:
+        dtype = df_view_log[column].dtype
+        if not is_all_matched:
+            dtype = df_view_log[column].iloc[:0].reindex([0]).dtype
+        positions = df_view_history_features[column].fillna(-1).to_numpy(dtype=np.int64)
+        df_view_history_features[column] = values[column].reindex(positions).astype(dtype).array
     df_view_history_features["previous_view_count"] = df_view_history_features["previous_view_count"].astype(pd.Int64Dtype())
 
     return df_view_history_features
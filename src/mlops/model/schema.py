@@ -1,9 +1,19 @@
 from dataclasses import dataclass
 from typing import Any
 
+import pandas as pd
+
 
 @dataclass
 class Schema:
     name: str
     dtype: str
     null_value: Any
+    # Fixed categories of a "category" column, so that the codes do not depend on the values in the training data
+    categories: list[Any] | None = None
+
+    @property
+    def pandas_dtype(self) -> Any:
+        if self.dtype == "category" and self.categories is not None:
+            return pd.CategoricalDtype(self.categories)
+        return self.dtype
@@ -1 +1,7 @@
+from .batcher import MicroBatcher, MicroBatcherStats
+from .feature_cache import CachedOnlineFeatureStore, FeatureCache, FeatureCacheStats
+from .feature_plan import FeaturePlan
+from .model_reloader import ModelReloader, ModelReloaderStats, ServingModel
+from .prediction_logger import PredictionLogger, PredictionLoggerStats
 from .request import AdRequest
+from .server import PreforkServer, get_available_cpu_count
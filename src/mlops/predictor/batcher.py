@@ -0,0 +1,139 @@
+import asyncio
+import logging
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Any
+
+import numpy.typing as npt
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class MicroBatcherStats:
+    batch_count: int = 0
+    request_count: int = 0
+    max_batch_size: int = 0
+    total_queue_wait_us: float = 0.0
+    max_queue_wait_us: float = 0.0
+
+    def as_dict(self) -> dict[str, int | float]:
+        return {
+            "batch_count": self.batch_count,
+            "request_count": self.request_count,
+            "mean_batch_size": self.request_count / self.batch_count if self.batch_count else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "mean_queue_wait_us": self.total_queue_wait_us / self.request_count if self.request_count else 0.0,
+            "max_queue_wait_us": self.max_queue_wait_us,
+        }
+
+
+@dataclass
+class _PendingPrediction:
+    features: list[Any]
+    future: asyncio.Future
+    enqueued_at: float
+
+
+class MicroBatcher:
+    def __init__(
+        self,
+        predict_fn: Callable[[list[list[Any]]], npt.NDArray],
+        max_batch_size: int = 32,
+        max_wait_us: int = 1000,
+    ) -> None:
+        if max_batch_size < 1:
+            raise ValueError(f"max_batch_size must be positive: {max_batch_size=}")
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_us = max_wait_us
+        self.stats = MicroBatcherStats()
+        self._queue: asyncio.Queue[_PendingPrediction] = asyncio.Queue()
+        self._worker: asyncio.Task | None = None
+        self._last_batch_size = 0
+
+    async def start(self) -> None:
+        logger.info(f"Start micro batcher. {self.max_batch_size=}, {self.max_wait_us=}")
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+        pending_predictions = []
+        while not self._queue.empty():
+            pending_predictions.append(self._queue.get_nowait())
+        self._set_exception(pending_predictions, RuntimeError("Micro batcher is stopped."))
+        logger.info(f"Stopped micro batcher. {self.stats=}")
+
+    async def predict(self, features: list[Any]) -> float:
+        if self._worker is None:
+            raise RuntimeError("Micro batcher is not started.")
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait(_PendingPrediction(features=features, future=future, enqueued_at=time.perf_counter()))
+        return await future
+
+    async def _run(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            try:
+                await self._collect(batch)
+            except asyncio.CancelledError:
+                self._set_exception(batch, RuntimeError("Micro batcher is stopped."))
+                raise
+            self._process(batch)
+
+    async def _collect(self, batch: list[_PendingPrediction]) -> None:
+        # Requests which are already queued never wait
+        while len(batch) < self.max_batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+
+        # Wait for concurrent requests only under load, so that a single request at low traffic is not delayed
+        if self._last_batch_size <= 1 and len(batch) == 1:
+            return
+
+        deadline = batch[0].enqueued_at + self.max_wait_us / 1e6
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=timeout))
+            except TimeoutError:
+                break
+
+    def _process(self, batch: list[_PendingPrediction]) -> None:
+        dispatched_at = time.perf_counter()
+        self._last_batch_size = len(batch)
+        self.stats.batch_count += 1
+        self.stats.request_count += len(batch)
+        self.stats.max_batch_size = max(self.stats.max_batch_size, len(batch))
+        for pending in batch:
+            queue_wait_us = (dispatched_at - pending.enqueued_at) * 1e6
+            self.stats.total_queue_wait_us += queue_wait_us
+            self.stats.max_queue_wait_us = max(self.stats.max_queue_wait_us, queue_wait_us)
+
+        try:
+            predictions = self.predict_fn([pending.features for pending in batch])
+            if len(predictions) != len(batch):
+                raise ValueError(f"Number of predictions does not match batch size. {len(predictions)=}, {len(batch)=}")
+        except Exception as e:
+            logger.info(f"Failed to predict batch. {len(batch)=}, Error: {e}")
+            self._set_exception(batch, e)
+            return
+
+        for pending, prediction in zip(batch, predictions, strict=True):
+            if not pending.future.done():
+                pending.future.set_result(float(prediction))
+
+    @staticmethod
+    def _set_exception(batch: list[_PendingPrediction], exception: Exception) -> None:
+        for pending in batch:
+            if not pending.future.done():
+                pending.future.set_exception(exception)
@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from collections.abc import Hashable
+from dataclasses import asdict, dataclass
+from typing import Any
+
+from mlops.aws import OnlineFeatureStoreDynamoDB
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class FeatureCacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    invalidations: int = 0
+
+
+class FeatureCache:
+    def __init__(self, max_size: int = 100_000, ttl_seconds: float = 300) -> None:
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.stats = FeatureCacheStats()
+        self._items: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, key: Hashable) -> Any | None:
+        item = self._items.get(key)
+        if item is None:
+            self.stats.misses += 1
+            return None
+
+        expired_at, value = item
+        if expired_at <= time.monotonic():
+            del self._items[key]
+            self.stats.expirations += 1
+            self.stats.misses += 1
+            return None
+
+        self._items.move_to_end(key)
+        self.stats.hits += 1
+        return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.max_size <= 0:
+            return
+        self._items[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+            self.stats.evictions += 1
+
+    def clear(self) -> None:
+        self._items.clear()
+        self.stats.invalidations += 1
+
+    def stats_dict(self) -> dict[str, int]:
+        return asdict(self.stats) | {"size": len(self)}
+
+
+class CachedOnlineFeatureStore:
+    # Caches user features keyed by (user_id, resolved feature version). With version "latest", the version is
+    # resolved from the one published by the feature extraction job and the cache is cleared when it changes.
+    # The published version only invalidates the cache: records are still the latest row of each user, which is of
+    # an older version for users without new impressions since, and the feature table is keyed by user_id only.
+    def __init__(
+        self,
+        feature_store: OnlineFeatureStoreDynamoDB,
+        cache: FeatureCache,
+        version_refresh_seconds: float = 60,
+    ) -> None:
+        self.feature_store = feature_store
+        self.cache = cache
+        self.version_refresh_seconds = version_refresh_seconds
+        self.resolved_version: str | None = None if feature_store.version == "latest" else str(feature_store.version)
+        self._version_checked_at: float | None = None
+        self._version_refresh: asyncio.Task | None = None
+        self._in_flight: dict[Hashable, asyncio.Future] = {}
+
+    def close(self) -> None:
+        self.feature_store.close()
+
+    async def resolve_version(self) -> str | None:
+        if self.feature_store.version != "latest":
+            return self.resolved_version
+
+        now = time.monotonic()
+        if self._version_checked_at is None or now - self._version_checked_at >= self.version_refresh_seconds:
+            # Concurrent requests share a single refresh
+            if self._version_refresh is None:
+                self._version_refresh = asyncio.create_task(self._refresh_version())
+            try:
+                await asyncio.shield(self._version_refresh)
+            finally:
+                self._version_refresh = None
+        return self.resolved_version
+
+    async def _refresh_version(self) -> None:
+        latest_version = await self.feature_store.get_latest_feature_version_async()
+        self._version_checked_at = time.monotonic()
+        if latest_version is not None and latest_version != self.resolved_version:
+            logger.info(f"Feature version is updated. {self.resolved_version=}, {latest_version=}")
+            # Records of the previous version can not be hit anymore
+            if self.resolved_version is not None:
+                self.cache.clear()
+            self.resolved_version = latest_version
+
+    async def get_impression_feature_async(self, user_id: int) -> dict[str, str | int]:
+        records = await self.get_impression_features_async(user_ids=[user_id])
+        return records[user_id]
+
+    async def get_impression_features_async(self, user_ids: list[int]) -> dict[int, dict[str, str | int]]:
+        version = await self.resolve_version()
+
+        records: dict[int, dict[str, str | int]] = {}
+        waiting: dict[int, asyncio.Future] = {}
+        missing_user_ids = []
+        for user_id in dict.fromkeys(user_ids):
+            key = (user_id, version)
+            record = self.cache.get(key)
+            if record is not None:
+                records[user_id] = record
+            elif key in self._in_flight:
+                waiting[user_id] = self._in_flight[key]
+            else:
+                missing_user_ids.append(user_id)
+
+        # Misses which are not fetched by another request yet are fetched at once
+        if missing_user_ids:
+            loop = asyncio.get_running_loop()
+            futures = {user_id: loop.create_future() for user_id in missing_user_ids}
+            for user_id, future in futures.items():
+                self._in_flight[(user_id, version)] = future
+            try:
+                fetched = await self.feature_store.get_impression_features_async(user_ids=missing_user_ids)
+                for user_id, future in futures.items():
+                    record = fetched.get(user_id, {})
+                    # Empty records are not cached, since failures and timeouts of the feature store also return them
+                    if record:
+                        self.cache.put((user_id, version), record)
+                    future.set_result(record)
+            except asyncio.CancelledError:
+                for future in futures.values():
+                    future.cancel()
+                raise
+            except Exception as e:
+                for future in futures.values():
+                    if not future.done():
+                        future.set_exception(e)
+                        # Mark as retrieved, since the future may have no other waiters
+                        future.exception()
+                raise
+            finally:
+                for user_id in missing_user_ids:
+                    self._in_flight.pop((user_id, version), None)
+            records |= {user_id: future.result() for user_id, future in futures.items()}
+
+        for user_id, future in waiting.items():
+            records[user_id] = await asyncio.shield(future)
+
+        return records
+
+    def stats_dict(self) -> dict[str, int | str | None]:
+        return self.cache.stats_dict() | {"in_flight": len(self._in_flight), "resolved_version": self.resolved_version}
@@ -0,0 +1,131 @@
+import logging
+from collections.abc import Callable, Sequence
+from datetime import datetime
+from typing import Any
+
+import numpy as np
+import numpy.typing as npt
+import pandas as pd
+
+from mlops.model import LightGBMModel, ModelConfig, Schema
+from mlops.model.models.base_model import BaseModel
+
+from .request import AdRequest
+
+logger = logging.getLogger(__name__)
+
+
+def _is_null(value: Any) -> bool:
+    # Same values treated as missing by DataFrame.fillna: None, pd.NA, NaN and NaT
+    return value is None or value is pd.NA or value != value
+
+
+def _get_nan_null_value(null_value: Any) -> Any:
+    # fillna on a NaN column (float64) keeps numeric fill values as float
+    if isinstance(null_value, int | float) and not isinstance(null_value, bool):
+        return float(null_value)
+    return null_value
+
+
+def _get_cast(dtype: str, categories: list[Any] | None = None, null_value: Any = np.nan) -> Callable[[Any], Any]:
+    if dtype == "category":
+        if categories is not None:
+            # Values out of the fixed categories are missing like astype(CategoricalDtype(categories))
+            category_set = set(categories)
+            return lambda value: value if value in category_set else np.nan
+        # astype("category") keeps the raw value as the category label
+        return lambda value: value
+    if dtype in ("str", "object"):
+        return str
+
+    numpy_type = np.dtype(dtype).type
+    if issubclass(numpy_type, np.integer):
+        # Values out of the range of the integer type are missing as in apply_schema, instead of an OverflowError which
+        # fails the whole request
+        info = np.iinfo(numpy_type)
+
+        def cast_integer(value: Any) -> Any:
+            integer = int(value)
+            return integer if info.min <= integer <= info.max else null_value
+
+        return cast_integer
+    return lambda value: numpy_type(value).item()
+
+
+def _parse_datetime(value: Any) -> datetime:
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return pd.Timestamp(value).to_pydatetime()
+
+
+class FeaturePlan:
+    # Same transformation as add_impression_time_feature + apply_schema, compiled once from the schemas
+    # so that online prediction does not build a DataFrame per request.
+    def __init__(self, schemas: list[Schema], pandas_categorical: list[list] | None = None) -> None:
+        self.columns = [schema.name for schema in schemas]
+        self._steps = [
+            (
+                schema.name,
+                schema.null_value,
+                _get_nan_null_value(schema.null_value),
+                _get_cast(schema.dtype, schema.categories, schema.null_value),
+            )
+            for schema in schemas
+        ]
+
+        # LightGBM booster input: category labels are encoded to the codes used at training time
+        self._category_codes: list[dict[Any, int] | None] | None = None
+        if pandas_categorical is not None:
+            category_columns = [schema.name for schema in schemas if schema.dtype == "category"]
+            if len(category_columns) != len(pandas_categorical):
+                raise ValueError("Model categorical features do not match schemas.")
+            codes = {
+                name: {category: code for code, category in enumerate(categories)}
+                for name, categories in zip(category_columns, pandas_categorical, strict=True)
+            }
+            self._category_codes = [codes.get(name) for name in self.columns]
+
+    @classmethod
+    def compile(cls, model_config: ModelConfig, model: BaseModel) -> "FeaturePlan":
+        pandas_categorical = None
+        if isinstance(model, LightGBMModel) and model.model is not None:
+            pandas_categorical = model.model.pandas_categorical
+        logger.info(f"Compile feature plan. {model_config.name=}, {pandas_categorical is not None=}")
+        return cls(schemas=model_config.schemas, pandas_categorical=pandas_categorical)
+
+    def transform(self, ad_request: AdRequest, user_feature: dict[str, Any]) -> list[Any]:
+        record = ad_request.model_dump() | user_feature
+
+        logged_at = _parse_datetime(record["logged_at"])
+        record["impression_hour"] = logged_at.hour
+        record["impression_day"] = logged_at.day
+        record["impression_weekday"] = logged_at.weekday()
+
+        features = []
+        for name, null_value, nan_null_value, cast in self._steps:
+            value = record.get(name, np.nan)
+            if _is_null(value):
+                value = nan_null_value if isinstance(value, float) else null_value
+            features.append(cast(value))
+        return features
+
+    def to_record(self, features: list[Any]) -> dict[str, Any]:
+        return dict(zip(self.columns, features, strict=True))
+
+    def to_model_input(self, rows: Sequence[list[Any]]) -> npt.NDArray:
+        if self._category_codes is None:
+            X = np.empty((len(rows), len(self.columns)), dtype=object)
+            X[:] = rows
+            return X
+
+        X = np.empty((len(rows), len(self.columns)), dtype=np.float64)
+        for i, row in enumerate(rows):
+            for j, (value, codes) in enumerate(zip(row, self._category_codes, strict=True)):
+                if codes is None:
+                    X[i, j] = value
+                else:
+                    X[i, j] = codes.get(value, np.nan)
+        return X
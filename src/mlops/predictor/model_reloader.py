@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Any
+
+from mlops.model import ModelConfig
+from mlops.model.models.base_model import BaseModel
+
+from .batcher import MicroBatcher
+from .feature_plan import FeaturePlan
+from .request import AdRequest
+
+logger = logging.getLogger(__name__)
+
+WARMUP_AD_REQUEST = AdRequest(
+    impression_id="warmup",
+    logged_at="2018-12-13 07:44:00",
+    user_id=87862,
+    app_code=127,
+    os_version="latest",
+    is_4g=1,
+)
+
+
+@dataclass
+class ServingModel:
+    version: str
+    model: BaseModel
+    feature_plan: FeaturePlan
+    batcher: MicroBatcher
+    loaded_at: str
+    load_seconds: float
+    active_requests: int = field(default=0, compare=False)
+
+
+@dataclass
+class ModelReloaderStats:
+    check_count: int = 0
+    reload_count: int = 0
+    failed_count: int = 0
+    last_checked_at: str | None = None
+    last_error: str | None = None
+
+
+class ModelReloader:
+    # Holds the model being served and swaps it for a new version found by polling the model registry.
+    # Requests which started on the previous model finish on it before its batcher is stopped.
+    def __init__(
+        self,
+        model_config: ModelConfig,
+        load_model: Callable[[str], BaseModel],
+        get_latest_version: Callable[[], str | None],
+        max_batch_size: int = 32,
+        max_batch_wait_us: int = 1000,
+        poll_interval_seconds: float = 0,
+        warmup_batch_size: int = 32,
+        drain_timeout_seconds: float = 30,
+    ) -> None:
+        self.model_config = model_config
+        self.load_model = load_model
+        self.get_latest_version = get_latest_version
+        self.max_batch_size = max_batch_size
+        self.max_batch_wait_us = max_batch_wait_us
+        # Polling is disabled with 0
+        self.poll_interval_seconds = poll_interval_seconds
+        self.warmup_batch_size = warmup_batch_size
+        self.drain_timeout_seconds = drain_timeout_seconds
+        self.stats = ModelReloaderStats()
+        self._current: ServingModel | None = None
+        self._worker: asyncio.Task | None = None
+        self._reload_lock = asyncio.Lock()
+
+    @property
+    def current(self) -> ServingModel:
+        if self._current is None:
+            raise RuntimeError("Model is not loaded.")
+        return self._current
+
+    @contextmanager
+    def use(self) -> Iterator[ServingModel]:
+        serving_model = self.current
+        serving_model.active_requests += 1
+        try:
+            yield serving_model
+        finally:
+            serving_model.active_requests -= 1
+
+    async def start(self, version: str) -> None:
+        self._current = await self.load(version)
+        if self.poll_interval_seconds > 0:
+            logger.info(f"Start model reloader. {self.poll_interval_seconds=}")
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+        if self._current is not None:
+            await self._current.batcher.stop()
+        logger.info(f"Stopped model reloader. {self.stats=}")
+
+    async def load(self, version: str) -> ServingModel:
+        logger.info(f"Start loading model. {self.model_config.name=}, {version=}")
+        start = time.perf_counter()
+
+        # Download and deserialization of the model do not block requests served by the current model
+        model = await asyncio.to_thread(self.load_model, version)
+        feature_plan = FeaturePlan.compile(model_config=self.model_config, model=model)
+        await asyncio.to_thread(self._warmup, model, feature_plan)
+
+        batcher = MicroBatcher(
+            predict_fn=lambda rows: model.predict_proba_online(feature_plan.to_model_input(rows)),
+            max_batch_size=self.max_batch_size,
+            max_wait_us=self.max_batch_wait_us,
+        )
+        await batcher.start()
+
+        load_seconds = time.perf_counter() - start
+        logger.info(f"Finished loading model. {version=}, {load_seconds=:.3f}")
+        return ServingModel(
+            version=version,
+            model=model,
+            feature_plan=feature_plan,
+            batcher=batcher,
+            loaded_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            load_seconds=load_seconds,
+        )
+
+    def _warmup(self, model: BaseModel, feature_plan: FeaturePlan) -> None:
+        rows = [feature_plan.transform(WARMUP_AD_REQUEST, {}) for _ in range(self.warmup_batch_size)]
+        predictions = model.predict_proba_online(feature_plan.to_model_input(rows))
+        if len(predictions) != len(rows):
+            raise ValueError(f"Number of warm-up predictions does not match. {len(predictions)=}, {len(rows)=}")
+
+    async def reload(self) -> bool:
+        async with self._reload_lock:
+            self.stats.check_count += 1
+            self.stats.last_checked_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            try:
+                latest_version = await asyncio.to_thread(self.get_latest_version)
+                if latest_version is None or latest_version == self.current.version:
+                    return False
+                serving_model = await self.load(latest_version)
+            except Exception as e:
+                self.stats.failed_count += 1
+                self.stats.last_error = str(e)
+                logger.info(f"Failed to reload model. Keep serving {self.current.version=}. Error: {e}")
+                return False
+
+            # Requests started after the swap are served by the new model
+            previous_model, self._current = self.current, serving_model
+            self.stats.reload_count += 1
+            self.stats.last_error = None
+            logger.info(f"Model is updated. {previous_model.version=}, {serving_model.version=}")
+
+        await self._retire(previous_model)
+        return True
+
+    async def _retire(self, serving_model: ServingModel) -> None:
+        deadline = time.perf_counter() + self.drain_timeout_seconds
+        while serving_model.active_requests > 0 and time.perf_counter() < deadline:
+            await asyncio.sleep(0.01)
+        if serving_model.active_requests > 0:
+            logger.info(f"Stop previous model with active requests. {serving_model.active_requests=}")
+        await serving_model.batcher.stop()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.poll_interval_seconds)
+            await self.reload()
+
+    def status_dict(self) -> dict[str, Any]:
+        serving_model = self.current
+        return {
+            "model": self.model_config.name,
+            "version": serving_model.version,
+            "loaded_at": serving_model.loaded_at,
+            "load_seconds": serving_model.load_seconds,
+            "active_requests": serving_model.active_requests,
+            "poll_interval_seconds": self.poll_interval_seconds,
+        } | asdict(self.stats)
@@ -0,0 +1,125 @@
+import asyncio
+import json
+import logging
+import random
+import sys
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, TextIO
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ["drop", "block", "sample"]
+
+
+@dataclass
+class PredictionLoggerStats:
+    enqueued: int = 0
+    flushed: int = 0
+    dropped: int = 0
+    flush_count: int = 0
+    failed: int = 0
+
+
+class PredictionLogger:
+    def __init__(
+        self,
+        stream: TextIO = sys.stdout,
+        queue_size: int = 10_000,
+        flush_size: int = 100,
+        flush_interval_ms: int = 200,
+        overflow_policy: str = "drop",
+        sample_rate: float = 0.1,
+        seed: int | None = None,
+    ) -> None:
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Invalid overflow policy: {overflow_policy}")
+        self.stream = stream
+        self.flush_size = flush_size
+        self.flush_interval_ms = flush_interval_ms
+        self.overflow_policy = overflow_policy
+        # With "sample", records are sampled at sample_rate once the queue is half full
+        self.sample_rate = sample_rate
+        self.stats = PredictionLoggerStats()
+        self._queue: asyncio.Queue[dict[str, Any]] = asyncio.Queue(maxsize=queue_size)
+        self._random = random.Random(seed)
+        self._worker: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        logger.info(f"Start prediction logger. {self.flush_size=}, {self.flush_interval_ms=}, {self.overflow_policy=}")
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+        # Drain records which are not flushed yet
+        records = []
+        while not self._queue.empty():
+            records.append(self._queue.get_nowait())
+        for i in range(0, len(records), self.flush_size):
+            await self._flush(records[i : i + self.flush_size])
+        logger.info(f"Stopped prediction logger. {self.stats=}")
+
+    async def log(self, record: dict[str, Any]) -> None:
+        if self.overflow_policy == "block":
+            await self._queue.put(record)
+            self.stats.enqueued += 1
+            return
+
+        if self.overflow_policy == "sample" and self._queue.qsize() >= self._queue.maxsize // 2:
+            if self._random.random() >= self.sample_rate:
+                self.stats.dropped += 1
+                return
+
+        try:
+            self._queue.put_nowait(record)
+            self.stats.enqueued += 1
+        except asyncio.QueueFull:
+            self.stats.dropped += 1
+
+    async def _run(self) -> None:
+        while True:
+            records = [await self._queue.get()]
+            deadline = time.perf_counter() + self.flush_interval_ms / 1000
+            try:
+                while len(records) < self.flush_size:
+                    if not self._queue.empty():
+                        records.append(self._queue.get_nowait())
+                        continue
+                    timeout = deadline - time.perf_counter()
+                    if timeout <= 0:
+                        break
+                    try:
+                        records.append(await asyncio.wait_for(self._queue.get(), timeout=timeout))
+                    except TimeoutError:
+                        break
+            except asyncio.CancelledError:
+                await self._flush(records)
+                raise
+            await self._flush(records)
+
+    async def _flush(self, records: list[dict[str, Any]]) -> None:
+        if not records:
+            return
+        try:
+            lines = "".join(json.dumps(record) + "\n" for record in records)
+            # Write outside of the event loop, so that backpressure of stdout does not block requests
+            await asyncio.to_thread(self._write, lines)
+            self.stats.flushed += len(records)
+            self.stats.flush_count += 1
+        except Exception as e:
+            self.stats.failed += len(records)
+            logger.info(f"Failed to flush prediction logs. {len(records)=}, Error: {e}")
+
+    def _write(self, lines: str) -> None:
+        self.stream.write(lines)
+        self.stream.flush()
+
+    def stats_dict(self) -> dict[str, int]:
+        return asdict(self.stats) | {"queue_size": self._queue.qsize()}
@@ -0,0 +1,139 @@
+import gc
+import logging
+import math
+import os
+import signal
+import socket
+from collections.abc import Callable
+from types import FrameType
+from typing import Any
+
+import uvicorn
+
+logger = logging.getLogger(__name__)
+
+# Exit code of a worker which failed to start, e.g. the lifespan raised an error
+WORKER_STARTUP_FAILURE = 3
+
+
+def _get_cgroup_cpu_quota() -> float | None:
+    try:
+        # cgroup v2
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        return None if quota == "max" else int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        # cgroup v1
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            cfs_quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            cfs_period = int(f.read())
+        return cfs_quota / cfs_period if cfs_quota > 0 else None
+    except (OSError, ValueError):
+        return None
+
+
+def get_available_cpu_count() -> int:
+    # CPUs which the process can run on, limited by the CPU quota of the container such as the vCPUs of a Fargate task
+    cpu_count = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    cpu_quota = _get_cgroup_cpu_quota()
+    if cpu_quota is not None:
+        cpu_count = min(cpu_count, max(1, math.ceil(cpu_quota)))
+    return cpu_count
+
+
+class PreforkServer:
+    # Runs the app in worker processes forked from this process, which accept connections on a shared socket.
+    # Objects created by preload before forking, such as models, are shared by the workers with copy-on-write.
+    def __init__(
+        self,
+        app: Any,
+        host: str = "0.0.0.0",
+        port: int = 8080,
+        workers: int | None = None,
+        preload: Callable[[], None] | None = None,
+        log_level: str = "info",
+    ) -> None:
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = workers if workers is not None else get_available_cpu_count()
+        if self.workers < 1:
+            raise ValueError(f"workers must be positive: {self.workers=}")
+        self.preload = preload
+        self.log_level = log_level
+        self.worker_pids: set[int] = set()
+        self._stopping = False
+
+    def run(self) -> int:
+        logger.info(f"Start prefork server. {self.host=}, {self.port=}, {self.workers=}")
+        if self.preload is not None:
+            self.preload()
+        # Objects created so far are not tracked by gc in the workers, so that gc does not write to their pages
+        gc.collect()
+        gc.freeze()
+
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(2048)
+
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        for _ in range(self.workers):
+            self._spawn_worker(sock)
+
+        exit_code = 0
+        while self.worker_pids:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            self.worker_pids.discard(pid)
+            worker_exit_code = os.waitstatus_to_exitcode(status)
+            if self._stopping:
+                continue
+            if worker_exit_code == WORKER_STARTUP_FAILURE:
+                # Restarting does not help, since every worker fails to start in the same way
+                logger.info(f"Worker failed to start. Stop prefork server. {pid=}")
+                exit_code = WORKER_STARTUP_FAILURE
+                self._stop_workers()
+                continue
+            logger.info(f"Worker exited. Restart worker. {pid=}, {worker_exit_code=}")
+            self._spawn_worker(sock)
+
+        sock.close()
+        logger.info("Stopped prefork server.")
+        return exit_code
+
+    def _spawn_worker(self, sock: socket.socket) -> None:
+        pid = os.fork()
+        if pid != 0:
+            self.worker_pids.add(pid)
+            return
+
+        # Worker process: uvicorn installs its own signal handlers
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        exit_code = WORKER_STARTUP_FAILURE
+        try:
+            server = uvicorn.Server(uvicorn.Config(self.app, log_level=self.log_level, lifespan="on"))
+            server.run(sockets=[sock])
+            if server.started:
+                exit_code = 0
+        finally:
+            os._exit(exit_code)
+
+    def _handle_stop(self, signum: int, frame: FrameType | None) -> None:
+        logger.info(f"Stop prefork server. {signum=}")
+        self._stop_workers()
+
+    def _stop_workers(self) -> None:
+        self._stopping = True
+        for pid in self.worker_pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
@@ -1,23 +1,62 @@
-import json
+import argparse
 import logging
 import os
+import sys
 from collections.abc import AsyncGenerator
 from contextlib import asynccontextmanager
 from datetime import datetime
+from typing import Any
 
-import numpy as np
-import pandas as pd
 import uvicorn
 from fastapi import FastAPI, Request
 
 from mlops.aws import OnlineFeatureStoreDynamoDB, get_latest_model_version, get_model_s3_key
 from mlops.const import FEATURE_DYNAMODB_TABLE, MODEL_REGISTRY_DYNAMODB_TABLE
 from mlops.middleware import Artifact, set_logger_config
-from mlops.model import add_impression_time_feature, get_model_config
-from mlops.predictor import AdRequest
+from mlops.model import get_model_config
+from mlops.model.models.base_model import BaseModel
+from mlops.predictor import (
+    AdRequest,
+    CachedOnlineFeatureStore,
+    FeatureCache,
+    ModelReloader,
+    PredictionLogger,
+    PreforkServer,
+)
 
 logger = logging.getLogger(__name__)
 
+# Model loaded by the prefork server before forking workers, shared by the workers with copy-on-write
+preloaded_model: tuple[str, BaseModel] | None = None
+
+
+def resolve_model_version(model_name: str, model_version: str) -> str:
+    if model_version == "latest":
+        latest_model_version = get_latest_model_version(table=MODEL_REGISTRY_DYNAMODB_TABLE, model=model_name)
+        if latest_model_version is None:
+            raise ValueError("No latest model found")
+        model_version = latest_model_version
+    return model_version
+
+
+def load_model(model_name: str, version: str) -> BaseModel:
+    if preloaded_model is not None and preloaded_model[0] == version:
+        return preloaded_model[1]
+
+    model_s3_key = get_model_s3_key(table=MODEL_REGISTRY_DYNAMODB_TABLE, model=model_name, version=version)
+    if model_s3_key is None:
+        raise ValueError("Model S3 key not found")
+    model_config = get_model_config(model_name=model_name)
+    return model_config.model_class.from_pretrained(s3_key=model_s3_key)
+
+
+def preload_model() -> None:
+    global preloaded_model
+    model_name = os.getenv("MODEL_NAME", "sgd_classifier_ctr")
+    model_version = resolve_model_version(model_name, os.getenv("MODEL_VERSION", "latest"))
+    preloaded_model = (model_version, load_model(model_name, model_version))
+    logger.info(f"Preloaded model. {model_name=}, {model_version=}")
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI) -> AsyncGenerator:
@@ -30,80 +69,198 @@ async def lifespan(app: FastAPI) -> AsyncGenerator:
     model_name = os.getenv("MODEL_NAME", "sgd_classifier_ctr")
     model_version = os.getenv("MODEL_VERSION", "latest")
     feature_version = os.getenv("FEATURE_VERSION", "latest")
+    max_batch_size = int(os.getenv("PREDICT_MAX_BATCH_SIZE", "32"))
+    max_batch_wait_us = int(os.getenv("PREDICT_MAX_BATCH_WAIT_US", "1000"))
+    feature_store_max_connections = int(os.getenv("FEATURE_STORE_MAX_CONNECTIONS", "10"))
+    feature_store_timeout_ms = int(os.getenv("FEATURE_STORE_TIMEOUT_MS", "100"))
+    feature_cache_size = int(os.getenv("FEATURE_CACHE_SIZE", "100000"))
+    feature_cache_ttl_seconds = int(os.getenv("FEATURE_CACHE_TTL_SECONDS", "300"))
+    feature_version_refresh_seconds = int(os.getenv("FEATURE_VERSION_REFRESH_SECONDS", "60"))
+    prediction_log_queue_size = int(os.getenv("PREDICTION_LOG_QUEUE_SIZE", "10000"))
+    prediction_log_flush_size = int(os.getenv("PREDICTION_LOG_FLUSH_SIZE", "100"))
+    prediction_log_flush_interval_ms = int(os.getenv("PREDICTION_LOG_FLUSH_INTERVAL_MS", "200"))
+    prediction_log_overflow_policy = os.getenv("PREDICTION_LOG_OVERFLOW_POLICY", "drop")
+    prediction_log_sample_rate = float(os.getenv("PREDICTION_LOG_SAMPLE_RATE", "0.1"))
+    model_reload_interval_seconds = int(os.getenv("MODEL_RELOAD_INTERVAL_SECONDS", "0"))
     logger.info(f"Configure {model_name=}, {model_version=}, {feature_version=}")
+    logger.info(f"Configure {max_batch_size=}, {max_batch_wait_us=}")
+    logger.info(f"Configure {feature_store_max_connections=}, {feature_store_timeout_ms=}")
+    logger.info(f"Configure {feature_cache_size=}, {feature_cache_ttl_seconds=}, {feature_version_refresh_seconds=}")
+    logger.info(f"Configure {prediction_log_queue_size=}, {prediction_log_flush_size=}, {prediction_log_flush_interval_ms=}")
+    logger.info(f"Configure {prediction_log_overflow_policy=}, {prediction_log_sample_rate=}")
+    logger.info(f"Configure {model_reload_interval_seconds=}")
 
-    if model_version == "latest":
-        latest_model_version = get_latest_model_version(table=MODEL_REGISTRY_DYNAMODB_TABLE, model=model_name)
-        if latest_model_version is None:
-            raise ValueError("No latest model found")
-        model_version = latest_model_version
+    # New model versions are polled only when the latest version is served
+    if model_version != "latest" and model_reload_interval_seconds > 0:
+        logger.info(f"Model reload is disabled, since {model_version=} is pinned.")
+        model_reload_interval_seconds = 0
 
-    model_s3_key = get_model_s3_key(table=MODEL_REGISTRY_DYNAMODB_TABLE, model=model_name, version=model_version)
-    if model_s3_key is None:
-        raise ValueError("Model S3 key not found")
+    # Workers of the prefork server start with the model loaded before forking
+    if preloaded_model is not None:
+        model_version = preloaded_model[0]
+    model_version = resolve_model_version(model_name, model_version)
 
     model_config = get_model_config(model_name=model_name)
-    model = model_config.model_class.from_pretrained(s3_key=model_s3_key)
 
-    online_feature_store = OnlineFeatureStoreDynamoDB(table=FEATURE_DYNAMODB_TABLE, version=feature_version)
+    # Concurrent /predict requests are combined into a single model call by the batcher of the serving model
+    model_reloader = ModelReloader(
+        model_config=model_config,
+        load_model=lambda version: load_model(model_name, version),
+        get_latest_version=lambda: get_latest_model_version(table=MODEL_REGISTRY_DYNAMODB_TABLE, model=model_name),
+        max_batch_size=max_batch_size,
+        max_batch_wait_us=max_batch_wait_us,
+        poll_interval_seconds=model_reload_interval_seconds,
+    )
+    await model_reloader.start(version=model_version)
+
+    online_feature_store = CachedOnlineFeatureStore(
+        feature_store=OnlineFeatureStoreDynamoDB(
+            table=FEATURE_DYNAMODB_TABLE,
+            version=feature_version,
+            max_pool_connections=feature_store_max_connections,
+            timeout=feature_store_timeout_ms / 1000,
+        ),
+        cache=FeatureCache(max_size=feature_cache_size, ttl_seconds=feature_cache_ttl_seconds),
+        version_refresh_seconds=feature_version_refresh_seconds,
+    )
+
+    # Prediction logs are serialized and written to stdout in batches by a background task
+    prediction_logger = PredictionLogger(
+        queue_size=prediction_log_queue_size,
+        flush_size=prediction_log_flush_size,
+        flush_interval_ms=prediction_log_flush_interval_ms,
+        overflow_policy=prediction_log_overflow_policy,
+        sample_rate=prediction_log_sample_rate,
+    )
+    await prediction_logger.start()
 
-    def log_prediction(df: pd.DataFrame, prediction: float) -> None:
-        df = df.assign(
-            prediction=prediction,
-            model_name=model_name,
-            model_version=model_version,
-            feature_version=feature_version,
-            logged_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    async def log_prediction(record: dict[str, Any], prediction: float, model_version: str) -> None:
+        await prediction_logger.log(
+            record
+            | dict(
+                prediction=prediction,
+                model_name=model_name,
+                model_version=model_version,
+                feature_version=feature_version,
+                logged_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            )
         )
-        print(json.dumps(df.iloc[0].to_dict()))
 
     yield {
-        "model": model,
         "model_config": model_config,
+        "model_reloader": model_reloader,
         "online_feature_store": online_feature_store,
+        "prediction_logger": prediction_logger,
         "log_prediction": log_prediction,
     }
 
+    await model_reloader.stop()
+    await prediction_logger.stop()
+    online_feature_store.close()
+
 
 app = FastAPI(lifespan=lifespan)
 
 
 @app.post("/predict")
 async def predict(ad_request: AdRequest, request: Request) -> dict[str, str | float]:
-    df = pd.DataFrame([ad_request.model_dump()])
-
     # Get user feature from DynamoDB
-    user_feature = request.state.online_feature_store.get_impression_feature(user_id=ad_request.user_id)
-    df = df.assign(**user_feature)
+    user_feature = await request.state.online_feature_store.get_impression_feature_async(user_id=ad_request.user_id)
+
+    # The request is served by the same model until it finishes, even if the model is reloaded
+    with request.state.model_reloader.use() as serving_model:
+        # Add impression time features, fill missing values and convert data types
+        features = serving_model.feature_plan.transform(ad_request, user_feature)
+
+        # Get prediction together with concurrent requests
+        prediction = await serving_model.batcher.predict(features)
+
+    await request.state.log_prediction(serving_model.feature_plan.to_record(features), prediction, serving_model.version)
 
-    # Add impression time features
-    df = add_impression_time_feature(df, "logged_at")
+    return dict(
+        model=request.state.model_config.name,
+        prediction=prediction,
+    )
 
-    # Fill missing values and convert data types
-    for schema in request.state.model_config.schemas:
-        if schema.name not in df.columns:
-            df[schema.name] = np.nan
-        df[schema.name] = df[schema.name].fillna(schema.null_value)
-        df[schema.name] = df[schema.name].astype(schema.dtype)
-    df = df[[schema.name for schema in request.state.model_config.schemas]]
 
-    # Get prediction
-    prediction = request.state.model.predict_proba(df)
+@app.post("/predict/batch")
+async def predict_batch(ad_requests: list[AdRequest], request: Request) -> dict[str, str | list[dict[str, str | float]]]:
+    # Get user features of all unique users from DynamoDB at once
+    user_features = await request.state.online_feature_store.get_impression_features_async(
+        user_ids=[ad_request.user_id for ad_request in ad_requests]
+    )
 
-    request.state.log_prediction(df, float(prediction))
+    with request.state.model_reloader.use() as serving_model:
+        # Add impression time features, fill missing values and convert data types
+        feature_plan = serving_model.feature_plan
+        rows = [feature_plan.transform(ad_request, user_features[ad_request.user_id]) for ad_request in ad_requests]
+
+        # Get predictions with a single model call
+        predictions = []
+        if rows:
+            predictions = serving_model.model.predict_proba_online(feature_plan.to_model_input(rows)).tolist()
+
+    for features, prediction in zip(rows, predictions, strict=True):
+        await request.state.log_prediction(feature_plan.to_record(features), prediction, serving_model.version)
 
     return dict(
         model=request.state.model_config.name,
-        prediction=float(prediction),
+        predictions=[
+            dict(impression_id=ad_request.impression_id, prediction=prediction)
+            for ad_request, prediction in zip(ad_requests, predictions, strict=True)
+        ],
     )
 
 
+@app.get("/stats/batcher")
+async def batcher_stats(request: Request) -> dict[str, int | float]:
+    return request.state.model_reloader.current.batcher.stats.as_dict()
+
+
+@app.get("/stats/feature_cache")
+async def feature_cache_stats(request: Request) -> dict[str, int | str | None]:
+    return request.state.online_feature_store.stats_dict()
+
+
+@app.get("/stats/feature_store")
+async def feature_store_stats(request: Request) -> dict[str, int]:
+    return request.state.online_feature_store.feature_store.stats_dict()
+
+
+@app.get("/stats/prediction_logger")
+async def prediction_logger_stats(request: Request) -> dict[str, int]:
+    return request.state.prediction_logger.stats_dict()
+
+
+@app.get("/model")
+async def model_status(request: Request) -> dict[str, Any]:
+    return request.state.model_reloader.status_dict()
+
+
 @app.get("/healthcheck")
 async def healthcheck() -> dict[str, str]:
     return {"health": "ok"}
 
 
+def load_options() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Predictor arguments")
+    parser.add_argument("--prod", action="store_true", help="Serve with prefork workers instead of the dev server")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.environ["PREDICTOR_WORKERS"]) if "PREDICTOR_WORKERS" in os.environ else None,
+        help="Number of workers of --prod. Defaults to the number of available CPUs",
+    )
+    return parser.parse_args()
+
+
 def main() -> None:
+    args = load_options()
+    if args.prod:
+        # The model is loaded once before forking workers, so that it is not copied per worker
+        server = PreforkServer(app=app, host="0.0.0.0", port=8080, workers=args.workers, preload=preload_model)
+        sys.exit(server.run())
+
     uvicorn.run("predictor:app", host="0.0.0.0", port=8080, reload=True)
 
 
@@ -4,6 +4,10 @@ import logging
 import sys
 from dataclasses import asdict
 from datetime import datetime, timedelta
+from functools import partial
+from pathlib import Path
+
+import pandas as pd
 
 from mlops.aws import (
     get_latest_model_version,
@@ -11,11 +15,18 @@ from mlops.aws import (
     register_model_registry,
     run_task,
     upload_dir_to_s3,
-    upload_file_to_s3,
+    upload_files_to_s3,
+)
+from mlops.const import LOG_PARTITION_COLUMN, MODEL_REGISTRY_DYNAMODB_TABLE, MODEL_S3_BUCKET
+from mlops.data_loader import (
+    AthenaCache,
+    AthenaLoader,
+    BaseLoader,
+    ParquetLoader,
+    TableQuery,
+    extract_dataframes_in_parallel,
 )
-from mlops.const import MODEL_REGISTRY_DYNAMODB_TABLE, MODEL_S3_BUCKET
-from mlops.data_loader import compose_sql, extract_dataframe_from_athena
-from mlops.data_validator import IMPRESSION_LOG_SCHEMA, MST_ITEM_SCHEMA, VIEW_LOG_SCHEMA
+from mlops.data_validator import IMPRESSION_LOG_SCHEMA, MST_ITEM_SCHEMA, VIEW_LOG_SCHEMA, to_arrow_schema
 from mlops.evaluation import (
     calculate_metrics,
     is_model_better_than_baseline,
@@ -23,8 +34,18 @@ from mlops.evaluation import (
     plot_histgram,
     plot_roc_auc_curve,
 )
-from mlops.middleware import Artifact, set_logger_config
-from mlops.model import MetaDeta, apply_preprocess, apply_schema, apply_train_test_split, get_model_config
+from mlops.middleware import FILE_FORMATS, Artifact, save_dataframe, set_logger_config
+from mlops.model import (
+    MetaDeta,
+    add_impression_time_feature,
+    apply_date_split,
+    apply_preprocess,
+    apply_schema,
+    apply_train_test_split,
+    get_model_config,
+    get_source_columns,
+    iter_impression_feature,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -42,6 +63,50 @@ def load_options() -> argparse.Namespace:
     parser.add_argument("--ecs", action="store_true")
     parser.add_argument("--cpu", type=int, default=None)
     parser.add_argument("--memory", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=1, help="Number of processes of the preprocess sharded by user_id")
+    parser.add_argument(
+        "--dtype_backend",
+        type=str,
+        default="numpy_nullable",
+        choices=["numpy_nullable", "pyarrow"],
+        help="Dtypes of the loaded data, pyarrow keeps strings columnar until apply_schema",
+    )
+    parser.add_argument(
+        "--split",
+        type=str,
+        default="ratio",
+        choices=["ratio", "date"],
+        help="Split valid and test by the ratio of rows, or by the dates before to_datetime",
+    )
+    parser.add_argument("--cache", action="store_true", help="Reuse results of the same Athena queries of the day")
+    parser.add_argument(
+        "--cache_token",
+        type=str,
+        default=None,
+        help="Freshness token of the Athena cache, e.g. the latest partition, the date of the run by default",
+    )
+    parser.add_argument(
+        "--chunk_days",
+        type=int,
+        default=0,
+        help="Read logs and preprocess them in chunks of the days to bound the memory, 0 reads the whole period at once",
+    )
+    parser.add_argument("--max_queries", type=int, default=3, help="Number of Athena queries running at the same time")
+    parser.add_argument(
+        "--data_source",
+        type=str,
+        default="athena",
+        choices=["athena", "parquet"],
+        help="Read the tables from Athena, or from local Parquet files in data_dir",
+    )
+    parser.add_argument("--data_dir", type=Path, default=Path("data"), help="Directory of the tables of the parquet source")
+    parser.add_argument(
+        "--artifact_format",
+        type=str,
+        default="parquet",
+        choices=FILE_FORMATS,
+        help="File format of the preprocessed and split data, csv for the readers of the previous versions",
+    )
 
     return parser.parse_args()
 
@@ -67,45 +132,104 @@ def main() -> None:
     logger.info(f"{artifact=}, {args=}, {vars(model_config)=}")
 
     # -----------------------------
-    # Extract Data
+    # Compose Queries
     # -----------------------------
     if args.to_datetime is None:
         to_datetime = current_time
     else:
         to_datetime = args.to_datetime
 
-    sql_impression_log = compose_sql(
+    loader: BaseLoader
+    if args.data_source == "parquet":
+        loader = ParquetLoader(root_dir=args.data_dir, dtype_backend=args.dtype_backend)
+    else:
+        loader = AthenaLoader(
+            athena_cache=AthenaCache(s3_bucket=MODEL_S3_BUCKET or None, enabled=args.cache),
+            freshness_token=args.cache_token or current_time.strftime("%Y-%m-%d"),
+            dtype_backend=args.dtype_backend,
+            partition_column=LOG_PARTITION_COLUMN or None,
+            s3_output=f"s3://{MODEL_S3_BUCKET}/athena_unload" if MODEL_S3_BUCKET else None,
+        )
+    # Only the columns of the source tables which the preprocess and the model use are read and validated
+    output_columns = model_config.feature_columns + [model_config.target]
+    schemas = [
+        schema.select_columns(get_source_columns(list(schema.columns), output_columns))
+        for schema in [IMPRESSION_LOG_SCHEMA, VIEW_LOG_SCHEMA, MST_ITEM_SCHEMA]
+    ]
+    if args.dtype_backend == "pyarrow":
+        schemas = [to_arrow_schema(schema) for schema in schemas]
+    impression_log_schema, view_log_schema, mst_item_schema = schemas
+
+    query_impression_log = TableQuery(
         table=IMPRESSION_LOG_SCHEMA.name,
         from_datetime=to_datetime - timedelta(days=model_config.train_interval_days),
         to_datetime=to_datetime,
+        columns=list(impression_log_schema.columns),
     )
-    df_impression_log = extract_dataframe_from_athena(sql=sql_impression_log)
-
-    sql_view_log = compose_sql(
+    query_view_log = TableQuery(
         table=VIEW_LOG_SCHEMA.name,
         from_datetime=to_datetime - timedelta(days=model_config.train_interval_days + model_config.lookback_days),
         to_datetime=to_datetime,
+        columns=list(view_log_schema.columns),
     )
-    df_view_log = extract_dataframe_from_athena(sql=sql_view_log)
-
-    sql_mst_item = compose_sql(
+    query_mst_item = TableQuery(
         table=MST_ITEM_SCHEMA.name,
+        columns=list(mst_item_schema.columns),
     )
-    df_item = extract_dataframe_from_athena(sql=sql_mst_item)
+    queries = [query_mst_item]
+    if args.chunk_days == 0:
+        queries += [query_impression_log, query_view_log]
 
     # -----------------------------
-    # Validate Data
+    # Extract and Validate Data
     # -----------------------------
-    df_impression_log = IMPRESSION_LOG_SCHEMA.validate(df_impression_log)
-    df_view_log = VIEW_LOG_SCHEMA.validate(df_view_log)
-    df_item = MST_ITEM_SCHEMA.validate(df_item)
+    # Queries run concurrently, and each table is validated as soon as it is extracted
+    schema_by_table = {schema.name: schema for schema in schemas}
+    dfs = {}
+    for table, df in extract_dataframes_in_parallel(
+        {query.table: partial(loader.extract, query) for query in queries}, max_workers=args.max_queries
+    ):
+        dfs[table] = schema_by_table[table].validate(df)
+    logger.info(f"Extracted data. {loader.stats_dict()=}")
+    df_item = dfs[MST_ITEM_SCHEMA.name]
+    if args.chunk_days == 0:
+        df_impression_log, df_view_log = dfs[IMPRESSION_LOG_SCHEMA.name], dfs[VIEW_LOG_SCHEMA.name]
 
     # -----------------------------
     # Preprocess Data
     # -----------------------------
-    df_preprocessed = apply_preprocess(df_impression_log, df_view_log, df_item, model_config.lookback_days)
+    if args.chunk_days > 0:
+        # Logs are read, validated and preprocessed chunk by chunk, so that only the preprocessed data of the whole
+        # period is in memory. The uniqueness of impression_id is only checked in each chunk.
+        chunk_interval = timedelta(days=args.chunk_days)
+        impression_log_chunks = loader.extract_chunks(query_impression_log, chunk_interval=chunk_interval)
+        view_log_chunks = loader.extract_chunks(query_view_log, chunk_interval=chunk_interval)
+        feature_chunks = iter_impression_feature(
+            impression_log_chunks=((chunk_to, impression_log_schema.validate(df)) for chunk_to, df in impression_log_chunks),
+            view_log_chunks=((chunk_to, view_log_schema.validate(df)) for chunk_to, df in view_log_chunks),
+            df_item=df_item,
+            lookback_days=model_config.lookback_days,
+            workers=args.workers,
+        )
+        df_preprocessed = pd.concat(
+            [
+                apply_schema(df=add_impression_time_feature(df_feature, "logged_at"), schemas=model_config.schemas)
+                for df_feature, _ in feature_chunks
+            ],
+            ignore_index=True,
+        )
+    else:
+        df_preprocessed = apply_preprocess(
+            df_impression_log, df_view_log, df_item, model_config.lookback_days, workers=args.workers
+        )
+    # Categories of chunks differ unless they are fixed in the schema, so that the schema is applied to the whole data
     df_preprocessed = apply_schema(df=df_preprocessed, schemas=model_config.schemas)
-    df_train, df_valid, df_test = apply_train_test_split(df=df_preprocessed, **model_config.test_valid_ratio)
+    if args.split == "date":
+        df_train, df_valid, df_test = apply_date_split(
+            df=df_preprocessed, to_datetime=to_datetime, **model_config.split_interval_days
+        )
+    else:
+        df_train, df_valid, df_test = apply_train_test_split(df=df_preprocessed, **model_config.test_valid_ratio)
 
     # -----------------------------
     # Train Model
@@ -181,19 +305,21 @@ def main() -> None:
 
     # Save data artifacts
     ## Save raw data schema
-    for schema, sql in zip(
+    for schema, query in zip(
         [IMPRESSION_LOG_SCHEMA, VIEW_LOG_SCHEMA, MST_ITEM_SCHEMA],
-        [sql_impression_log, sql_view_log, sql_mst_item],
+        [query_impression_log, query_view_log, query_mst_item],
         strict=False,
     ):
         schema_json = json.loads(schema.to_json())
         schema_json["version"] = version
-        schema_json["sql"] = sql
+        schema_json["sql"] = loader.describe(query)
         with open(artifact.file_path(f"{schema.name}.json"), "w") as f:
             json.dump(schema_json, f)
 
     ## Save preprocessed data
-    df_preprocessed.to_csv(artifact.file_path("df_preprocessed.csv"), index=False)
+    save_dataframe(
+        df_preprocessed, artifact.file_path(f"df_preprocessed.{args.artifact_format}"), file_format=args.artifact_format
+    )
 
     # Save model
     model.save(artifact.file_path("model.pkl"))
@@ -211,17 +337,16 @@ def main() -> None:
         s3_bucket=MODEL_S3_BUCKET,
         dir_path=artifact.dir_path,
         key_prefix=artifact.key_prefix,
-    )
+    ).raise_for_failures()
 
     # Upload split data to S3
+    split_files = {}
     for data_type, _df in {"train": df_train, "valid": df_valid, "test": df_test}.items():
-        _df.to_csv(artifact.file_path(f"{data_type}.csv"), index=False)
+        file_name = f"{data_type}.{args.artifact_format}"
+        save_dataframe(_df, artifact.file_path(file_name), file_format=args.artifact_format)
         partition = f"model_name={model_config.name}/model_version={version}/data_type={data_type}"
-        upload_file_to_s3(
-            s3_bucket=MODEL_S3_BUCKET,
-            file_path=artifact.file_path(f"{data_type}.csv"),
-            s3_key=f"train_log/{partition}/{data_type}.csv",
-        )
+        split_files[artifact.file_path(file_name)] = f"train_log/{partition}/{file_name}"
+    upload_files_to_s3(s3_bucket=MODEL_S3_BUCKET, files=split_files).raise_for_failures()
 
     # -----------------------------
     # Register Model Registry
@@ -238,6 +363,9 @@ def main() -> None:
                     "lookback_days": model_config.lookback_days,
                     "train_interval_days": model_config.train_interval_days,
                     "test_valid_ratio": model_config.test_valid_ratio,
+                    "split_interval_days": model_config.split_interval_days,
+                    "split": args.split,
+                    "split_row_count": {"train": len(df_train), "valid": len(df_valid), "test": len(df_test)},
                     "to_datetime": to_datetime,
                 },
                 "model_parameter": vars(model_config.model_class),
@@ -11,7 +11,7 @@ from mlops.aws import (
     register_model_registry,
     run_task,
     upload_dir_to_s3,
-    upload_file_to_s3,
+    upload_files_to_s3,
 )
 from mlops.const import MODEL_REGISTRY_DYNAMODB_TABLE, MODEL_S3_BUCKET
 from mlops.data_loader import compose_sql, extract_dataframe_from_athena
@@ -22,7 +22,7 @@ from mlops.evaluation import (
     plot_histgram,
     plot_roc_auc_curve,
 )
-from mlops.middleware import Artifact, set_logger_config
+from mlops.middleware import FILE_FORMATS, Artifact, save_dataframe, set_logger_config
 from mlops.model import (
     MetaDeta,
     add_impression_time_feature,
@@ -41,6 +41,13 @@ def load_options() -> argparse.Namespace:
     parser.add_argument("--ecs", action="store_true")
     parser.add_argument("--cpu", type=int, default=1024)
     parser.add_argument("--memory", type=int, default=2048)
+    parser.add_argument(
+        "--artifact_format",
+        type=str,
+        default="parquet",
+        choices=FILE_FORMATS,
+        help="File format of the preprocessed and split data, csv for the readers of the previous versions",
+    )
 
     return parser.parse_args()
 
@@ -150,7 +157,9 @@ def main() -> None:
 
     # Save data artifacts
     ## Save preprocessed data
-    df_preprocessed.to_csv(artifact.file_path("df_preprocessed.csv"), index=False)
+    save_dataframe(
+        df_preprocessed, artifact.file_path(f"df_preprocessed.{args.artifact_format}"), file_format=args.artifact_format
+    )
 
     # Save model
     model.save(artifact.file_path("model.pkl"))
@@ -168,17 +177,16 @@ def main() -> None:
         s3_bucket=MODEL_S3_BUCKET,
         dir_path=artifact.dir_path,
         key_prefix=artifact.key_prefix,
-    )
+    ).raise_for_failures()
 
     # Upload split data to S3
+    split_files = {}
     for data_type, _df in {"train": df_train, "valid": df_valid, "test": df_test}.items():
-        _df.to_csv(artifact.file_path(f"df_{data_type}.csv"), index=False)
+        file_name = f"df_{data_type}.{args.artifact_format}"
+        save_dataframe(_df, artifact.file_path(file_name), file_format=args.artifact_format)
         partition = f"model_name={model_config.name}/model_version={version}/data_type={data_type}"
-        upload_file_to_s3(
-            s3_bucket=MODEL_S3_BUCKET,
-            file_path=artifact.file_path(f"df_{data_type}.csv"),
-            s3_key=f"train_log/{partition}/df_{data_type}.csv",
-        )
+        split_files[artifact.file_path(file_name)] = f"train_log/{partition}/{file_name}"
+    upload_files_to_s3(s3_bucket=MODEL_S3_BUCKET, files=split_files).raise_for_failures()
 
     # -----------------------------
     # Register Model Registry
@@ -1,10 +1,21 @@
+import asyncio
 import os
+import time
 
 import boto3
 import pytest
+from botocore.exceptions import ReadTimeoutError
 from moto import mock_aws
 
-from mlops.aws import OnlineFeatureStoreDynamoDB, get_latest_model_version
+from mlops.aws import (
+    OnlineFeatureStoreDynamoDB,
+    S3Uploader,
+    controller,
+    get_latest_model_version,
+    put_latest_feature_version,
+    upload_dir_to_s3,
+    upload_file_to_s3,
+)
 
 
 @pytest.fixture(autouse=True)
@@ -101,3 +112,321 @@ def test_online_feature_store_dynamodb_specific_version():
     assert features["version"] == "1"
     assert features["feature1"] == "value1"
     assert features["feature2"] == "42"
+
+
+def create_feature_store_table(client, table_name):
+    client.create_table(
+        TableName=table_name,
+        KeySchema=[{"AttributeName": "user_id", "KeyType": "HASH"}, {"AttributeName": "version", "KeyType": "RANGE"}],
+        AttributeDefinitions=[
+            {"AttributeName": "user_id", "AttributeType": "N"},
+            {"AttributeName": "version", "AttributeType": "N"},
+        ],
+        ProvisionedThroughput={"ReadCapacityUnits": 5, "WriteCapacityUnits": 5},
+    )
+    for user_id in range(150):
+        for version in ["1", "2"]:
+            client.put_item(
+                TableName=table_name,
+                Item={
+                    "user_id": {"N": str(user_id)},
+                    "version": {"N": version},
+                    "feature1": {"S": f"value{version}"},
+                    "feature2": {"N": str(user_id)},
+                },
+            )
+
+
+@mock_aws
+def test_online_feature_store_dynamodb_get_impression_features_specific_version():
+    client = boto3.client("dynamodb", region_name="ap-northeast-1")
+    table_name = "test_feature_store"
+    create_feature_store_table(client, table_name)
+
+    feature_store = OnlineFeatureStoreDynamoDB(table_name, 1)
+
+    # More unique users than a single BatchGetItem request accepts, with duplicated and unknown users
+    user_ids = list(range(120)) + [3, 3, 999]
+    features = feature_store.get_impression_features(user_ids)
+
+    assert list(features) == list(dict.fromkeys(user_ids))
+    assert features[3] == {"user_id": "3", "version": "1", "feature1": "value1", "feature2": "3"}
+    assert features[119]["feature2"] == "119"
+    assert features[999] == {}
+    for user_id in [0, 50, 119]:
+        assert features[user_id] == feature_store.get_impression_feature(user_id)
+
+
+@mock_aws
+def test_online_feature_store_dynamodb_get_impression_features_latest_version():
+    client = boto3.client("dynamodb", region_name="ap-northeast-1")
+    table_name = "test_feature_store"
+    create_feature_store_table(client, table_name)
+
+    feature_store = OnlineFeatureStoreDynamoDB(table_name, "latest")
+
+    features = feature_store.get_impression_features([1, 2, 1, 999])
+
+    assert list(features) == [1, 2, 999]
+    assert features[1] == {"user_id": "1", "version": "2", "feature1": "value2", "feature2": "1"}
+    assert features[999] == {}
+
+
+@mock_aws
+def test_online_feature_store_dynamodb_get_impression_feature_async():
+    client = boto3.client("dynamodb", region_name="ap-northeast-1")
+    table_name = "test_feature_store"
+    create_feature_store_table(client, table_name)
+
+    feature_store = OnlineFeatureStoreDynamoDB(table_name, "latest", max_pool_connections=4)
+
+    async def get_features():
+        return await asyncio.gather(*[feature_store.get_impression_feature_async(user_id) for user_id in [1, 2, 999]])
+
+    features = asyncio.run(get_features())
+    feature_store.close()
+
+    assert features[0] == {"user_id": "1", "version": "2", "feature1": "value2", "feature2": "1"}
+    assert features[1]["feature2"] == "2"
+    assert features[2] == {}
+
+
+@mock_aws
+@pytest.mark.parametrize("version", ["latest", 1])
+def test_online_feature_store_dynamodb_get_impression_features_async(version):
+    client = boto3.client("dynamodb", region_name="ap-northeast-1")
+    table_name = "test_feature_store"
+    create_feature_store_table(client, table_name)
+
+    feature_store = OnlineFeatureStoreDynamoDB(table_name, version)
+
+    user_ids = [1, 2, 1, 999]
+    features = asyncio.run(feature_store.get_impression_features_async(user_ids))
+
+    assert features == feature_store.get_impression_features(user_ids)
+    feature_store.close()
+
+
+def test_online_feature_store_dynamodb_async_does_not_block_event_loop(monkeypatch):
+    feature_store = OnlineFeatureStoreDynamoDB("test_feature_store", "latest", max_pool_connections=4)
+
+    def slow_get_impression_feature(user_id):
+        time.sleep(0.2)
+        return {"user_id": str(user_id)}
+
+    monkeypatch.setattr(feature_store, "_get_impression_feature", slow_get_impression_feature)
+
+    async def get_features():
+        start_time = time.perf_counter()
+        features = await asyncio.gather(*[feature_store.get_impression_feature_async(user_id) for user_id in range(4)])
+        return features, time.perf_counter() - start_time
+
+    features, elapsed_time = asyncio.run(get_features())
+    feature_store.close()
+
+    assert features == [{"user_id": str(user_id)} for user_id in range(4)]
+    assert elapsed_time < 0.6
+
+
+def test_online_feature_store_dynamodb_async_timeout(monkeypatch):
+    feature_store = OnlineFeatureStoreDynamoDB("test_feature_store", 1, timeout=0.05)
+
+    def slow_get(*args):
+        time.sleep(0.3)
+        return {"user_id": "1"}
+
+    monkeypatch.setattr(feature_store, "_get_impression_feature", slow_get)
+    monkeypatch.setattr(feature_store, "_get_impression_features", slow_get)
+
+    assert asyncio.run(feature_store.get_impression_feature_async(1)) == {}
+    assert asyncio.run(feature_store.get_impression_features_async([1, 2])) == {1: {}, 2: {}}
+    assert asyncio.run(feature_store.get_impression_feature_async(1, timeout=1)) == {"user_id": "1"}
+    assert feature_store.stats_dict() == {"timeouts": 2, "errors": 0}
+    feature_store.close()
+
+
+@pytest.mark.parametrize("version", ["latest", 1])
+def test_online_feature_store_dynamodb_async_timeout_counted_once(monkeypatch, version):
+    feature_store = OnlineFeatureStoreDynamoDB("test_feature_store", version, timeout=0.05)
+
+    # The client aborts the request after the caller has given up on it
+    def make_request(operation_name, kwargs):
+        time.sleep(0.2)
+        raise ReadTimeoutError(endpoint_url="http://localhost")
+
+    monkeypatch.setattr(feature_store.client, "_make_api_call", make_request)
+
+    assert asyncio.run(feature_store.get_impression_features_async([1])) == {1: {}}
+    feature_store.executor.shutdown(wait=True)
+    assert feature_store.stats_dict() == {"timeouts": 1, "errors": 0}
+
+
+def test_online_feature_store_dynamodb_client_timeout():
+    feature_store = OnlineFeatureStoreDynamoDB("test_feature_store", 1, timeout=0.1, max_attempts=3)
+
+    # Requests are aborted by the client within the timeout of the caller
+    config = feature_store.client.meta.config
+    assert (config.connect_timeout, config.read_timeout) == (0.1, 0.1)
+    assert config.retries == {"mode": "standard", "total_max_attempts": 3}
+    feature_store.close()
+
+
+@mock_aws
+def test_online_feature_store_dynamodb_counts_errors():
+    # The table does not exist
+    feature_store = OnlineFeatureStoreDynamoDB("test_feature_store", 1)
+
+    assert feature_store.get_impression_feature(1) == {}
+    assert feature_store.get_impression_features([1, 2]) == {1: {}, 2: {}}
+    assert feature_store.stats_dict() == {"timeouts": 0, "errors": 2}
+    feature_store.close()
+
+
+@mock_aws
+@pytest.mark.parametrize("version", ["latest", 1])
+def test_online_feature_store_dynamodb_get_latest_feature_version_async(version):
+    client = boto3.client("dynamodb", region_name="ap-northeast-1")
+    table_name = "test_feature_store"
+    create_feature_store_table(client, table_name)
+
+    feature_store = OnlineFeatureStoreDynamoDB(table_name, version)
+    assert asyncio.run(feature_store.get_latest_feature_version_async()) is None
+
+    put_latest_feature_version(table_name=table_name, version="20250614130717")
+    put_latest_feature_version(table_name=table_name, version="20250615130717")
+
+    if version == "latest":
+        assert asyncio.run(feature_store.get_latest_feature_version_async()) == "20250615130717"
+    else:
+        # The version marker is read with the configured version as every other user
+        assert asyncio.run(feature_store.get_latest_feature_version_async()) is None
+    feature_store.close()
+
+
+def create_files(dir_path, file_sizes):
+    file_paths = []
+    for i, file_size in enumerate(file_sizes):
+        file_path = dir_path / f"part-{i}" / f"file-{i}.bin"
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        file_path.write_bytes(os.urandom(file_size))
+        file_paths.append(file_path)
+    return file_paths
+
+
+@mock_aws
+def test_upload_dir_to_s3(tmp_path, monkeypatch):
+    # The shared uploader is created in the mock
+    monkeypatch.setattr(controller, "_s3_uploader", None)
+    client = boto3.client("s3", region_name="ap-northeast-1")
+    client.create_bucket(Bucket="test-bucket", CreateBucketConfiguration={"LocationConstraint": "ap-northeast-1"})
+    file_paths = create_files(tmp_path, [10, 2000, 0])
+
+    summary = upload_dir_to_s3(dir_path=tmp_path, s3_bucket="test-bucket", key_prefix="train/20250101")
+
+    assert summary.is_succeeded
+    assert (summary.n_files, summary.n_bytes, summary.retry_count) == (3, 2010, 0)
+    for file_path in file_paths:
+        s3_key = f"train/20250101/{file_path.relative_to(tmp_path)}"
+        assert client.get_object(Bucket="test-bucket", Key=s3_key)["Body"].read() == file_path.read_bytes()
+    # The client and its connections are reused between calls
+    assert controller.get_s3_uploader() is controller.get_s3_uploader()
+
+
+@mock_aws
+def test_upload_file_to_s3_failure(tmp_path, monkeypatch):
+    monkeypatch.setattr(controller, "_s3_uploader", S3Uploader(backoff_seconds=0))
+    (file_path,) = create_files(tmp_path, [10])
+
+    summary = upload_file_to_s3(s3_bucket="missing-bucket", file_path=file_path, s3_key="file.bin")
+
+    # Failures are returned instead of only logged
+    assert not summary.is_succeeded
+    assert list(summary.failures) == [str(file_path)]
+    assert (summary.n_files, summary.retry_count) == (0, 2)
+    with pytest.raises(RuntimeError, match="Failed to upload files to S3"):
+        summary.raise_for_failures()
+
+
+def test_get_s3_uploader_after_fork(monkeypatch):
+    monkeypatch.setattr(controller, "_s3_uploader", None)
+    s3_uploader = controller.get_s3_uploader()
+
+    pid = os.fork()
+    if pid == 0:
+        # The worker creates its own uploader instead of the one of the parent
+        os._exit(0 if controller._s3_uploader is None and controller.get_s3_uploader() is not s3_uploader else 1)
+    _, status = os.waitpid(pid, 0)
+
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert controller.get_s3_uploader() is s3_uploader
+    s3_uploader.close()
+
+
+@mock_aws
+def test_s3_uploader_retry(tmp_path):
+    client = boto3.client("s3", region_name="ap-northeast-1")
+    client.create_bucket(Bucket="test-bucket", CreateBucketConfiguration={"LocationConstraint": "ap-northeast-1"})
+    file_paths = create_files(tmp_path, [10, 20])
+    uploader = S3Uploader(backoff_seconds=0)
+    upload = uploader.transfer_manager.upload
+    s3_keys = []
+
+    def flaky_upload(file_path, s3_bucket, s3_key, extra_args=None):
+        s3_keys.append(s3_key)
+        # The first attempt of the second file fails
+        return upload(file_path, "missing-bucket" if s3_keys == ["a", "b"] else s3_bucket, s3_key, extra_args=extra_args)
+
+    uploader.transfer_manager.upload = flaky_upload
+    summary = uploader.upload_files("test-bucket", {file_paths[0]: "a", file_paths[1]: "b"})
+    uploader.close()
+
+    assert summary.is_succeeded
+    assert (summary.n_files, summary.n_bytes, summary.retry_count) == (2, 30, 1)
+    assert s3_keys == ["a", "b", "b"]
+    assert client.get_object(Bucket="test-bucket", Key="b")["Body"].read() == file_paths[1].read_bytes()
+
+
+@mock_aws
+def test_s3_uploader_multipart(tmp_path):
+    client = boto3.client("s3", region_name="ap-northeast-1")
+    client.create_bucket(Bucket="test-bucket", CreateBucketConfiguration={"LocationConstraint": "ap-northeast-1"})
+    (file_path,) = create_files(tmp_path, [12 * 1024**2])
+    uploader = S3Uploader(multipart_threshold=5 * 1024**2, multipart_chunksize=5 * 1024**2)
+
+    summary = uploader.upload_files("test-bucket", {file_path: "model.pkl"})
+    uploader.close()
+
+    assert summary.is_succeeded
+    response = client.get_object(Bucket="test-bucket", Key="model.pkl")
+    # ETag of a multipart upload ends with the number of parts
+    assert response["ETag"].strip('"').endswith("-3")
+    assert response["Body"].read() == file_path.read_bytes()
+
+
+@mock_aws
+@pytest.mark.benchmark
+def test_benchmark_s3_uploader(tmp_path):
+    client = boto3.client("s3", region_name="ap-northeast-1")
+    client.create_bucket(Bucket="test-bucket", CreateBucketConfiguration={"LocationConstraint": "ap-northeast-1"})
+    file_paths = create_files(tmp_path, [1024**2] * 32)
+    files = {file_path: f"sequential/{file_path.name}" for file_path in file_paths}
+
+    def add_latency(s3_client):
+        # Round trip time of a request to S3, which moto does not have
+        s3_client.meta.events.register("before-send.s3", lambda **kwargs: time.sleep(0.03))
+        return s3_client
+
+    results = {}
+    # Previous upload_dir_to_s3, one file at a time with a new client
+    start = time.perf_counter()
+    for file_path, s3_key in files.items():
+        add_latency(boto3.client("s3")).upload_file(str(file_path), "test-bucket", s3_key)
+    results["sequential"] = f"{time.perf_counter() - start:.3f}s"
+
+    for max_concurrency in [4, 10]:
+        uploader = S3Uploader(max_concurrency=max_concurrency)
+        add_latency(uploader.client)
+        summary = uploader.upload_files("test-bucket", {file_path: f"pooled/{file_path.name}" for file_path in file_paths})
+        uploader.close()
+        results[f"{max_concurrency=}"] = f"{summary.duration_seconds:.3f}s, {summary.stats_dict()['mib_per_second']}MiB/s"
+    print("\n" + ", ".join(f"{name}={result}" for name, result in results.items()))
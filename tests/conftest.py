@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from mlops.model import LightGBMModel, SGDClassifierModel, apply_schema, get_model_config
+
+
+def _create_train_data(model_name, n_rows=200, seed=42):
+    rng = np.random.default_rng(seed)
+    model_config = get_model_config(model_name)
+    df = pd.DataFrame(
+        {
+            "impression_hour": rng.integers(0, 24, n_rows),
+            "impression_day": rng.integers(1, 32, n_rows),
+            "impression_weekday": rng.integers(0, 7, n_rows),
+            "user_id": rng.choice([87862, 16998, 1, 2, 3], n_rows),
+            "app_code": rng.choice([127, 190, 3], n_rows),
+            "os_version": rng.choice(["old", "latest", "intermediate"], n_rows),
+            "is_4g": rng.integers(0, 2, n_rows),
+            "previous_impression_count": rng.choice([np.nan, 1, 2, 3], n_rows),
+            "previous_view_count": rng.choice([np.nan, 1, 5], n_rows),
+            "item_id": rng.choice([np.nan, 43886, 100], n_rows),
+            "device_type": rng.choice([None, "android", "iphone", "web"], n_rows),
+            "item_price": rng.choice([np.nan, 1180, 5000], n_rows),
+            "category_1": rng.choice([np.nan, 10, 11], n_rows),
+            "category_2": rng.choice([np.nan, 68, 1], n_rows),
+            "category_3": rng.choice([np.nan, 1, 2], n_rows),
+            "product_type": rng.choice([np.nan, 2196, 7], n_rows),
+            "is_click": rng.integers(0, 2, n_rows),
+        }
+    )
+    df = apply_schema(df, model_config.schemas)
+    return df[model_config.feature_columns], df[model_config.target]
+
+
+@pytest.fixture(scope="session")
+def create_train_data():
+    return _create_train_data
+
+
+@pytest.fixture(scope="session")
+def sgd_classifier_model():
+    X, y = _create_train_data("sgd_classifier_ctr")
+    model = SGDClassifierModel(is_optuna=False, args={"loss": "log_loss", "random_state": 42})
+    model.train(X, y, X, y)
+    return model
+
+
+@pytest.fixture(scope="session")
+def lightgbm_model():
+    X, y = _create_train_data("lightgbm_ctr")
+    model = LightGBMModel(args={"num_leaves": 7, "min_data_in_leaf": 5, "verbose": -1})
+    model.train(X, y, X, y)
+    return model
@@ -0,0 +1,161 @@
+import os
+import threading
+import time
+from datetime import timedelta
+
+import boto3
+import pandas as pd
+import pytest
+from moto import mock_aws
+from pandas.testing import assert_frame_equal
+
+from mlops.data_loader import AthenaCache
+
+
+@pytest.fixture(autouse=True)
+def aws_credentials():
+    os.environ["AWS_DEFAULT_REGION"] = "ap-northeast-1"
+    os.environ["AWS_ACCESS_KEY_ID"] = "testing"
+    os.environ["AWS_SECRET_ACCESS_KEY"] = "testing"
+    yield
+
+
+class StubLoader:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, sql, database, **kwargs):
+        self.calls.append(sql)
+        return pd.DataFrame({"impression_id": ["a", "b", None], "user_id": [1, 2, 3], "sql": sql})
+
+
+def test_extract_hit_and_miss(tmp_path):
+    athena_cache = AthenaCache(cache_dir=tmp_path, enabled=True)
+    loader = StubLoader()
+
+    df_miss = athena_cache.extract("SELECT * FROM impression_log", loader=loader)
+    df_hit = athena_cache.extract("SELECT * FROM impression_log", loader=loader)
+
+    assert loader.calls == ["SELECT * FROM impression_log"]
+    assert_frame_equal(df_hit, df_miss)
+    assert athena_cache.stats_dict() == {
+        "hit_count": 1,
+        "s3_hit_count": 0,
+        "miss_count": 1,
+        "expired_count": 0,
+        "evicted_count": 0,
+    }
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {"sql": "SELECT * FROM view_log"},
+        {"database": "another_db"},
+        {"freshness_token": "2018-12-11"},
+        {"dtype_backend": "pyarrow"},
+    ],
+)
+def test_extract_miss_with_different_key(tmp_path, kwargs):
+    athena_cache = AthenaCache(cache_dir=tmp_path, enabled=True)
+    loader = StubLoader()
+    athena_cache.extract("SELECT * FROM impression_log", database="mlops_db", loader=loader)
+
+    athena_cache.extract(**{"sql": "SELECT * FROM impression_log", "database": "mlops_db"} | kwargs, loader=loader)
+
+    assert len(loader.calls) == 2
+
+
+def test_extract_without_cache(tmp_path):
+    athena_cache = AthenaCache(cache_dir=tmp_path)
+    loader = StubLoader()
+
+    athena_cache.extract("SELECT * FROM impression_log", loader=loader)
+    athena_cache.extract("SELECT * FROM impression_log", loader=loader)
+
+    assert len(loader.calls) == 2
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_extract_expired(tmp_path):
+    athena_cache = AthenaCache(cache_dir=tmp_path, max_age=timedelta(hours=1), enabled=True)
+    loader = StubLoader()
+    athena_cache.extract("SELECT * FROM mst_item", loader=loader)
+    file_path = athena_cache.file_path(athena_cache.get_key("SELECT * FROM mst_item", "mlops_db"))
+    created_at = time.time() - 2 * 3600
+    os.utime(file_path, (created_at, created_at))
+
+    athena_cache.extract("SELECT * FROM mst_item", loader=loader)
+    # Hits do not extend the age of the result
+    athena_cache.extract("SELECT * FROM mst_item", loader=loader)
+
+    assert len(loader.calls) == 2
+    assert (athena_cache.stats.expired_count, athena_cache.stats.hit_count) == (1, 1)
+    assert file_path.stat().st_mtime > created_at
+
+
+def test_extract_counts_in_threads(tmp_path):
+    athena_cache = AthenaCache(cache_dir=tmp_path, enabled=True)
+    loader = StubLoader()
+    athena_cache.extract("SELECT 1", loader=loader)
+
+    threads = [threading.Thread(target=athena_cache.extract, args=("SELECT 1",), kwargs={"loader": loader}) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert athena_cache.stats.hit_count == 8
+
+
+def test_evict_least_recently_used(tmp_path):
+    loader = StubLoader()
+    athena_cache = AthenaCache(cache_dir=tmp_path, enabled=True)
+    athena_cache.extract("SELECT 1", loader=loader)
+    file_size = next(tmp_path.glob("*.parquet")).stat().st_size
+    athena_cache.max_size_bytes = file_size * 2
+    athena_cache.extract("SELECT 2", loader=loader)
+    # Access times are in order of SELECT 2, SELECT 1
+    file_path = athena_cache.file_path(athena_cache.get_key("SELECT 2", "mlops_db"))
+    os.utime(file_path, (0, file_path.stat().st_mtime))
+
+    athena_cache.extract("SELECT 3", loader=loader)
+
+    assert athena_cache.stats.evicted_count == 1
+    assert not athena_cache.file_path(athena_cache.get_key("SELECT 2", "mlops_db")).exists()
+    athena_cache.extract("SELECT 1", loader=loader)
+    athena_cache.extract("SELECT 3", loader=loader)
+    assert loader.calls == ["SELECT 1", "SELECT 2", "SELECT 3"]
+
+
+@mock_aws
+def test_extract_shared_through_s3(tmp_path):
+    boto3.client("s3", region_name="ap-northeast-1").create_bucket(
+        Bucket="test-bucket", CreateBucketConfiguration={"LocationConstraint": "ap-northeast-1"}
+    )
+    loader = StubLoader()
+    df_expected = AthenaCache(cache_dir=tmp_path / "host1", s3_bucket="test-bucket", enabled=True).extract(
+        "SELECT 1", loader=loader
+    )
+
+    athena_cache = AthenaCache(cache_dir=tmp_path / "host2", s3_bucket="test-bucket", enabled=True)
+    df_actual = athena_cache.extract("SELECT 1", loader=loader)
+
+    assert loader.calls == ["SELECT 1"]
+    assert athena_cache.stats.s3_hit_count == 1
+    assert_frame_equal(df_actual, df_expected)
+
+
+@mock_aws
+def test_extract_expired_in_s3(tmp_path):
+    boto3.client("s3", region_name="ap-northeast-1").create_bucket(
+        Bucket="test-bucket", CreateBucketConfiguration={"LocationConstraint": "ap-northeast-1"}
+    )
+    loader = StubLoader()
+    AthenaCache(cache_dir=tmp_path / "host1", s3_bucket="test-bucket", enabled=True).extract("SELECT 1", loader=loader)
+
+    athena_cache = AthenaCache(cache_dir=tmp_path / "host2", s3_bucket="test-bucket", max_age=timedelta(0), enabled=True)
+    athena_cache.extract("SELECT 1", loader=loader)
+
+    assert loader.calls == ["SELECT 1", "SELECT 1"]
+    assert (athena_cache.stats.s3_hit_count, athena_cache.stats.expired_count) == (0, 1)
@@ -1,6 +1,10 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 
-from mlops.data_loader import compose_sql
+import awswrangler as wr
+import pandas as pd
+
+from mlops.data_loader import compose_sql, extract_dataframe_chunks_from_athena
+from mlops.data_loader.from_athena import get_chunk_intervals
 
 
 def test_compose_sql_with_no_parameters():
@@ -36,3 +40,99 @@ def test_compose_sql_with_additional_where_clause():
     additional_where_clause = "column_name = 'value'"
     sql = compose_sql(table, additional_where_clause=additional_where_clause)
     assert sql == "SELECT * FROM test_table WHERE column_name = 'value'"
+
+
+def test_compose_sql_with_columns():
+    sql = compose_sql("test_table", columns=["impression_id", "logged_at"])
+    assert sql == "SELECT impression_id, logged_at FROM test_table"
+
+
+def test_compose_sql_with_partition_column():
+    from_datetime = datetime(2023, 1, 1, 12, 0, 0)
+    to_datetime = datetime(2023, 1, 3, 0, 0, 0)
+    sql = compose_sql("test_table", from_datetime=from_datetime, to_datetime=to_datetime, partition_column="dt")
+    assert sql == (
+        "SELECT * FROM test_table WHERE dt >= '2023-01-01' AND dt <= '2023-01-03'"
+        " AND logged_at >= '2023-01-01 12:00:00' AND logged_at <= '2023-01-03 00:00:00'"
+    )
+
+
+def test_compose_sql_with_partition_column_and_no_datetimes():
+    sql = compose_sql("test_table", columns=["item_id"], partition_column="dt")
+    assert sql == "SELECT item_id FROM test_table"
+
+
+def test_compose_sql_without_from_datetime_included():
+    from_datetime = datetime(2023, 1, 1, 12, 0, 0)
+    sql = compose_sql("test_table", from_datetime=from_datetime, partition_column="dt", include_from_datetime=False)
+    # Rows of the partition of from_datetime after it are still read
+    assert sql == "SELECT * FROM test_table WHERE dt >= '2023-01-01' AND logged_at > '2023-01-01 12:00:00'"
+
+
+def test_get_chunk_intervals():
+    intervals = get_chunk_intervals(datetime(2023, 1, 1, 12), datetime(2023, 1, 4), timedelta(days=1))
+    assert intervals == [
+        (datetime(2023, 1, 1, 12), datetime(2023, 1, 2)),
+        (datetime(2023, 1, 2), datetime(2023, 1, 3)),
+        (datetime(2023, 1, 3), datetime(2023, 1, 4)),
+    ]
+
+
+def test_extract_dataframe_chunks_from_athena(monkeypatch):
+    queries = []
+
+    def read_sql_query(sql, **kwargs):
+        queries.append((sql, kwargs))
+        return pd.DataFrame({"logged_at": [len(queries)]})
+
+    monkeypatch.setattr(wr.athena, "read_sql_query", read_sql_query)
+    chunks = extract_dataframe_chunks_from_athena(
+        table="test_table",
+        from_datetime=datetime(2023, 1, 1),
+        to_datetime=datetime(2023, 1, 3),
+        s3_output="s3://bucket/unload",
+        columns=["logged_at"],
+        partition_column="dt",
+    )
+
+    # Queries run as chunks are consumed
+    chunk_to, df = next(chunks)
+    assert len(queries) == 1
+    assert chunk_to == datetime(2023, 1, 2)
+    assert df["logged_at"].tolist() == [1]
+    assert [chunk_to for chunk_to, _ in chunks] == [datetime(2023, 1, 3)]
+    assert [sql for sql, _ in queries] == [
+        "SELECT logged_at FROM test_table WHERE dt >= '2023-01-01' AND dt <= '2023-01-02'"
+        " AND logged_at >= '2023-01-01 00:00:00' AND logged_at <= '2023-01-02 00:00:00'",
+        "SELECT logged_at FROM test_table WHERE dt >= '2023-01-02' AND dt <= '2023-01-03'"
+        " AND logged_at > '2023-01-02 00:00:00' AND logged_at <= '2023-01-03 00:00:00'",
+    ]
+    # Each chunk is unloaded to an empty path
+    assert all(kwargs["unload_approach"] for _, kwargs in queries)
+    s3_outputs = [kwargs["s3_output"] for _, kwargs in queries]
+    assert all(s3_output.startswith("s3://bucket/unload/") for s3_output in s3_outputs)
+    assert len(set(s3_outputs)) == 2
+
+
+def test_extract_dataframe_chunks_from_athena_exclusive(monkeypatch):
+    queries = []
+
+    def read_sql_query(sql, **kwargs):
+        queries.append((sql, kwargs))
+        return pd.DataFrame()
+
+    monkeypatch.setattr(wr.athena, "read_sql_query", read_sql_query)
+
+    list(
+        extract_dataframe_chunks_from_athena(
+            table="test_table",
+            from_datetime=datetime(2023, 1, 1),
+            to_datetime=datetime(2023, 1, 2),
+            include_from_datetime=False,
+        )
+    )
+
+    # Rows at from_datetime are in the previous run
+    sql, kwargs = queries[0]
+    assert sql == "SELECT * FROM test_table WHERE logged_at > '2023-01-01 00:00:00' AND logged_at <= '2023-01-02 00:00:00'"
+    assert not kwargs["unload_approach"]
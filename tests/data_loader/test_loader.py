@@ -0,0 +1,108 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+from pandas.testing import assert_frame_equal
+
+from mlops.data_loader import AthenaLoader, ParquetLoader, TableQuery
+from mlops.data_validator import VIEW_LOG_SCHEMA
+
+
+def create_view_log(n_rows=1000, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        {
+            "logged_at": pd.Timestamp("2018-11-15") + pd.to_timedelta(rng.integers(0, 10 * 24, n_rows), unit="h"),
+            "device_type": pd.array(rng.choice(["android", "iphone", "web"], n_rows), dtype="string"),
+            "session_id": pd.array(rng.integers(0, 100, n_rows), dtype="Int64"),
+            "user_id": pd.array(rng.integers(0, 100, n_rows), dtype="Int64"),
+            "item_id": pd.array(rng.integers(0, 100, n_rows), dtype="Int64"),
+        }
+    )
+
+
+def filter_logs(df, from_datetime, to_datetime, include_from_datetime=True):
+    is_after_from = df["logged_at"] >= from_datetime if include_from_datetime else df["logged_at"] > from_datetime
+    df = df[is_after_from & (df["logged_at"] <= to_datetime)]
+    return df.sort_values(list(df.columns), ignore_index=True)
+
+
+@pytest.mark.parametrize("include_from_datetime", [True, False])
+def test_parquet_loader_extract(tmp_path, include_from_datetime):
+    df_view_log = create_view_log()
+    loader = ParquetLoader(root_dir=tmp_path)
+    # Rows are appended by each write
+    loader.write("view_log", df_view_log.iloc[:500])
+    loader.write("view_log", df_view_log.iloc[500:])
+
+    query = TableQuery(
+        table="view_log",
+        from_datetime=datetime(2018, 11, 17, 12),
+        to_datetime=datetime(2018, 11, 20),
+        include_from_datetime=include_from_datetime,
+    )
+    df_actual = loader.extract(query)
+
+    df_expected = filter_logs(df_view_log, query.from_datetime, query.to_datetime, include_from_datetime)
+    assert_frame_equal(df_actual.sort_values(list(df_actual.columns), ignore_index=True), df_expected)
+    VIEW_LOG_SCHEMA.validate(df_actual)
+
+
+def test_parquet_loader_extract_columns(tmp_path):
+    df_item = pd.DataFrame({"item_id": pd.array([1, 2], dtype="Int64"), "item_price": pd.array([100, 200], dtype="Int64")})
+    loader = ParquetLoader(root_dir=tmp_path, dtype_backend="pyarrow")
+    loader.write("mst_item", df_item)
+    loader.write("view_log", create_view_log())
+
+    df_actual = loader.extract(TableQuery(table="mst_item", columns=["item_id"]))
+    assert df_actual.columns.tolist() == ["item_id"]
+    assert str(df_actual["item_id"].dtype) == "int64[pyarrow]"
+    # The partition column is not a column of the table
+    assert "dt" not in loader.extract(TableQuery(table="view_log")).columns
+
+
+def test_parquet_loader_row_groups(tmp_path):
+    loader = ParquetLoader(root_dir=tmp_path)
+    loader.write("view_log", create_view_log(n_rows=2000), row_group_size=50)
+
+    file_paths = sorted((tmp_path / "view_log").glob("dt=*/*.parquet"))
+    assert [file_path.parent.name for file_path in file_paths][:2] == ["dt=2018-11-15", "dt=2018-11-16"]
+    # Rows are sorted by logged_at, so that the statistics of row groups do not overlap and filters skip them
+    metadata = pq.ParquetFile(file_paths[0]).metadata
+    assert metadata.num_row_groups > 1
+    statistics = [metadata.row_group(i).column(0).statistics for i in range(metadata.num_row_groups)]
+    assert all(previous.max <= current.min for previous, current in zip(statistics, statistics[1:], strict=False))
+
+
+def test_parquet_loader_extract_chunks(tmp_path):
+    df_view_log = create_view_log()
+    loader = ParquetLoader(root_dir=tmp_path)
+    loader.write("view_log", df_view_log)
+    query = TableQuery(table="view_log", from_datetime=datetime(2018, 11, 16, 12), to_datetime=datetime(2018, 11, 20))
+
+    chunks = list(loader.extract_chunks(query, chunk_interval=timedelta(days=2)))
+
+    assert [chunk_to for chunk_to, _ in chunks] == [datetime(2018, 11, 18), datetime(2018, 11, 20)]
+    df_actual = pd.concat([df for _, df in chunks], ignore_index=True).sort_values(
+        list(df_view_log.columns), ignore_index=True
+    )
+    assert_frame_equal(df_actual, filter_logs(df_view_log, query.from_datetime, query.to_datetime))
+
+
+def test_athena_loader_describe():
+    loader = AthenaLoader(partition_column="dt")
+    query = TableQuery(
+        table="view_log",
+        from_datetime=datetime(2018, 11, 16),
+        to_datetime=datetime(2018, 11, 17),
+        columns=["logged_at", "user_id"],
+        include_from_datetime=False,
+    )
+
+    assert loader.describe(query) == (
+        "SELECT logged_at, user_id FROM view_log WHERE dt >= '2018-11-16' AND dt <= '2018-11-17'"
+        " AND logged_at > '2018-11-16 00:00:00' AND logged_at <= '2018-11-17 00:00:00'"
+    )
+    assert loader.describe(TableQuery(table="mst_item")) == "SELECT * FROM mst_item"
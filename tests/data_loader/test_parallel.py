@@ -0,0 +1,68 @@
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from mlops.data_loader import extract_dataframes_in_parallel
+
+
+class SleepLoader:
+    def __init__(self) -> None:
+        self.call_count = 0
+        self.running_count = 0
+        self.max_running_count = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, seconds: float, value: int) -> pd.DataFrame:
+        with self.lock:
+            self.call_count += 1
+            self.running_count += 1
+            self.max_running_count = max(self.max_running_count, self.running_count)
+        time.sleep(seconds)
+        with self.lock:
+            self.running_count -= 1
+        return pd.DataFrame({"value": [value]})
+
+
+def test_extract_dataframes_in_parallel():
+    loader = SleepLoader()
+    extractors = {
+        "impression_log": lambda: loader(0.3, 1),
+        "view_log": lambda: loader(0.2, 2),
+        "mst_item": lambda: loader(0.1, 3),
+    }
+
+    start_time = time.perf_counter()
+    dfs = list(extract_dataframes_in_parallel(extractors))
+    elapsed_seconds = time.perf_counter() - start_time
+
+    # Tables are yielded in order of completion
+    assert [name for name, _ in dfs] == ["mst_item", "view_log", "impression_log"]
+    assert [df["value"].tolist() for _, df in dfs] == [[3], [2], [1]]
+    assert loader.max_running_count == 3
+    assert elapsed_seconds < 0.5
+
+
+def test_extract_dataframes_in_parallel_max_workers():
+    loader = SleepLoader()
+    extractors = {f"table_{i}": lambda: loader(0.05, 0) for i in range(5)}
+
+    dfs = dict(extract_dataframes_in_parallel(extractors, max_workers=2))
+
+    assert set(dfs) == set(extractors)
+    assert loader.max_running_count == 2
+
+
+def test_extract_dataframes_in_parallel_error():
+    loader = SleepLoader()
+
+    def fail() -> pd.DataFrame:
+        raise ValueError("query failed")
+
+    extractors = {"mst_item": fail, "impression_log": lambda: loader(0.1, 1), "view_log": lambda: loader(0.1, 2)}
+
+    with pytest.raises(ValueError, match="query failed"):
+        list(extract_dataframes_in_parallel(extractors, max_workers=1))
+    # Queries not started yet are cancelled, the worker may have started the next one before the failure is seen
+    assert loader.call_count <= 1
@@ -0,0 +1,102 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+from mlops.data_loader import (
+    ParquetLoader,
+    SyntheticDataConfig,
+    TableQuery,
+    generate_synthetic_data,
+    iter_impression_log,
+    iter_view_log,
+)
+from mlops.data_loader.synthetic import generate_mst_item, get_chunk_bounds
+from mlops.data_validator import IMPRESSION_LOG_SCHEMA, MST_ITEM_SCHEMA, VIEW_LOG_SCHEMA
+
+CONFIG = SyntheticDataConfig(n_users=1000, n_items=100, n_impressions=20_000, days=7, chunk_rows=3000)
+
+
+def test_get_chunk_bounds():
+    assert get_chunk_bounds(10, 4) == [(0, 3), (3, 7), (7, 10)]
+    assert get_chunk_bounds(10, 10) == [(0, 10)]
+    assert get_chunk_bounds(0, 10) == [(0, 0)]
+
+
+def test_synthetic_data_schema():
+    df_impression_log = pd.concat(iter_impression_log(CONFIG), ignore_index=True)
+    df_view_log = pd.concat(iter_view_log(CONFIG), ignore_index=True)
+
+    IMPRESSION_LOG_SCHEMA.validate(df_impression_log)
+    VIEW_LOG_SCHEMA.validate(df_view_log)
+    MST_ITEM_SCHEMA.validate(generate_mst_item(CONFIG))
+    assert (len(df_impression_log), len(df_view_log)) == (CONFIG.n_impressions, CONFIG.n_views)
+    # Chunks are consecutive in time within the span
+    for df in [df_impression_log, df_view_log]:
+        assert df["logged_at"].is_monotonic_increasing
+        assert df["logged_at"].min() >= CONFIG.from_datetime
+        assert df["logged_at"].max() < CONFIG.from_datetime + timedelta(days=CONFIG.days)
+    assert df_view_log["item_id"].isin(generate_mst_item(CONFIG)["item_id"]).all()
+
+
+def test_synthetic_data_distribution():
+    df_impression_log = pd.concat(iter_impression_log(CONFIG), ignore_index=True)
+    df_view_log = pd.concat(iter_view_log(CONFIG), ignore_index=True)
+
+    assert df_impression_log["is_click"].mean() == pytest.approx(CONFIG.click_rate, abs=0.01)
+    # The 1% most active users have a large share of the impressions, about 46% for the exponent 1.1
+    user_counts = df_impression_log["user_id"].value_counts()
+    assert user_counts.iloc[: CONFIG.n_users // 100].sum() / len(df_impression_log) > 0.35
+    # Users are equally active in both logs
+    impression_top_users = set(user_counts.index[:10])
+    assert len(impression_top_users & set(df_view_log["user_id"].value_counts().index[:20])) >= 8
+
+
+def test_synthetic_data_is_deterministic():
+    for iter_log in [iter_impression_log, iter_view_log]:
+        assert_frame_equal(pd.concat(iter_log(CONFIG)), pd.concat(iter_log(CONFIG)))
+        df_other_seed = pd.concat(iter_log(SyntheticDataConfig(**{**vars(CONFIG), "seed": 1})))
+        assert not np.array_equal(pd.concat(iter_log(CONFIG))["user_id"], df_other_seed["user_id"])
+
+
+def test_generate_synthetic_data(tmp_path):
+    loader = ParquetLoader(root_dir=tmp_path)
+    generate_synthetic_data(loader, CONFIG, row_group_size=1000)
+
+    df_impression_log = loader.extract(
+        TableQuery(table="impression_log", from_datetime=datetime(2018, 11, 16), to_datetime=datetime(2018, 11, 18))
+    )
+    df_expected = pd.concat(iter_impression_log(CONFIG), ignore_index=True)
+    df_expected = df_expected[df_expected["logged_at"].between(datetime(2018, 11, 16), datetime(2018, 11, 18))]
+    assert_frame_equal(
+        df_impression_log.sort_values("impression_id", ignore_index=True),
+        IMPRESSION_LOG_SCHEMA.validate(df_expected).reset_index(drop=True),
+        check_dtype=False,
+    )
+    assert len(loader.extract(TableQuery(table="view_log"))) == CONFIG.n_views
+    assert_frame_equal(loader.extract(TableQuery(table="mst_item")), generate_mst_item(CONFIG))
+
+
+def _generate_synthetic_data(dir_path, config):
+    start = time.perf_counter()
+    generate_synthetic_data(ParquetLoader(root_dir=dir_path), config)
+    elapsed = time.perf_counter() - start
+    with open("/proc/self/status") as f:
+        peak_rss_kib = next(int(line.split()[1]) for line in f if line.startswith("VmHWM:"))
+    return elapsed, peak_rss_kib / 1024
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("n_impressions", [1_000_000, 4_000_000, 16_000_000])
+def test_benchmark_generate_synthetic_data(tmp_path, n_impressions):
+    config = SyntheticDataConfig(n_impressions=n_impressions)
+
+    # A new process per run, so that the peak RSS is of the generation only. It is bounded by chunk_rows, not by the rows.
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        elapsed, peak_rss_mib = executor.submit(_generate_synthetic_data, tmp_path, config).result()
+    print(f"\n{n_impressions=}: {elapsed:.3f}s, peak_rss={peak_rss_mib:.1f}MiB")
@@ -1,8 +1,11 @@
 import awswrangler as wr
+import pandas as pd
+import pyarrow as pa
 import pytest
+from pandera.errors import SchemaError
 
 from mlops.const import GLUE_DATABASE
-from mlops.data_validator import IMPRESSION_LOG_SCHEMA, MST_ITEM_SCHEMA, VIEW_LOG_SCHEMA
+from mlops.data_validator import IMPRESSION_LOG_SCHEMA, MST_ITEM_SCHEMA, VIEW_LOG_SCHEMA, to_arrow_schema
 
 
 @pytest.mark.integration
@@ -17,3 +20,23 @@ def test_schema_validation(schema):
     assert len(df) > 0, "No data retrieved"
     validated_df = schema.validate(df)
     assert len(validated_df) == len(df), "Row count changed after validation"
+
+
+def test_to_arrow_schema():
+    df = pd.DataFrame(
+        {
+            "logged_at": ["2018-12-01 00:00:00", "2018-12-01 00:00:01"],
+            "device_type": ["android", "web"],
+            "session_id": [1, 2],
+            "user_id": [3, 4],
+            "item_id": [5, 6],
+        }
+    )
+
+    df_validated = to_arrow_schema(VIEW_LOG_SCHEMA).validate(df)
+
+    assert all(isinstance(dtype, pd.ArrowDtype) for dtype in df_validated.dtypes)
+    assert df_validated["device_type"].dtype == pd.ArrowDtype(pa.string())
+    assert df_validated["item_id"].dtype == pd.ArrowDtype(pa.int64())
+    with pytest.raises(SchemaError, match="isin"):
+        to_arrow_schema(VIEW_LOG_SCHEMA).validate(df.assign(device_type=["android", "tablet"]))
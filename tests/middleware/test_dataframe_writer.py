@@ -0,0 +1,96 @@
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from pandas.testing import assert_frame_equal
+
+from mlops.middleware import DataFrameWriter, save_dataframe
+
+
+def create_feature(n_rows=100, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        {
+            "logged_at": pd.Timestamp("2018-11-15") + pd.to_timedelta(rng.integers(0, 86400, n_rows), unit="s"),
+            "user_id": pd.array(rng.integers(0, 10, n_rows), dtype="Int64"),
+            "device_type": pd.array(rng.choice(["android", "iphone", None], n_rows), dtype="string"),
+            "item_price": pd.array(rng.choice([1180, 5000, None], n_rows), dtype="Int64"),
+        }
+    )
+
+
+def test_save_dataframe_parquet(create_train_data, tmp_path):
+    X, y = create_train_data("lightgbm_ctr")
+    df = pd.concat([X, y], axis=1)
+
+    save_dataframe(df, tmp_path / "train.parquet", row_group_size=50)
+
+    # Narrow dtypes and string categories of the schema are kept, numeric categories are read as their values
+    numeric_categories = [column for column in df.select_dtypes("category") if df[column].cat.categories.dtype != "object"]
+    df_expected = df.astype({column: df[column].cat.categories.dtype for column in numeric_categories})
+    assert_frame_equal(pd.read_parquet(tmp_path / "train.parquet"), df_expected)
+    metadata = pq.ParquetFile(tmp_path / "train.parquet").metadata
+    assert metadata.num_row_groups == 4
+    assert metadata.row_group(0).column(0).compression == "ZSTD"
+
+
+def test_dataframe_writer_parquet_chunks(tmp_path):
+    df = create_feature()
+    # Columns of the empty chunk and a column of the last chunk are all null, which are typed by the other chunks
+    chunks = [
+        df.iloc[:0].astype(object),
+        df.iloc[:60],
+        df.iloc[60:].assign(item_price=pd.array([None] * 40, dtype="object")),
+    ]
+
+    with DataFrameWriter(tmp_path / "df_feature.parquet") as writer:
+        for chunk in chunks:
+            writer.write(chunk)
+
+    df_actual = pd.read_parquet(tmp_path / "df_feature.parquet", dtype_backend="numpy_nullable")
+    # Timestamps are in milliseconds, which Athena reads
+    assert pq.read_schema(tmp_path / "df_feature.parquet").field("logged_at").type == pa.timestamp("ms")
+    assert_frame_equal(
+        df_actual,
+        pd.concat(chunks[1:], ignore_index=True).astype({"item_price": "Int64"}),
+        check_dtype=False,
+    )
+    assert (writer.n_rows, writer.n_chunks) == (100, 3)
+
+
+def test_dataframe_writer_parquet_empty(tmp_path):
+    with DataFrameWriter(tmp_path / "df_feature.parquet") as writer:
+        writer.write(create_feature().iloc[:0])
+
+    assert pd.read_parquet(tmp_path / "df_feature.parquet").columns.tolist() == create_feature().columns.tolist()
+
+
+def test_dataframe_writer_csv_chunks(tmp_path):
+    df = create_feature()
+
+    with DataFrameWriter(tmp_path / "df_feature.csv", file_format="csv") as writer:
+        writer.write(df.iloc[:0])
+        writer.write(df.iloc[:60])
+        writer.write(df.iloc[60:])
+
+    # Same file as a single write of the previous versions
+    df.to_csv(tmp_path / "expected.csv", index=False)
+    assert (tmp_path / "df_feature.csv").read_text() == (tmp_path / "expected.csv").read_text()
+
+
+@pytest.mark.benchmark
+def test_benchmark_save_dataframe(create_train_data, tmp_path):
+    X, y = create_train_data("lightgbm_ctr", n_rows=1_000_000)
+    df = pd.concat([X, y], axis=1)
+
+    results = {}
+    for file_format in ["csv", "parquet"]:
+        file_path = tmp_path / f"train.{file_format}"
+        start = time.perf_counter()
+        save_dataframe(df, file_path, file_format=file_format)
+        elapsed = time.perf_counter() - start
+        results[file_format] = f"{elapsed:.3f}s, size={file_path.stat().st_size / 1024 / 1024:.1f}MiB"
+    print("\n" + ", ".join(f"{name}={result}" for name, result in results.items()))
@@ -1,12 +1,20 @@
+import hashlib
 import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+import boto3
 import lightgbm as lgb
 import numpy as np
 import pandas as pd
 import pytest
+import tl2cgen
+from moto import mock_aws
 
+from mlops.aws import controller
 from mlops.model import LightGBMModel
+from mlops.model.models import lightgbm
 
 
 @pytest.fixture
@@ -81,3 +89,171 @@ def test_save(train_test_data):
 
         loaded_model = lgb.Booster(model_file=str(file_path))
         assert isinstance(loaded_model, lgb.Booster)
+
+
+def test_compile_parity(lightgbm_model, create_train_data, tmp_path):
+    X, _ = create_train_data("lightgbm_ctr", n_rows=500, seed=0)
+    # Categories which are not seen at training time
+    X["app_code"] = X["app_code"].cat.add_categories([999])
+    X.loc[X.index[:10], "app_code"] = 999
+    model = LightGBMModel(lightgbm_model.model)
+
+    assert model.compile(lib_path=tmp_path / "model.so")
+    assert model.compiled_model is not None
+    np.testing.assert_array_equal(model.predict_proba(X), lightgbm_model.predict_proba(X))
+
+    X_numeric = model._to_numeric(X)
+    np.testing.assert_array_equal(model.predict_proba(X_numeric), lightgbm_model.predict_proba(X_numeric))
+
+
+def test_compile_reuses_cached_library(lightgbm_model, tmp_path):
+    lib_path = tmp_path / "model.so"
+    LightGBMModel(lightgbm_model.model).compile(lib_path=lib_path)
+    modified_at = lib_path.stat().st_mtime_ns
+
+    model = LightGBMModel(lightgbm_model.model)
+
+    assert model.compile(lib_path=lib_path)
+    assert lib_path.stat().st_mtime_ns == modified_at
+
+
+def test_compile_concurrently(lightgbm_model, tmp_path, monkeypatch):
+    export_lib = tl2cgen.export_lib
+    exported_lib_paths = []
+
+    def export_lib_once(*args, **kwargs):
+        exported_lib_paths.append(kwargs["libpath"])
+        export_lib(*args, **kwargs)
+
+    monkeypatch.setattr(tl2cgen, "export_lib", export_lib_once)
+    lib_path = tmp_path / "model.so"
+
+    # Workers of the server load the same model at the same time
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(lambda _: LightGBMModel(lightgbm_model.model).compile(lib_path=lib_path), range(4)))
+
+    assert results == [True] * 4
+    assert len(exported_lib_paths) == 1
+    # The library is built in a temporary file, which is renamed to the library
+    assert Path(exported_lib_paths[0]).parent == tmp_path
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["model.so", "model.so.lock"]
+
+
+def test_from_pretrained_caches_compiled_library_next_to_model(lightgbm_model, tmp_path, monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "ap-northeast-1")
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setattr(lightgbm, "MODEL_S3_BUCKET", "test-model-bucket")
+    monkeypatch.setattr(controller, "_s3_uploader", None)
+    s3_key = "lightgbm_ctr/20250101000000/model.txt"
+    lightgbm_model.save(tmp_path / "model.txt")
+
+    with mock_aws():
+        s3 = boto3.client("s3")
+        s3.create_bucket(Bucket="test-model-bucket", CreateBucketConfiguration={"LocationConstraint": "ap-northeast-1"})
+        s3.upload_file(str(tmp_path / "model.txt"), "test-model-bucket", s3_key)
+
+        model = LightGBMModel.from_pretrained(s3_key, cache_dir=tmp_path / "host1")
+        model_hash = hashlib.sha256((tmp_path / "model.txt").read_bytes()).hexdigest()
+        lib_s3_key = lightgbm.get_compiled_lib_s3_key(s3_key, model_hash, lightgbm.get_build_platform())
+        metadata = s3.head_object(Bucket="test-model-bucket", Key=lib_s3_key)["Metadata"]
+        assert metadata["model-sha256"] == model_hash
+
+        # Another host downloads the compiled library instead of compiling the model
+        def export_lib(*args, **kwargs):
+            raise RuntimeError("compiler is not found")
+
+        monkeypatch.setattr(tl2cgen, "export_lib", export_lib)
+        another_model = LightGBMModel.from_pretrained(s3_key, cache_dir=tmp_path / "host2")
+
+    assert model.compiled_model is not None
+    assert another_model.compiled_model is not None
+    assert [path.name for path in (tmp_path / "host2").glob("*.so")] == [
+        path.name for path in (tmp_path / "host1").glob("*.so")
+    ]
+    controller._s3_uploader.close()
+
+
+@pytest.mark.parametrize(
+    "metadata_update, lib_bytes",
+    [({"model-sha256": "0" * 64}, b"library of another model"), ({}, b"corrupted library")],
+)
+def test_from_pretrained_does_not_load_mismatched_library(lightgbm_model, tmp_path, monkeypatch, metadata_update, lib_bytes):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "ap-northeast-1")
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setattr(lightgbm, "MODEL_S3_BUCKET", "test-model-bucket")
+    monkeypatch.setattr(controller, "_s3_uploader", None)
+    s3_key = "lightgbm_ctr/20250101000000/model.txt"
+    lightgbm_model.save(tmp_path / "model.txt")
+    model_hash = hashlib.sha256((tmp_path / "model.txt").read_bytes()).hexdigest()
+    build_platform = lightgbm.get_build_platform()
+    metadata = {
+        "model-sha256": model_hash,
+        "build-platform": build_platform,
+        "lib-sha256": hashlib.sha256(b"library").hexdigest(),
+    }
+
+    with mock_aws():
+        s3 = boto3.client("s3")
+        s3.create_bucket(Bucket="test-model-bucket", CreateBucketConfiguration={"LocationConstraint": "ap-northeast-1"})
+        s3.upload_file(str(tmp_path / "model.txt"), "test-model-bucket", s3_key)
+        s3.put_object(
+            Bucket="test-model-bucket",
+            Key=lightgbm.get_compiled_lib_s3_key(s3_key, model_hash, build_platform),
+            Body=lib_bytes,
+            Metadata=metadata | metadata_update,
+        )
+
+        model = LightGBMModel.from_pretrained(s3_key, cache_dir=tmp_path / "host")
+
+    assert model.compiled_model is None
+    assert list((tmp_path / "host").glob("*.so")) == []
+    controller._s3_uploader.close()
+
+
+def test_compile_fallback_to_booster(lightgbm_model, create_train_data, tmp_path, monkeypatch):
+    def export_lib(*args, **kwargs):
+        raise RuntimeError("compiler is not found")
+
+    monkeypatch.setattr(tl2cgen, "export_lib", export_lib)
+    X, _ = create_train_data("lightgbm_ctr", n_rows=10)
+    model = LightGBMModel(lightgbm_model.model)
+
+    assert not model.compile(lib_path=tmp_path / "model.so")
+    assert model.compiled_model is None
+    np.testing.assert_array_equal(model.predict_proba(X), lightgbm_model.predict_proba(X))
+
+
+def test_predict_proba_fallback_to_booster(lightgbm_model, tmp_path):
+    model = LightGBMModel(lightgbm_model.model)
+    model.compile(lib_path=tmp_path / "model.so")
+
+    # Columns of the data frame do not match the compiled model
+    X = pd.DataFrame({"feature1": pd.Series(["A"], dtype="category")})
+    with pytest.raises(ValueError, match="categorical_feature do not match"):
+        model.predict_proba(X)
+
+    assert model.compiled_model is None
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("n_rows", [1, 1000])
+def test_benchmark_compiled_predict_proba(lightgbm_model, create_train_data, tmp_path, n_rows):
+    X, _ = create_train_data("lightgbm_ctr", n_rows=n_rows, seed=0)
+    compiled_model = LightGBMModel(lightgbm_model.model)
+    compiled_model.compile(lib_path=tmp_path / "model.so")
+    # Serving input of FeaturePlan.to_model_input
+    X_numeric = compiled_model._to_numeric(X)
+    n_iter = 2000 if n_rows == 1 else 100
+
+    results = {}
+    for name, model in [("booster", lightgbm_model), ("compiled", compiled_model)]:
+        model.predict_proba(X_numeric)
+        start = time.perf_counter()
+        for _ in range(n_iter):
+            model.predict_proba(X_numeric)
+        results[name] = (time.perf_counter() - start) / n_iter * 1e6
+    print(f"\n{n_rows=}: " + ", ".join(f"{name}={elapsed:.1f}us" for name, elapsed in results.items()))
+
+    assert compiled_model.compiled_model is not None
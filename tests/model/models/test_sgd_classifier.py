@@ -1,13 +1,16 @@
 import pickle
 import tempfile
+import time
 from pathlib import Path
 
 import numpy as np
 import pandas as pd
 import pytest
+from sklearn.feature_extraction import FeatureHasher
 from sklearn.linear_model import SGDClassifier
 
 from mlops.model import SGDClassifierModel
+from mlops.model.models.sgd_classifier import HashedLinearScorer
 
 
 @pytest.fixture
@@ -76,3 +79,77 @@ def test_save(train_test_data):
         with open(file_path, "rb") as f:
             loaded_model = pickle.load(f)
         assert isinstance(loaded_model, SGDClassifier)
+
+
+def test_predict_proba_online_not_instantiated():
+    model = SGDClassifierModel()
+    with pytest.raises(ValueError, match="Model is not instantiated"):
+        model.predict_proba_online(pd.DataFrame({"feature1": [1, 2]}))
+
+
+def test_predict_proba_online_parity_dataframe(sgd_classifier_model, create_train_data):
+    X, _ = create_train_data("sgd_classifier_ctr", n_rows=500, seed=0)
+
+    np.testing.assert_array_equal(sgd_classifier_model.predict_proba_online(X), sgd_classifier_model.predict_proba(X))
+
+
+def test_predict_proba_online_parity_object_array(sgd_classifier_model, create_train_data):
+    X, _ = create_train_data("sgd_classifier_ctr", n_rows=500, seed=1)
+    X_object = X.astype(object).to_numpy()
+
+    np.testing.assert_array_equal(
+        sgd_classifier_model.predict_proba_online(X_object), sgd_classifier_model.predict_proba(X_object)
+    )
+    # Predictions from the cached hashed features are the same
+    np.testing.assert_array_equal(
+        sgd_classifier_model.predict_proba_online(X_object[:1]), sgd_classifier_model.predict_proba(X_object[:1])
+    )
+
+
+def test_hashed_linear_scorer_hash_parity():
+    # Includes non ascii and duplicated features, which sum to zero or larger values
+    X = np.array([["a", "a", "b"], ["日本", "", "nan"], ["x", "y", "x"]], dtype=object)
+    feature_hasher = FeatureHasher(n_features=2**18, input_type="string")
+    model = SGDClassifier(loss="log_loss")
+    model.coef_ = np.random.default_rng(0).normal(size=(1, 2**18))
+    model.intercept_ = np.array([0.3])
+    model.classes_ = np.array([0, 1])
+
+    scorer = HashedLinearScorer(model)
+
+    # Small batches are scored row by row, larger ones column by column
+    for X_batch in [X, np.tile(X, (4, 1))]:
+        np.testing.assert_array_equal(
+            scorer.decision_function(X_batch), model.decision_function(feature_hasher.fit_transform(X_batch.astype(str)))
+        )
+
+
+def test_hashed_linear_scorer_bounded_cache(sgd_classifier_model):
+    scorer = HashedLinearScorer(sgd_classifier_model.model, max_cached_features=16)
+    # Unique ids such as user_id are not all kept in the cache
+    X = np.arange(1000 * 16).reshape(1000, 16).astype(object)
+
+    np.testing.assert_array_equal(scorer.predict_proba(X), sgd_classifier_model.predict_proba(X))
+    assert scorer._hash.cache_info().currsize == 16
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("n_rows", [1, 1000])
+def test_benchmark_predict_proba_online(sgd_classifier_model, create_train_data, n_rows):
+    X, _ = create_train_data("sgd_classifier_ctr", n_rows=n_rows, seed=0)
+    X_object = X.astype(object).to_numpy()
+    n_iter = 2000 if n_rows == 1 else 20
+    sgd_classifier_model.predict_proba_online(X_object)
+
+    results = {}
+    for name, predict_proba in [
+        ("predict_proba", sgd_classifier_model.predict_proba),
+        ("predict_proba_online", sgd_classifier_model.predict_proba_online),
+    ]:
+        start = time.perf_counter()
+        for _ in range(n_iter):
+            predict_proba(X_object)
+        results[name] = (time.perf_counter() - start) / n_iter * 1e6
+    print(f"\n{n_rows=}: " + ", ".join(f"{name}={elapsed:.1f}us" for name, elapsed in results.items()))
+
+    assert results["predict_proba_online"] < results["predict_proba"]
@@ -0,0 +1,67 @@
+from datetime import datetime
+
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+from mlops.model import FeatureState
+
+
+def create_logs():
+    df_impression_log = pd.DataFrame(
+        {
+            "impression_id": ["a", "b", "c"],
+            "user_id": [1, 1, 2],
+            "logged_at": pd.to_datetime(["2018-12-01 00:00:00", "2018-12-01 00:00:01", "2018-12-09 00:00:00"]),
+            "app_code": [1, 2, 3],
+        }
+    )
+    df_view_log = pd.DataFrame(
+        {
+            "view_id": ["x", "y", "z", "w"],
+            "user_id": [1, 2, 2, 2],
+            "logged_at": pd.to_datetime(
+                ["2018-11-30 00:00:00", "2018-12-05 00:00:00", "2018-12-05 00:00:00", "2018-12-09 00:00:00"]
+            ),
+            "item_id": pd.array([10, 20, 30, 40], dtype="Int64"),
+            "device_type": pd.array(["android", "iphone", None, "web"], dtype="string"),
+        }
+    )
+    return df_impression_log, df_view_log
+
+
+def test_from_logs_keeps_lookback_window():
+    df_impression_log, df_view_log = create_logs()
+
+    feature_state = FeatureState.from_logs(df_impression_log, df_view_log, to_datetime=datetime(2018, 12, 9), lookback_days=7)
+
+    # Logs at the start of the window 2018-12-01 00:00:00 are out of the lookback window of later impressions
+    assert feature_state.window_start == datetime(2018, 12, 1)
+    assert feature_state.df_impression_log["impression_id"].tolist() == ["b", "c"]
+    assert feature_state.df_impression_log.columns.tolist() == ["impression_id", "user_id", "logged_at"]
+    # Duplicated views keep the last one
+    assert feature_state.df_view_log["item_id"].tolist() == [30, 40]
+    assert feature_state.df_view_log.columns.tolist() == ["user_id", "logged_at", "item_id", "device_type"]
+
+
+def test_update_drops_logs_out_of_window():
+    df_impression_log, df_view_log = create_logs()
+    feature_state = FeatureState.from_logs(df_impression_log, df_view_log, to_datetime=datetime(2018, 12, 9), lookback_days=7)
+
+    feature_state = feature_state.update(df_impression_log.iloc[:0], df_view_log.iloc[:0], to_datetime=datetime(2018, 12, 13))
+
+    assert feature_state.to_datetime == datetime(2018, 12, 13)
+    assert feature_state.df_impression_log["impression_id"].tolist() == ["c"]
+    assert feature_state.df_view_log["item_id"].tolist() == [40]
+
+
+def test_save_and_load(tmp_path):
+    df_impression_log, df_view_log = create_logs()
+    feature_state = FeatureState.from_logs(df_impression_log, df_view_log, to_datetime=datetime(2018, 12, 9), lookback_days=7)
+
+    feature_state.save(tmp_path)
+    loaded_feature_state = FeatureState.load(tmp_path)
+
+    assert loaded_feature_state.to_datetime == feature_state.to_datetime
+    assert loaded_feature_state.lookback_days == feature_state.lookback_days
+    assert_frame_equal(loaded_feature_state.df_impression_log, feature_state.df_impression_log)
+    assert_frame_equal(loaded_feature_state.df_view_log, feature_state.df_view_log)
@@ -1,16 +1,32 @@
+import math
+import multiprocessing
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 
+import numpy as np
 import pandas as pd
+import pytest
 from pandas.testing import assert_frame_equal
 
+from mlops.data_loader.from_athena import get_chunk_intervals
+from mlops.data_validator import IMPRESSION_LOG_SCHEMA, MST_ITEM_SCHEMA, VIEW_LOG_SCHEMA
 from mlops.model import (
+    FeatureState,
     Schema,
     add_impression_time_feature,
+    apply_date_split,
     apply_preprocess,
     apply_schema,
     apply_train_test_split,
     get_impression_feature,
+    get_incremental_impression_feature,
+    get_model_config,
+    get_source_columns,
+    iter_impression_feature,
 )
+from mlops.model.preprocess import _get_impression_history_feature, _get_view_history_feature, _split_by_user_id
 
 
 def create_test_data():
@@ -129,6 +145,42 @@ def test_apply_schema():
     assert result["str_col"].dtype == "object"
 
 
+def test_apply_schema_narrow_dtypes():
+    df_test = pd.DataFrame(
+        {
+            "hour": [1, 23, None],
+            "item_id": pd.array([43886, None, 100], dtype="Int64"),
+            "device_type": pd.array(["android", None, "tablet"], dtype="string"),
+        }
+    )
+    schemas = [
+        Schema(name="hour", dtype="int8", null_value=-1),
+        Schema(name="item_id", dtype="int32", null_value=-1),
+        Schema(name="device_type", dtype="category", null_value="null", categories=["android", "iphone", "null"]),
+    ]
+
+    result = apply_schema(df_test, schemas)
+
+    assert result["hour"].tolist() == [1, 23, -1]
+    assert result["item_id"].tolist() == [43886, -1, 100]
+    assert result["hour"].dtype == "int8"
+    assert result["item_id"].dtype == "int32"
+    # Values out of the fixed categories are missing
+    assert result["device_type"].cat.categories.tolist() == ["android", "iphone", "null"]
+    assert result["device_type"].cat.codes.tolist() == [0, 2, -1]
+
+
+@pytest.mark.parametrize("item_id", [[1, 200, -200], ["1", "200", "-200"]], ids=["int", "str"])
+def test_apply_schema_out_of_range(item_id):
+    df_test = pd.DataFrame({"item_id": item_id})
+
+    result = apply_schema(df_test, [Schema(name="item_id", dtype="int8", null_value=-1)])
+
+    # Values out of the range are missing instead of wrapped
+    assert result["item_id"].tolist() == [1, -1, -1]
+    assert result["item_id"].dtype == "int8"
+
+
 def test_apply_train_test_split():
     test_data = {"feature": list(range(100)), "logged_at": [datetime(2023, 1, 1) + timedelta(hours=i) for i in range(100)]}
     df_test = pd.DataFrame(test_data)
@@ -156,3 +208,533 @@ def test_add_impression_time_feature():
     assert df_actual["impression_hour"].tolist() == [10, 11, 12]
     assert df_actual["impression_day"].tolist() == [1, 2, 3]
     assert df_actual["impression_weekday"].tolist() == [6, 0, 1]
+
+
+def test_get_source_columns():
+    model_config = get_model_config("sgd_classifier_ctr")
+    output_columns = model_config.feature_columns + [model_config.target]
+
+    assert get_source_columns(list(IMPRESSION_LOG_SCHEMA.columns), output_columns) == list(IMPRESSION_LOG_SCHEMA.columns)
+    # session_id is not used by the features
+    assert get_source_columns(list(VIEW_LOG_SCHEMA.columns), output_columns) == [
+        "logged_at",
+        "device_type",
+        "user_id",
+        "item_id",
+    ]
+    assert get_source_columns(list(MST_ITEM_SCHEMA.columns), output_columns) == list(MST_ITEM_SCHEMA.columns)
+
+
+def _get_impression_history_feature_by_self_join(df_impression_log, lookback_days=7):
+    # Previous implementation, which joins the impressions of a user with themselves
+    df_impression_history = df_impression_log.merge(df_impression_log, how="left", on="user_id", suffixes=("", "_previous"))
+    df_impression_history["days_between_impressions"] = (
+        df_impression_history["logged_at"] - df_impression_history["logged_at_previous"]
+    ).dt.days
+    df_impression_history = df_impression_history.query(
+        f"(logged_at_previous < logged_at) and (days_between_impressions <= {lookback_days})"
+    )
+    df_impression_history_feature = (
+        df_impression_history.groupby("impression_id")["impression_id_previous"]
+        .count()
+        .reset_index(name="previous_impression_count")
+    )
+    df_impression_history_feature["previous_impression_count"] = df_impression_history_feature[
+        "previous_impression_count"
+    ].astype(pd.Int64Dtype())
+    return df_impression_history_feature
+
+
+def create_random_impression_log(n_rows, n_users, seed=0):
+    rng = np.random.default_rng(seed)
+    # Times on day boundaries and duplicated times are included, which are edges of the lookback window
+    logged_at = pd.Timestamp("2018-11-15") + pd.to_timedelta(
+        np.concatenate([rng.integers(0, 30, n_rows // 2) * 86400, rng.integers(0, 30 * 86400, n_rows - n_rows // 2)]),
+        unit="s",
+    )
+    return pd.DataFrame(
+        {
+            "impression_id": rng.permutation(n_rows).astype(str),
+            "user_id": rng.zipf(1.5, n_rows) % n_users,
+            "logged_at": logged_at,
+        }
+    )
+
+
+def test_apply_date_split():
+    logged_at = [datetime(2023, 1, 1) + timedelta(hours=i) for i in range(240)] + [None]
+    df_test = pd.DataFrame({"feature": range(241), "logged_at": logged_at}).sample(frac=1, random_state=0)
+
+    df_train, df_valid, df_test = apply_date_split(
+        df_test, to_datetime=datetime(2023, 1, 11), valid_interval_days=2, test_interval_days=3
+    )
+
+    assert len(df_train) == 5 * 24
+    assert len(df_valid) == 2 * 24
+    assert len(df_test) == 3 * 24
+    assert df_train["logged_at"].max() < datetime(2023, 1, 6) == df_valid["logged_at"].min()
+    assert df_valid["logged_at"].max() < datetime(2023, 1, 8) == df_test["logged_at"].min()
+
+
+@pytest.mark.parametrize(
+    ("to_datetime", "match"),
+    [
+        # Logs end before the test split
+        (datetime(2023, 1, 14), "No logs in the test split from 2023-01-11 00:00:00 to 2023-01-14 00:00:00"),
+        # Logs start after the beginning of the valid split
+        (datetime(2023, 1, 6), "No logs in the train split before 2023-01-01 00:00:00"),
+    ],
+)
+def test_apply_date_split_empty(to_datetime, match):
+    df = pd.DataFrame({"feature": range(240), "logged_at": [datetime(2023, 1, 1) + timedelta(hours=i) for i in range(240)]})
+
+    with pytest.raises(ValueError, match=match):
+        apply_date_split(df, to_datetime=to_datetime, valid_interval_days=2, test_interval_days=3)
+
+
+def test_apply_date_split_returns_slices():
+    df = pd.DataFrame({"feature": range(100), "logged_at": [datetime(2023, 1, 1) + timedelta(hours=i) for i in range(100)]})
+
+    df_train, df_valid, df_test = apply_date_split(
+        df, to_datetime=datetime(2023, 1, 5), valid_interval_days=1, test_interval_days=1
+    )
+
+    assert len(df_train) + len(df_valid) + len(df_test) == 100
+    # Rows in order of the splits are not copied
+    for df_split in [df_train, df_valid, df_test]:
+        assert np.shares_memory(df_split["feature"].to_numpy(), df["feature"].to_numpy())
+
+
+@pytest.mark.parametrize("lookback_days", [0, 1, 7])
+@pytest.mark.parametrize("seed", [0, 1])
+def test_get_impression_history_feature_equivalence(lookback_days, seed):
+    df_impression_log = create_random_impression_log(n_rows=3000, n_users=50, seed=seed)
+
+    df_expected = _get_impression_history_feature_by_self_join(df_impression_log, lookback_days=lookback_days)
+    df_actual = _get_impression_history_feature(df_impression_log, lookback_days=lookback_days)
+
+    assert_frame_equal(df_actual, df_expected)
+
+
+def test_get_impression_history_feature_with_missing_user_id():
+    df_impression_log = create_random_impression_log(n_rows=200, n_users=5)
+    df_impression_log["user_id"] = df_impression_log["user_id"].astype(float)
+    df_impression_log.loc[df_impression_log.index[:50], "user_id"] = np.nan
+
+    assert_frame_equal(
+        _get_impression_history_feature(df_impression_log), _get_impression_history_feature_by_self_join(df_impression_log)
+    )
+
+
+def _get_view_history_feature_by_join(df_impression_log, df_view_log, lookback_days=7):
+    # Previous implementation, which joins every impression with every view of the user
+    df_view_log_drop_duplicated = df_view_log.drop_duplicates(subset=["user_id", "logged_at"], keep="last")
+    df_view_history = df_impression_log.merge(
+        df_view_log_drop_duplicated, how="left", on="user_id", suffixes=("_impression", "_view")
+    )
+    df_view_history["days_between_impression_and_session"] = (
+        df_view_history["logged_at_impression"] - df_view_history["logged_at_view"]
+    ).dt.days
+    df_view_history = df_view_history.query(
+        f"(logged_at_view < logged_at_impression) and (days_between_impression_and_session <= {lookback_days})"
+    )
+    df_view_history_features = (
+        df_view_history.groupby("impression_id")
+        .agg(
+            previous_view_count=("logged_at_view", "count"),
+            item_id=("item_id", "last"),
+            device_type=("device_type", "last"),
+        )
+        .reset_index()
+    )
+    df_view_history_features["previous_view_count"] = df_view_history_features["previous_view_count"].astype(pd.Int64Dtype())
+    return df_view_history_features
+
+
+def create_random_view_log(n_rows, n_users, seed=0):
+    rng = np.random.default_rng(seed)
+    df_view_log = create_random_impression_log(n_rows, n_users, seed=seed + 100).rename(columns={"impression_id": "view_id"})
+    df_view_log["item_id"] = rng.integers(0, 1000, n_rows)
+    df_view_log["device_type"] = rng.choice(["android", "iphone", "web", None], n_rows)
+    # View logs are in the order of logged_at, which decides the last view of the join
+    return df_view_log.sort_values("logged_at", kind="stable", ignore_index=True)
+
+
+@pytest.mark.parametrize("lookback_days", [0, 1, 7])
+@pytest.mark.parametrize("seed", [0, 1])
+def test_get_view_history_feature_equivalence(lookback_days, seed):
+    df_impression_log = create_random_impression_log(n_rows=2000, n_users=60, seed=seed)
+    # Some users do not have views
+    df_view_log = create_random_view_log(n_rows=2000, n_users=50, seed=seed)
+
+    df_expected = _get_view_history_feature_by_join(df_impression_log, df_view_log, lookback_days=lookback_days)
+    df_actual = _get_view_history_feature(df_impression_log, df_view_log, lookback_days=lookback_days)
+
+    assert_frame_equal(df_actual, df_expected)
+
+
+def test_get_view_history_feature_equivalence_with_missing_values():
+    df_impression_log = create_random_impression_log(n_rows=500, n_users=5)
+    df_impression_log = df_impression_log[df_impression_log["user_id"] < 5]
+    df_view_log = create_random_view_log(n_rows=500, n_users=5)
+    df_view_log["item_id"] = df_view_log["item_id"].astype(float)
+    df_view_log.loc[df_view_log.index[::3], "item_id"] = np.nan
+    # Duplicated views of the same time keep the last one
+    df_view_log = pd.concat([df_view_log, df_view_log.assign(device_type="tablet")]).sort_values(
+        "logged_at", kind="stable", ignore_index=True
+    )
+
+    df_expected = _get_view_history_feature_by_join(df_impression_log, df_view_log)
+    df_actual = _get_view_history_feature(df_impression_log, df_view_log)
+
+    assert_frame_equal(df_actual, df_expected)
+
+
+def create_random_logs(n_rows, n_users, seed=0):
+    df_impression_log = create_random_impression_log(n_rows=n_rows, n_users=n_users, seed=seed)
+    df_view_log = create_random_view_log(n_rows=n_rows, n_users=n_users, seed=seed)
+    # Same dtypes as the validated view log
+    df_view_log["item_id"] = df_view_log["item_id"].astype(pd.Int64Dtype())
+    df_view_log["device_type"] = df_view_log["device_type"].astype(pd.StringDtype())
+    df_item = pd.DataFrame({"item_id": np.arange(1000), "item_price": np.arange(1000) * 10})
+    return df_impression_log, df_view_log, df_item
+
+
+@pytest.mark.parametrize("lookback_days", [0, 7])
+def test_get_incremental_impression_feature_equivalence(tmp_path, lookback_days):
+    df_impression_log, df_view_log, df_item = create_random_logs(n_rows=3000, n_users=50)
+    to_datetime = datetime(2018, 12, 8)
+
+    feature_state = FeatureState.from_logs(
+        df_impression_log[df_impression_log["logged_at"] <= to_datetime],
+        df_view_log[df_view_log["logged_at"] <= to_datetime],
+        to_datetime=to_datetime,
+        lookback_days=lookback_days,
+    )
+    for day in range(1, 4):
+        from_datetime, to_datetime = feature_state.to_datetime, to_datetime + timedelta(days=1)
+        is_new_impression = (df_impression_log["logged_at"] > from_datetime) & (df_impression_log["logged_at"] <= to_datetime)
+        is_new_view = (df_view_log["logged_at"] > from_datetime) & (df_view_log["logged_at"] <= to_datetime)
+        df_new_impression_log = df_impression_log[is_new_impression].reset_index(drop=True)
+        df_new_view_log = df_view_log[is_new_view].reset_index(drop=True)
+
+        # Full recompute over all logs until the day
+        df_expected = get_impression_feature(
+            df_impression_log=df_impression_log[df_impression_log["logged_at"] <= to_datetime],
+            df_view_log=df_view_log[df_view_log["logged_at"] <= to_datetime],
+            df_item=df_item,
+            lookback_days=lookback_days,
+        )
+        df_expected = df_expected[df_expected["impression_id"].isin(df_new_impression_log["impression_id"])]
+        df_actual = get_incremental_impression_feature(
+            df_impression_log=df_new_impression_log,
+            df_view_log=df_new_view_log,
+            df_item=df_item,
+            feature_state=feature_state,
+        )
+
+        assert len(df_actual) == is_new_impression.sum() > 0
+        assert_frame_equal(df_actual, df_expected.reset_index(drop=True))
+
+        # The state of the day is persisted for the next run
+        feature_state.update(df_new_impression_log, df_new_view_log, to_datetime=to_datetime).save(tmp_path / str(day))
+        feature_state = FeatureState.load(tmp_path / str(day))
+
+
+def split_into_chunks(df, from_datetime, to_datetime, chunk_interval, include_from_datetime=True):
+    # Same chunks as extract_dataframe_chunks_from_athena
+    chunks = []
+    for i, (chunk_from, chunk_to) in enumerate(get_chunk_intervals(from_datetime, to_datetime, chunk_interval)):
+        is_after_from = df["logged_at"] >= chunk_from if include_from_datetime and i == 0 else df["logged_at"] > chunk_from
+        chunks.append((chunk_to, df[is_after_from & (df["logged_at"] <= chunk_to)].reset_index(drop=True)))
+    return chunks
+
+
+@pytest.mark.parametrize("lookback_days", [0, 7])
+@pytest.mark.parametrize("chunk_days", [1, 3])
+def test_iter_impression_feature_equivalence(lookback_days, chunk_days):
+    df_impression_log, df_view_log, df_item = create_random_logs(n_rows=3000, n_users=50)
+    to_datetime = datetime(2018, 12, 12)
+    impression_from_datetime = to_datetime - timedelta(days=10)
+    view_from_datetime = impression_from_datetime - timedelta(days=lookback_days)
+    df_impression_log = df_impression_log[df_impression_log["logged_at"].between(impression_from_datetime, to_datetime)]
+    df_view_log = df_view_log[df_view_log["logged_at"].between(view_from_datetime, to_datetime)]
+
+    df_expected = get_impression_feature(df_impression_log, df_view_log, df_item, lookback_days=lookback_days)
+    feature_chunks = list(
+        iter_impression_feature(
+            impression_log_chunks=split_into_chunks(
+                df_impression_log, impression_from_datetime, to_datetime, timedelta(days=chunk_days)
+            ),
+            view_log_chunks=split_into_chunks(df_view_log, view_from_datetime, to_datetime, timedelta(days=chunk_days)),
+            df_item=df_item,
+            lookback_days=lookback_days,
+        )
+    )
+    df_actual = pd.concat([df_feature for df_feature, _ in feature_chunks], ignore_index=True)
+
+    assert len(feature_chunks) == math.ceil(10 / chunk_days)
+    assert_frame_equal(
+        df_actual.sort_values("impression_id", ignore_index=True),
+        df_expected.sort_values("impression_id", ignore_index=True),
+    )
+    # The state after the last chunk continues an incremental run
+    feature_state = feature_chunks[-1][1]
+    assert feature_state.to_datetime == to_datetime
+    assert feature_state.df_view_log["logged_at"].min() > pd.Timestamp(feature_state.window_start)
+
+
+def test_iter_impression_feature_from_feature_state():
+    df_impression_log, df_view_log, df_item = create_random_logs(n_rows=3000, n_users=50)
+    from_datetime, to_datetime = datetime(2018, 12, 5), datetime(2018, 12, 12)
+    feature_state = FeatureState.from_logs(
+        df_impression_log[df_impression_log["logged_at"] <= from_datetime],
+        df_view_log[df_view_log["logged_at"] <= from_datetime],
+        to_datetime=from_datetime,
+    )
+
+    df_expected = get_incremental_impression_feature(
+        df_impression_log[df_impression_log["logged_at"].between(from_datetime, to_datetime, inclusive="right")],
+        df_view_log[df_view_log["logged_at"].between(from_datetime, to_datetime, inclusive="right")],
+        df_item,
+        feature_state=feature_state,
+    )
+    feature_chunks = iter_impression_feature(
+        impression_log_chunks=split_into_chunks(
+            df_impression_log, from_datetime, to_datetime, timedelta(days=2), include_from_datetime=False
+        ),
+        view_log_chunks=split_into_chunks(
+            df_view_log, from_datetime, to_datetime, timedelta(days=2), include_from_datetime=False
+        ),
+        df_item=df_item,
+        feature_state=feature_state,
+    )
+    df_actual = pd.concat([df_feature for df_feature, _ in feature_chunks], ignore_index=True)
+
+    assert_frame_equal(
+        df_actual.sort_values("impression_id", ignore_index=True),
+        df_expected.sort_values("impression_id", ignore_index=True),
+    )
+
+
+@pytest.mark.parametrize("workers", [2, 3])
+def test_sharded_preprocess_equivalence(workers):
+    df_impression_log, df_view_log, df_item = create_random_logs(n_rows=3000, n_users=50)
+    df_impression_log = df_impression_log.assign(app_code=1, os_version="latest", is_4g=0, is_click=0)
+    # Some users do not have views
+    df_view_log = df_view_log[df_view_log["user_id"] < 40]
+
+    for preprocess in [apply_preprocess, get_impression_feature]:
+        df_expected = preprocess(df_impression_log, df_view_log, df_item)
+        df_actual = preprocess(df_impression_log, df_view_log, df_item, workers=workers)
+
+        assert_frame_equal(df_actual, df_expected)
+
+
+def test_sharded_preprocess_equivalence_with_more_shards_than_workers(monkeypatch):
+    df_impression_log, df_view_log, df_item = create_random_logs(n_rows=3000, n_users=50)
+    df_impression_log = df_impression_log.assign(app_code=1, os_version="latest", is_4g=0, is_click=0)
+    # Shards are submitted while the previous ones are processed
+    monkeypatch.setattr("mlops.model.preprocess.SHARD_MAX_ROWS", 200)
+
+    df_expected = get_impression_feature(df_impression_log, df_view_log, df_item)
+    df_actual = get_impression_feature(df_impression_log, df_view_log, df_item, workers=2)
+
+    assert_frame_equal(df_actual, df_expected)
+
+
+def test_sharded_incremental_impression_feature_equivalence():
+    df_impression_log, df_view_log, df_item = create_random_logs(n_rows=3000, n_users=50)
+    to_datetime = datetime(2018, 12, 8)
+    feature_state = FeatureState.from_logs(
+        df_impression_log[df_impression_log["logged_at"] <= to_datetime],
+        df_view_log[df_view_log["logged_at"] <= to_datetime],
+        to_datetime=to_datetime,
+    )
+    df_new_impression_log = df_impression_log[df_impression_log["logged_at"] > to_datetime]
+    df_new_view_log = df_view_log[df_view_log["logged_at"] > to_datetime]
+
+    df_expected = get_incremental_impression_feature(df_new_impression_log, df_new_view_log, df_item, feature_state)
+    df_actual = get_incremental_impression_feature(df_new_impression_log, df_new_view_log, df_item, feature_state, workers=2)
+
+    assert_frame_equal(df_actual, df_expected)
+
+
+def test_split_by_user_id():
+    df_impression_log = create_random_impression_log(n_rows=500, n_users=20)
+    # The same user_id in float is in the same shard
+    df_view_log = create_random_impression_log(n_rows=500, n_users=20, seed=1).astype({"user_id": float})
+
+    shards = list(_split_by_user_id([df_impression_log, df_view_log], n_shards=4))
+
+    assert len(shards) == 4
+    assert [sum(len(df) for df in dfs) for dfs in zip(*shards, strict=True)] == [500, 500]
+    for df_impression_shard, df_view_shard in shards:
+        assert set(df_impression_shard["user_id"]).isdisjoint(set(df_view_log["user_id"]) - set(df_view_shard["user_id"]))
+
+
+def test_pyarrow_dtype_backend_equivalence():
+    df_impression_log, df_view_log, df_item = create_random_logs(n_rows=3000, n_users=50)
+    df_impression_log = df_impression_log.assign(app_code=1, os_version="latest", is_4g=0, is_click=0)
+    df_view_log = df_view_log[df_view_log["user_id"] < 40]
+    df_item = df_item.assign(category_1=1, category_2=2, category_3=3, product_type=4)
+    model_config = get_model_config("lightgbm_ctr")
+
+    results = []
+    for dtype_backend in ["numpy_nullable", "pyarrow"]:
+        dfs = [df_impression_log, df_view_log, df_item]
+        if dtype_backend == "pyarrow":
+            dfs = [df.convert_dtypes(dtype_backend="pyarrow") for df in dfs]
+        df = apply_schema(apply_preprocess(*dfs), model_config.schemas)
+        results.append([df_split[model_config.feature_columns] for df_split in apply_train_test_split(df)])
+
+    for df_expected, df_actual in zip(*results, strict=True):
+        # Categories of item_id are Int64 from the nullable view log, and int64 from the arrow one
+        assert_frame_equal(df_actual, df_expected, check_dtype=False, check_categorical=False)
+        for column in df_expected.select_dtypes("category").columns:
+            assert df_actual[column].cat.categories.tolist() == df_expected[column].cat.categories.tolist()
+            assert (df_actual[column].cat.codes == df_expected[column].cat.codes).all()
+    assert results[1][0]["os_version"].cat.categories.tolist() == results[0][0]["os_version"].cat.categories.tolist()
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("n_rows", [2_500, 5_000, 10_000])
+def test_benchmark_get_impression_history_feature(n_rows):
+    # Impressions per user grow with n_rows, which is quadratic for the self join
+    df_impression_log = create_random_impression_log(n_rows=n_rows, n_users=100)
+
+    results = {}
+    for name, get_feature in [
+        ("self_join", _get_impression_history_feature_by_self_join),
+        ("sorted_window", _get_impression_history_feature),
+    ]:
+        start = time.perf_counter()
+        get_feature(df_impression_log)
+        results[name] = time.perf_counter() - start
+    print(f"\n{n_rows=}: " + ", ".join(f"{name}={elapsed:.3f}s" for name, elapsed in results.items()))
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("n_rows", [2_500, 5_000, 10_000])
+def test_benchmark_get_view_history_feature(n_rows):
+    df_impression_log = create_random_impression_log(n_rows=n_rows, n_users=100)
+    df_view_log = create_random_view_log(n_rows=n_rows, n_users=100)
+
+    results = {}
+    for name, get_feature in [("join", _get_view_history_feature_by_join), ("sorted_window", _get_view_history_feature)]:
+        tracemalloc.start()
+        start = time.perf_counter()
+        get_feature(df_impression_log, df_view_log)
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        results[name] = f"{elapsed:.3f}s, peak={peak / 1024 / 1024:.1f}MiB"
+    print(f"\n{n_rows=}: " + ", ".join(f"{name}={result}" for name, result in results.items()))
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("workers", [1, 2, 4])
+def test_benchmark_sharded_preprocess(workers):
+    df_impression_log, df_view_log, df_item = create_random_logs(n_rows=1_000_000, n_users=100_000)
+
+    start = time.perf_counter()
+    get_impression_feature(df_impression_log, df_view_log, df_item, workers=workers)
+    print(f"\n{workers=}: {time.perf_counter() - start:.3f}s")
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("model_name", ["sgd_classifier_ctr", "lightgbm_ctr"])
+def test_benchmark_apply_schema_memory(model_name):
+    df_impression_log, df_view_log, df_item = create_random_logs(n_rows=1_000_000, n_users=100_000)
+    df_impression_log = df_impression_log.assign(
+        app_code=np.arange(len(df_impression_log)) % 500,
+        os_version=np.array(["old", "latest", "intermediate"])[np.arange(len(df_impression_log)) % 3],
+        is_4g=0,
+        is_click=0,
+    )
+    df_view_log["device_type"] = df_view_log["device_type"].fillna("web")
+    df_item = df_item.assign(category_1=1, category_2=2, category_3=3, product_type=4)
+    df_preprocessed = apply_preprocess(df_impression_log, df_view_log, df_item)
+    schemas = get_model_config(model_name).schemas
+    # Previous schemas with the default int and object dtypes
+    wide_dtypes = {"int8": "int", "int16": "int", "int32": "int"}
+    wide_schemas = [
+        Schema(
+            name=schema.name,
+            dtype="str" if schema.categories else wide_dtypes.get(schema.dtype, schema.dtype),
+            null_value=schema.null_value,
+        )
+        for schema in schemas
+    ]
+
+    results = {}
+    for name, _schemas in [("wide", wide_schemas), ("narrow", schemas)]:
+        df = df_preprocessed.copy()
+        start = time.perf_counter()
+        df = apply_schema(df, _schemas)
+        elapsed = time.perf_counter() - start
+        memory = df[[schema.name for schema in schemas]].memory_usage(deep=True).sum() / 1024 / 1024
+        results[name] = f"{elapsed:.3f}s, features={memory:.1f}MiB"
+    print(f"\n{model_name=}: " + ", ".join(f"{name}={result}" for name, result in results.items()))
+
+
+def _run_pipeline(dir_path, dtype_backend):
+    start = time.perf_counter()
+    read_kwargs = {"dtype_backend": "pyarrow"} if dtype_backend == "pyarrow" else {}
+    dfs = [pd.read_parquet(dir_path / f"{name}.parquet", **read_kwargs) for name in ["impression_log", "view_log", "mst_item"]]
+    df = apply_schema(apply_preprocess(*dfs), get_model_config("lightgbm_ctr").schemas)
+    apply_train_test_split(df)
+    elapsed = time.perf_counter() - start
+    # Peak RSS of this process, ru_maxrss is inherited from the parent across exec
+    with open("/proc/self/status") as f:
+        peak_rss_kib = next(int(line.split()[1]) for line in f if line.startswith("VmHWM:"))
+    return elapsed, peak_rss_kib / 1024
+
+
+@pytest.mark.benchmark
+def test_benchmark_pyarrow_dtype_backend(tmp_path):
+    df_impression_log, df_view_log, df_item = create_random_logs(n_rows=1_000_000, n_users=100_000)
+    df_impression_log = df_impression_log.assign(
+        impression_id=df_impression_log["impression_id"].map(lambda impression_id: f"{impression_id:0>32}"),
+        app_code=1,
+        os_version=np.array(["old", "latest", "intermediate"])[np.arange(len(df_impression_log)) % 3],
+        is_4g=0,
+        is_click=0,
+    )
+    df_item = df_item.assign(category_1=1, category_2=2, category_3=3, product_type=4)
+    for name, df in [("impression_log", df_impression_log), ("view_log", df_view_log), ("mst_item", df_item)]:
+        df.to_parquet(tmp_path / f"{name}.parquet", index=False)
+
+    results = {}
+    for dtype_backend in ["numpy_nullable", "pyarrow"]:
+        # A new process per backend, so that the peak RSS is of the pipeline only
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+            elapsed, peak_rss_mib = executor.submit(_run_pipeline, tmp_path, dtype_backend).result()
+        results[dtype_backend] = f"{elapsed:.3f}s, peak_rss={peak_rss_mib:.1f}MiB"
+    print("\n" + ", ".join(f"{name}={result}" for name, result in results.items()))
+
+
+@pytest.mark.benchmark
+def test_benchmark_apply_date_split():
+    n_rows = 2_000_000
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(
+        {
+            "logged_at": pd.Timestamp("2018-11-12") + pd.to_timedelta(rng.integers(0, 28 * 86400, n_rows), unit="s"),
+            **{f"feature_{i}": rng.integers(0, 100, n_rows) for i in range(16)},
+        }
+    )
+
+    results = {}
+    for name, split in [
+        ("ratio", lambda: apply_train_test_split(df)),
+        ("date", lambda: apply_date_split(df, to_datetime=datetime(2018, 12, 10))),
+    ]:
+        tracemalloc.start()
+        start = time.perf_counter()
+        split()
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        results[name] = f"{elapsed:.3f}s, peak={peak / 1024 / 1024:.1f}MiB"
+    print(f"\n{n_rows=}: " + ", ".join(f"{name}={result}" for name, result in results.items()))
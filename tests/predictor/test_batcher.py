@@ -0,0 +1,103 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from mlops.predictor import MicroBatcher
+
+
+def double(rows):
+    return np.array([row[0] * 2 for row in rows], dtype=float)
+
+
+async def predict_concurrently(batcher, values):
+    await batcher.start()
+    try:
+        return await asyncio.gather(*[batcher.predict([value]) for value in values], return_exceptions=True)
+    finally:
+        await batcher.stop()
+
+
+def test_predict_concurrent_requests_in_batches():
+    batch_sizes = []
+
+    def predict_fn(rows):
+        batch_sizes.append(len(rows))
+        return double(rows)
+
+    batcher = MicroBatcher(predict_fn=predict_fn, max_batch_size=4, max_wait_us=100_000)
+    predictions = asyncio.run(predict_concurrently(batcher, list(range(10))))
+
+    assert predictions == [value * 2 for value in range(10)]
+    assert batch_sizes == [4, 4, 2]
+
+    stats = batcher.stats.as_dict()
+    assert stats["batch_count"] == 3
+    assert stats["request_count"] == 10
+    assert stats["max_batch_size"] == 4
+    assert stats["mean_batch_size"] == pytest.approx(10 / 3)
+    assert stats["max_queue_wait_us"] >= stats["mean_queue_wait_us"] > 0
+
+
+def test_predict_single_request_is_not_delayed():
+    batcher = MicroBatcher(predict_fn=double, max_batch_size=4, max_wait_us=10_000_000)
+
+    async def predict():
+        await batcher.start()
+        try:
+            return await asyncio.wait_for(batcher.predict([1]), timeout=1)
+        finally:
+            await batcher.stop()
+
+    assert asyncio.run(predict()) == 2
+    assert batcher.stats.batch_count == 1
+
+
+def test_predict_waits_for_concurrent_requests_under_load():
+    batch_sizes = []
+
+    def predict_fn(rows):
+        batch_sizes.append(len(rows))
+        return double(rows)
+
+    batcher = MicroBatcher(predict_fn=predict_fn, max_batch_size=8, max_wait_us=200_000)
+
+    async def predict():
+        await batcher.start()
+        try:
+            first = await asyncio.gather(batcher.predict([1]), batcher.predict([2]))
+
+            # Requests arriving within the batch window after a multi-request batch are combined
+            async def delayed_predict(value):
+                await asyncio.sleep(0.01)
+                return await batcher.predict([value])
+
+            second = await asyncio.gather(batcher.predict([3]), delayed_predict(4))
+            return first + second
+        finally:
+            await batcher.stop()
+
+    assert asyncio.run(predict()) == [2, 4, 6, 8]
+    assert batch_sizes == [2, 2]
+
+
+def test_predict_propagates_exception_to_every_request():
+    def predict_fn(rows):
+        raise ValueError("model error")
+
+    batcher = MicroBatcher(predict_fn=predict_fn, max_batch_size=4)
+    results = asyncio.run(predict_concurrently(batcher, [1, 2, 3]))
+
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_predict_not_started():
+    batcher = MicroBatcher(predict_fn=double)
+
+    with pytest.raises(RuntimeError, match="Micro batcher is not started"):
+        asyncio.run(batcher.predict([1]))
+
+
+def test_invalid_max_batch_size():
+    with pytest.raises(ValueError, match="max_batch_size must be positive"):
+        MicroBatcher(predict_fn=double, max_batch_size=0)
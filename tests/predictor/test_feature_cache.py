@@ -0,0 +1,169 @@
+import asyncio
+
+import pytest
+
+from mlops.predictor import CachedOnlineFeatureStore, FeatureCache
+
+
+class StubOnlineFeatureStore:
+    def __init__(self, version, records, latest_version=None, delay=0.0):
+        self.version = version
+        self.records = records
+        self.latest_version = latest_version
+        self.delay = delay
+        self.requested_user_ids = []
+
+    async def get_impression_features_async(self, user_ids):
+        self.requested_user_ids.append(list(user_ids))
+        await asyncio.sleep(self.delay)
+        return {user_id: dict(self.records.get(user_id, {})) for user_id in user_ids}
+
+    async def get_latest_feature_version_async(self):
+        return self.latest_version
+
+    def close(self):
+        pass
+
+
+def test_feature_cache_lru_eviction():
+    cache = FeatureCache(max_size=2, ttl_seconds=60)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+
+    cache.put("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats_dict() == {"hits": 3, "misses": 1, "evictions": 1, "expirations": 0, "invalidations": 0, "size": 2}
+
+
+def test_feature_cache_ttl(monkeypatch):
+    current_time = 100.0
+    monkeypatch.setattr("mlops.predictor.feature_cache.time.monotonic", lambda: current_time)
+    cache = FeatureCache(max_size=2, ttl_seconds=10)
+    cache.put("a", 1)
+
+    current_time = 109.0
+    assert cache.get("a") == 1
+
+    current_time = 110.0
+    assert cache.get("a") is None
+    assert cache.stats.expirations == 1
+    assert len(cache) == 0
+
+
+def test_feature_cache_disabled():
+    cache = FeatureCache(max_size=0)
+    cache.put("a", 1)
+
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_cached_online_feature_store_hit():
+    feature_store = StubOnlineFeatureStore(version="1", records={1: {"item_id": "10"}, 2: {"item_id": "20"}})
+    cached_feature_store = CachedOnlineFeatureStore(feature_store=feature_store, cache=FeatureCache())
+
+    async def get_features():
+        first = await cached_feature_store.get_impression_features_async([1, 2, 3])
+        second = await cached_feature_store.get_impression_features_async([2, 1, 3])
+        single = await cached_feature_store.get_impression_feature_async(1)
+        return first, second, single
+
+    first, second, single = asyncio.run(get_features())
+
+    assert first == second == {1: {"item_id": "10"}, 2: {"item_id": "20"}, 3: {}}
+    assert single == {"item_id": "10"}
+    # Users without features are not cached
+    assert feature_store.requested_user_ids == [[1, 2, 3], [3]]
+    stats = cached_feature_store.stats_dict()
+    assert stats["hits"] == 3
+    assert stats["misses"] == 4
+    assert stats["resolved_version"] == "1"
+
+
+def test_cached_online_feature_store_collapses_concurrent_misses():
+    feature_store = StubOnlineFeatureStore(version="1", records={1: {"item_id": "10"}, 2: {"item_id": "20"}}, delay=0.05)
+    cached_feature_store = CachedOnlineFeatureStore(feature_store=feature_store, cache=FeatureCache())
+
+    async def get_features():
+        return await asyncio.gather(
+            cached_feature_store.get_impression_feature_async(1),
+            cached_feature_store.get_impression_feature_async(1),
+            cached_feature_store.get_impression_features_async([1, 2]),
+        )
+
+    first, second, batch = asyncio.run(get_features())
+
+    assert first == second == {"item_id": "10"}
+    assert batch == {1: {"item_id": "10"}, 2: {"item_id": "20"}}
+    assert feature_store.requested_user_ids == [[1], [2]]
+    assert cached_feature_store.stats_dict()["in_flight"] == 0
+
+
+def test_cached_online_feature_store_propagates_exception_to_waiters():
+    class FailingFeatureStore(StubOnlineFeatureStore):
+        async def get_impression_features_async(self, user_ids):
+            await asyncio.sleep(0.01)
+            raise RuntimeError("feature store error")
+
+    cached_feature_store = CachedOnlineFeatureStore(
+        feature_store=FailingFeatureStore(version="1", records={}), cache=FeatureCache()
+    )
+
+    async def get_features():
+        return await asyncio.gather(
+            cached_feature_store.get_impression_feature_async(1),
+            cached_feature_store.get_impression_feature_async(1),
+            return_exceptions=True,
+        )
+
+    results = asyncio.run(get_features())
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert cached_feature_store.stats_dict()["in_flight"] == 0
+
+
+def test_cached_online_feature_store_invalidates_on_new_latest_version(monkeypatch):
+    current_time = 100.0
+    monkeypatch.setattr("mlops.predictor.feature_cache.time.monotonic", lambda: current_time)
+    feature_store = StubOnlineFeatureStore(version="latest", records={1: {"item_id": "10"}}, latest_version="1")
+    cached_feature_store = CachedOnlineFeatureStore(
+        feature_store=feature_store, cache=FeatureCache(), version_refresh_seconds=60
+    )
+
+    assert asyncio.run(cached_feature_store.get_impression_feature_async(1)) == {"item_id": "10"}
+    assert cached_feature_store.resolved_version == "1"
+
+    # New version is published, but the version is not refreshed yet
+    feature_store.latest_version = "2"
+    feature_store.records = {1: {"item_id": "11"}}
+    current_time = 130.0
+    assert asyncio.run(cached_feature_store.get_impression_feature_async(1)) == {"item_id": "10"}
+
+    current_time = 160.0
+    assert asyncio.run(cached_feature_store.get_impression_feature_async(1)) == {"item_id": "11"}
+    assert cached_feature_store.resolved_version == "2"
+    assert cached_feature_store.stats_dict()["invalidations"] == 1
+    assert feature_store.requested_user_ids == [[1], [1]]
+
+
+@pytest.mark.parametrize("latest_version", [None, "1"])
+def test_cached_online_feature_store_keeps_version_when_not_published(latest_version):
+    feature_store = StubOnlineFeatureStore(version="latest", records={1: {"item_id": "10"}}, latest_version=latest_version)
+    cached_feature_store = CachedOnlineFeatureStore(
+        feature_store=feature_store, cache=FeatureCache(), version_refresh_seconds=0
+    )
+
+    async def get_features():
+        await cached_feature_store.get_impression_feature_async(1)
+        feature_store.latest_version = None
+        await cached_feature_store.get_impression_feature_async(1)
+
+    asyncio.run(get_features())
+
+    assert cached_feature_store.resolved_version == latest_version
+    assert cached_feature_store.stats_dict()["invalidations"] == 0
+    assert feature_store.requested_user_ids == [[1]]
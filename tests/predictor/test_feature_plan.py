@@ -0,0 +1,134 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from mlops.model import add_impression_time_feature, apply_schema, get_model_config
+from mlops.predictor import AdRequest, FeaturePlan
+
+AD_REQUEST = AdRequest(
+    impression_id="a9e7126a585a69a32bc7414e9d0c0ada",
+    logged_at="2018-12-13 07:44:00",
+    user_id=87862,
+    app_code=127,
+    os_version="latest",
+    is_4g=1,
+)
+
+# Online feature store returns every attribute as a string
+USER_FEATURES = {
+    "full": {
+        "user_id": "87862",
+        "version": "20250614130717",
+        "previous_impression_count": "3",
+        "previous_view_count": "5",
+        "device_type": "android",
+        "item_id": "43886",
+        "item_price": "1180",
+        "category_1": "10",
+        "category_2": "68",
+        "category_3": "1",
+        "product_type": "2196",
+    },
+    "partial": {"previous_impression_count": "1", "device_type": "iphone"},
+    "missing_value": {"previous_view_count": np.nan, "device_type": np.nan, "item_price": None},
+    # Out of the range of int16 and int32
+    "out_of_range": {"category_1": "40000", "category_2": "-40000", "item_price": "3000000000", "product_type": "7"},
+    "empty": {},
+}
+
+
+def _transform_with_dataframe(ad_request, user_feature, schemas):
+    df = pd.DataFrame([ad_request.model_dump()])
+    df = df.assign(**user_feature)
+    df = add_impression_time_feature(df, "logged_at")
+    for schema in schemas:
+        if schema.name not in df.columns:
+            df[schema.name] = np.nan
+    df = apply_schema(df, schemas)
+    return df[[schema.name for schema in schemas]]
+
+
+@pytest.mark.parametrize("model_name", ["sgd_classifier_ctr", "lightgbm_ctr"])
+@pytest.mark.parametrize("user_feature", USER_FEATURES.values(), ids=USER_FEATURES.keys())
+def test_transform_parity_with_apply_schema(model_name, user_feature):
+    model_config = get_model_config(model_name)
+    feature_plan = FeaturePlan(schemas=model_config.schemas)
+
+    df_expected = _transform_with_dataframe(AD_REQUEST, user_feature, model_config.schemas)
+    features = feature_plan.transform(AD_REQUEST, user_feature)
+
+    assert feature_plan.columns == df_expected.columns.tolist()
+    expected = df_expected.iloc[0].to_dict()
+    assert feature_plan.to_record(features) == expected
+    for value, name in zip(features, feature_plan.columns, strict=True):
+        assert type(value) is type(expected[name]), name
+
+
+def test_transform_out_of_range_integer():
+    model_config = get_model_config("sgd_classifier_ctr")
+    feature_plan = FeaturePlan(schemas=model_config.schemas)
+    # app_code and category_1 are int16
+    ad_request = AD_REQUEST.model_copy(update={"app_code": 40000})
+    user_feature = USER_FEATURES["full"] | {"category_1": "-40000", "category_2": str(np.iinfo(np.int16).max)}
+
+    record = feature_plan.to_record(feature_plan.transform(ad_request, user_feature))
+
+    # Same as missing values instead of an OverflowError
+    assert (record["app_code"], record["category_1"], record["category_2"]) == (-1, -1, 32767)
+    assert record["item_price"] == 1180
+
+
+@pytest.mark.parametrize(
+    "logged_at", ["2018-12-13 07:44:00", "2018-12-16T23:59:59", "2023-05-01T12:34:56Z", "2023-05-01T00:30:00+09:00"]
+)
+def test_transform_time_feature_parity(logged_at):
+    model_config = get_model_config("sgd_classifier_ctr")
+    feature_plan = FeaturePlan(schemas=model_config.schemas)
+    ad_request = AD_REQUEST.model_copy(update={"logged_at": logged_at})
+
+    df_expected = _transform_with_dataframe(ad_request, {}, model_config.schemas)
+    record = feature_plan.to_record(feature_plan.transform(ad_request, {}))
+
+    for column in ["impression_hour", "impression_day", "impression_weekday"]:
+        assert record[column] == df_expected[column].iloc[0]
+
+
+def test_to_model_input_sgd_classifier_parity(sgd_classifier_model):
+    model_config = get_model_config("sgd_classifier_ctr")
+    feature_plan = FeaturePlan.compile(model_config=model_config, model=sgd_classifier_model)
+
+    rows = [feature_plan.transform(AD_REQUEST, user_feature) for user_feature in USER_FEATURES.values()]
+    df_expected = pd.concat(
+        [_transform_with_dataframe(AD_REQUEST, user_feature, model_config.schemas) for user_feature in USER_FEATURES.values()]
+    )
+
+    X = feature_plan.to_model_input(rows)
+
+    assert X.shape == (len(rows), len(model_config.schemas))
+    np.testing.assert_array_equal(sgd_classifier_model.predict_proba(X), sgd_classifier_model.predict_proba(df_expected))
+
+
+def test_to_model_input_lightgbm_parity(lightgbm_model):
+    model_config = get_model_config("lightgbm_ctr")
+    feature_plan = FeaturePlan.compile(model_config=model_config, model=lightgbm_model)
+
+    # user_id of the request is an int category, the one from the feature store is a string
+    user_features = list(USER_FEATURES.values())
+    ad_requests = [AD_REQUEST, AD_REQUEST.model_copy(update={"user_id": 1, "app_code": 999})]
+    rows = [feature_plan.transform(ad_request, user_feature) for ad_request in ad_requests for user_feature in user_features]
+
+    X = feature_plan.to_model_input(rows)
+
+    assert X.dtype == np.float64
+    for x, (ad_request, user_feature) in zip(X, [(r, u) for r in ad_requests for u in user_features], strict=True):
+        df_expected = _transform_with_dataframe(ad_request, user_feature, model_config.schemas)
+        np.testing.assert_array_equal(
+            lightgbm_model.predict_proba(x.reshape(1, -1)), lightgbm_model.predict_proba(df_expected)
+        )
+
+
+def test_compile_with_mismatched_categorical_features(lightgbm_model):
+    model_config = get_model_config("sgd_classifier_ctr")
+
+    with pytest.raises(ValueError, match="Model categorical features do not match schemas"):
+        FeaturePlan.compile(model_config=model_config, model=lightgbm_model)
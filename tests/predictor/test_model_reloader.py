@@ -0,0 +1,123 @@
+import asyncio
+
+import pytest
+
+from mlops.model import get_model_config
+from mlops.predictor import ModelReloader
+from mlops.predictor.model_reloader import WARMUP_AD_REQUEST
+
+
+def create_model_reloader(models, latest_versions, **kwargs):
+    return ModelReloader(
+        model_config=get_model_config("sgd_classifier_ctr"),
+        load_model=lambda version: models[version],
+        get_latest_version=lambda: latest_versions[-1],
+        warmup_batch_size=2,
+        **kwargs,
+    )
+
+
+def test_reload_swaps_to_latest_version(sgd_classifier_model):
+    latest_versions = ["1"]
+    model_reloader = create_model_reloader({"1": sgd_classifier_model, "2": sgd_classifier_model}, latest_versions)
+
+    async def reload():
+        await model_reloader.start(version="1")
+        previous_model = model_reloader.current
+        try:
+            not_reloaded = await model_reloader.reload()
+            latest_versions.append("2")
+            reloaded = await model_reloader.reload()
+        finally:
+            await model_reloader.stop()
+        return previous_model, not_reloaded, reloaded
+
+    previous_model, not_reloaded, reloaded = asyncio.run(reload())
+
+    assert not not_reloaded
+    assert reloaded
+    assert model_reloader.current.version == "2"
+    assert model_reloader.current is not previous_model
+    status = model_reloader.status_dict()
+    assert status["version"] == "2"
+    assert status["check_count"] == 2
+    assert status["reload_count"] == 1
+    assert status["failed_count"] == 0
+
+
+def test_reload_keeps_current_model_on_failure(sgd_classifier_model):
+    # Version 2 is registered, but it can not be loaded
+    model_reloader = create_model_reloader({"1": sgd_classifier_model}, ["1", "2"])
+
+    async def reload():
+        await model_reloader.start(version="1")
+        try:
+            reloaded = await model_reloader.reload()
+            prediction = await model_reloader.current.batcher.predict(
+                model_reloader.current.feature_plan.transform(WARMUP_AD_REQUEST, {})
+            )
+        finally:
+            await model_reloader.stop()
+        return reloaded, prediction
+
+    reloaded, prediction = asyncio.run(reload())
+
+    assert not reloaded
+    assert 0 <= prediction <= 1
+    assert model_reloader.current.version == "1"
+    assert model_reloader.stats.failed_count == 1
+    assert "2" in model_reloader.stats.last_error
+
+
+def test_requests_in_flight_finish_on_previous_model(sgd_classifier_model):
+    latest_versions = ["1"]
+    model_reloader = create_model_reloader({"1": sgd_classifier_model, "2": sgd_classifier_model}, latest_versions)
+
+    async def reload_during_request():
+        await model_reloader.start(version="1")
+        try:
+            with model_reloader.use() as serving_model:
+                latest_versions.append("2")
+                reload_task = asyncio.create_task(model_reloader.reload())
+                # The model is swapped while the request is still in flight
+                while model_reloader.current.version != "2":
+                    await asyncio.sleep(0.01)
+                prediction = await serving_model.batcher.predict(serving_model.feature_plan.transform(WARMUP_AD_REQUEST, {}))
+                assert not reload_task.done()
+            await reload_task
+        finally:
+            await model_reloader.stop()
+        return serving_model, prediction
+
+    serving_model, prediction = asyncio.run(reload_during_request())
+
+    assert serving_model.version == "1"
+    assert serving_model.active_requests == 0
+    assert 0 <= prediction <= 1
+    with pytest.raises(RuntimeError, match="Micro batcher is not started"):
+        asyncio.run(serving_model.batcher.predict([]))
+
+
+def test_poll_latest_version(sgd_classifier_model):
+    model_reloader = create_model_reloader(
+        {"1": sgd_classifier_model, "2": sgd_classifier_model}, ["1", "2"], poll_interval_seconds=0.01
+    )
+
+    async def poll():
+        await model_reloader.start(version="1")
+        try:
+            while model_reloader.current.version != "2":
+                await asyncio.sleep(0.01)
+        finally:
+            await model_reloader.stop()
+
+    asyncio.run(asyncio.wait_for(poll(), timeout=10))
+
+    assert model_reloader.stats.reload_count == 1
+
+
+def test_current_before_start():
+    model_reloader = create_model_reloader({}, ["1"])
+
+    with pytest.raises(RuntimeError, match="Model is not loaded"):
+        _ = model_reloader.current
@@ -0,0 +1,140 @@
+import asyncio
+import io
+import json
+import time
+
+import pytest
+
+from mlops.predictor import PredictionLogger
+
+
+class SlowStream(io.StringIO):
+    def __init__(self, delay):
+        super().__init__()
+        self.delay = delay
+        self.write_count = 0
+
+    def write(self, s):
+        time.sleep(self.delay)
+        self.write_count += 1
+        return super().write(s)
+
+
+def read_records(stream):
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_log_flushes_in_batches():
+    stream = SlowStream(delay=0)
+    prediction_logger = PredictionLogger(stream=stream, flush_size=4, flush_interval_ms=1000)
+
+    async def log():
+        await prediction_logger.start()
+        for i in range(10):
+            await prediction_logger.log({"impression_id": i, "prediction": 0.5})
+        await asyncio.sleep(0.05)
+        flushed = prediction_logger.stats.flushed
+        await prediction_logger.stop()
+        return flushed
+
+    flushed_before_stop = asyncio.run(log())
+
+    # Full batches are flushed without waiting for the interval, the rest is drained on shutdown
+    assert flushed_before_stop == 8
+    assert read_records(stream) == [{"impression_id": i, "prediction": 0.5} for i in range(10)]
+    assert prediction_logger.stats_dict() == {
+        "enqueued": 10,
+        "flushed": 10,
+        "dropped": 0,
+        "flush_count": 3,
+        "failed": 0,
+        "queue_size": 0,
+    }
+
+
+def test_log_flushes_after_interval():
+    stream = io.StringIO()
+    prediction_logger = PredictionLogger(stream=stream, flush_size=100, flush_interval_ms=10)
+
+    async def log():
+        await prediction_logger.start()
+        await prediction_logger.log({"impression_id": 1})
+        await asyncio.sleep(0.1)
+        records = read_records(stream)
+        await prediction_logger.stop()
+        return records
+
+    assert asyncio.run(log()) == [{"impression_id": 1}]
+
+
+def test_log_does_not_block_on_slow_stream():
+    stream = SlowStream(delay=0.2)
+    prediction_logger = PredictionLogger(stream=stream, flush_size=1, flush_interval_ms=0)
+
+    async def log():
+        await prediction_logger.start()
+        await prediction_logger.log({"impression_id": 0})
+        await asyncio.sleep(0.01)
+        # The event loop keeps running while the first record is written
+        loop = asyncio.get_running_loop()
+        start_time = loop.time()
+        await asyncio.sleep(0.01)
+        elapsed_time = loop.time() - start_time
+        await prediction_logger.stop()
+        return elapsed_time
+
+    assert asyncio.run(log()) < 0.1
+    assert read_records(stream) == [{"impression_id": 0}]
+
+
+@pytest.mark.parametrize("overflow_policy", ["drop", "sample"])
+def test_log_overflow_drops_records(overflow_policy):
+    stream = io.StringIO()
+    prediction_logger = PredictionLogger(
+        stream=stream, queue_size=10, overflow_policy=overflow_policy, sample_rate=0.5, seed=42
+    )
+
+    async def log():
+        # The logger is not started, so the queue is never consumed until shutdown
+        for i in range(100):
+            await prediction_logger.log({"impression_id": i})
+        await prediction_logger.stop()
+
+    asyncio.run(log())
+
+    stats = prediction_logger.stats_dict()
+    assert stats["enqueued"] == 10
+    assert stats["dropped"] == 90
+    assert stats["flushed"] == 10
+    records = read_records(stream)
+    if overflow_policy == "drop":
+        assert records == [{"impression_id": i} for i in range(10)]
+    else:
+        # Records are sampled once the queue is half full
+        assert records[:5] == [{"impression_id": i} for i in range(5)]
+        assert records[-1]["impression_id"] > 9
+
+
+def test_log_overflow_blocks():
+    stream = io.StringIO()
+    prediction_logger = PredictionLogger(stream=stream, queue_size=2, overflow_policy="block")
+
+    async def log():
+        for i in range(2):
+            await prediction_logger.log({"impression_id": i})
+        with pytest.raises(TimeoutError):
+            await asyncio.wait_for(prediction_logger.log({"impression_id": 2}), timeout=0.05)
+
+        await prediction_logger.start()
+        await asyncio.wait_for(prediction_logger.log({"impression_id": 3}), timeout=1)
+        await prediction_logger.stop()
+
+    asyncio.run(log())
+
+    assert read_records(stream) == [{"impression_id": 0}, {"impression_id": 1}, {"impression_id": 3}]
+    assert prediction_logger.stats.dropped == 0
+
+
+def test_invalid_overflow_policy():
+    with pytest.raises(ValueError, match="Invalid overflow policy"):
+        PredictionLogger(overflow_policy="unknown")
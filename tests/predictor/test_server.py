@@ -0,0 +1,185 @@
+import multiprocessing
+import os
+import signal
+import socket
+import time
+from contextlib import asynccontextmanager
+
+import numpy as np
+import psutil
+import pytest
+import requests
+from fastapi import FastAPI
+
+from mlops.model import LightGBMModel, SGDClassifierModel
+from mlops.predictor import PreforkServer, get_available_cpu_count
+from mlops.predictor.server import WORKER_STARTUP_FAILURE
+
+# Set by preload in the server process before forking workers
+preloaded = {}
+
+
+def get_free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def create_app(fail_on_startup=False):
+    @asynccontextmanager
+    async def lifespan(app):
+        if fail_on_startup:
+            raise RuntimeError("Failed to start")
+        yield
+
+    app = FastAPI(lifespan=lifespan)
+
+    @app.get("/worker")
+    async def worker():
+        return {"pid": os.getpid(), "preloaded_pid": preloaded.get("pid")}
+
+    return app
+
+
+def run_server(port, workers, fail_on_startup=False, preload=None):
+    server = PreforkServer(
+        app=create_app(fail_on_startup),
+        host="127.0.0.1",
+        port=port,
+        workers=workers,
+        preload=preload or (lambda: preloaded.update(pid=os.getpid())),
+        log_level="warning",
+    )
+    os._exit(server.run())
+
+
+def wait_until_ready(port, process, timeout=30):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            return requests.get(f"http://127.0.0.1:{port}/worker", timeout=1).json()
+        except (requests.ConnectionError, requests.Timeout):
+            assert process.is_alive()
+            time.sleep(0.05)
+    raise TimeoutError("Server is not ready.")
+
+
+def test_get_available_cpu_count():
+    assert 1 <= get_available_cpu_count() <= (os.cpu_count() or 1)
+
+
+def test_prefork_server_serves_with_workers():
+    port = get_free_port()
+    process = multiprocessing.get_context("fork").Process(target=run_server, args=(port, 2))
+    process.start()
+    try:
+        wait_until_ready(port, process)
+        responses = [requests.get(f"http://127.0.0.1:{port}/worker", timeout=5).json() for _ in range(20)]
+        worker_pids = {child.pid for child in psutil.Process(process.pid).children()}
+    finally:
+        os.kill(process.pid, signal.SIGTERM)
+        process.join(timeout=30)
+
+    assert process.exitcode == 0
+    assert len(worker_pids) == 2
+    assert {response["pid"] for response in responses} <= worker_pids
+    # Objects created by preload are inherited by the workers
+    assert {response["preloaded_pid"] for response in responses} == {process.pid}
+
+
+def test_prefork_server_restarts_worker():
+    port = get_free_port()
+    process = multiprocessing.get_context("fork").Process(target=run_server, args=(port, 1))
+    process.start()
+    try:
+        pid = wait_until_ready(port, process)["pid"]
+        os.kill(pid, signal.SIGKILL)
+        time.sleep(0.5)
+        restarted_pid = wait_until_ready(port, process)["pid"]
+    finally:
+        os.kill(process.pid, signal.SIGTERM)
+        process.join(timeout=30)
+
+    assert restarted_pid != pid
+
+
+def test_prefork_server_stops_on_startup_failure():
+    port = get_free_port()
+    process = multiprocessing.get_context("fork").Process(target=run_server, args=(port, 2, True))
+    process.start()
+    process.join(timeout=30)
+
+    assert process.exitcode == WORKER_STARTUP_FAILURE
+
+
+def test_prefork_server_invalid_workers():
+    with pytest.raises(ValueError, match="workers must be positive"):
+        PreforkServer(app=create_app(), workers=0)
+
+
+def create_models(create_train_data):
+    X, y = create_train_data("sgd_classifier_ctr", n_rows=20_000)
+    sgd_classifier_model = SGDClassifierModel(is_optuna=False, args={"loss": "log_loss", "random_state": 42})
+    sgd_classifier_model.train(X, y, X, y)
+
+    X, y = create_train_data("lightgbm_ctr", n_rows=20_000)
+    lightgbm_model = LightGBMModel(args={"num_leaves": 255, "min_data_in_leaf": 1, "verbose": -1}, num_round=500)
+    lightgbm_model.train(X, y, X, y)
+    return {"sgd_classifier": sgd_classifier_model, "lightgbm": lightgbm_model}
+
+
+def get_worker_memory(port, process, workers):
+    # Wait until every worker has started
+    pids = set()
+    while len(pids) < workers:
+        pids.add(wait_until_ready(port, process, timeout=300)["pid"])
+    memory = []
+    for child in psutil.Process(process.pid).children():
+        memory_info = child.memory_full_info()
+        memory.append({"rss": memory_info.rss, "pss": memory_info.pss, "uss": memory_info.uss})
+    return memory
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("preload", [True, False], ids=["preload", "load_per_worker"])
+def test_benchmark_worker_memory(create_train_data, preload):
+    workers = 4
+
+    def load_models():
+        preloaded["models"] = create_models(create_train_data)
+        for name, model in preloaded["models"].items():
+            X, _ = create_train_data(f"{name}_ctr", n_rows=1)
+            model.predict_proba_online(X)
+
+    @asynccontextmanager
+    async def lifespan(app):
+        if not preload:
+            load_models()
+        yield
+
+    def run():
+        server = PreforkServer(
+            app=FastAPI(lifespan=lifespan, routes=create_app().routes),
+            host="127.0.0.1",
+            port=port,
+            workers=workers,
+            preload=load_models if preload else None,
+            log_level="warning",
+        )
+        os._exit(server.run())
+
+    port = get_free_port()
+    process = multiprocessing.get_context("fork").Process(target=run)
+    process.start()
+    try:
+        memory = get_worker_memory(port, process, workers)
+    finally:
+        os.kill(process.pid, signal.SIGTERM)
+        process.join(timeout=60)
+
+    mib = 1024 * 1024
+    print(
+        f"\n{preload=}, {workers=}: "
+        + ", ".join(f"mean {key}={np.mean([m[key] for m in memory]) / mib:.1f}MiB" for key in ["rss", "pss", "uss"])
+    )
+    assert len(memory) == workers
@@ -0,0 +1,56 @@
+import asyncio
+from datetime import datetime
+
+import boto3
+import pandas as pd
+import pytest
+from moto import mock_aws
+
+from feature_extraction import ONLINE_FEATURES, put_online_features
+from mlops.aws import OnlineFeatureStoreDynamoDB
+from mlops.predictor import CachedOnlineFeatureStore, FeatureCache
+
+FEATURE_TABLE = "test_feature_store"
+
+
+@pytest.fixture(autouse=True)
+def aws_credentials(monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "ap-northeast-1")
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+
+
+def create_feature(user_ids, logged_at, previous_impression_count):
+    df = pd.DataFrame({column: 1 for column in ONLINE_FEATURES if column != "user_id"}, index=range(len(user_ids)))
+    return df.assign(
+        user_id=user_ids, logged_at=pd.Timestamp(logged_at), previous_impression_count=previous_impression_count
+    ).astype({"device_type": str})
+
+
+@mock_aws
+def test_put_online_features_incremental():
+    # Same key schema as mlops-impression-feature in terraform/dynamodb.tf
+    boto3.client("dynamodb").create_table(
+        TableName=FEATURE_TABLE,
+        KeySchema=[{"AttributeName": "user_id", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "user_id", "AttributeType": "N"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    expired_at = datetime(2018, 12, 17)
+    put_online_features(
+        create_feature([1, 2], "2018-12-09", previous_impression_count=1), FEATURE_TABLE, "20181210000000", expired_at
+    )
+
+    # User 1 has no new impressions in the increment
+    put_online_features(
+        create_feature([2], "2018-12-10", previous_impression_count=2), FEATURE_TABLE, "20181211000000", expired_at
+    )
+    online_feature_store = CachedOnlineFeatureStore(
+        feature_store=OnlineFeatureStoreDynamoDB(table=FEATURE_TABLE, version="latest"), cache=FeatureCache()
+    )
+    records = asyncio.run(online_feature_store.get_impression_features_async([1, 2]))
+    online_feature_store.close()
+
+    assert online_feature_store.resolved_version == "20181211000000"
+    assert (records[1]["version"], records[1]["previous_impression_count"]) == ("20181210000000", "1")
+    assert (records[2]["version"], records[2]["previous_impression_count"]) == ("20181211000000", "2")
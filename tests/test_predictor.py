@@ -1,5 +1,196 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+
+import boto3
+import numpy as np
 import pytest
 import requests
+from fastapi.testclient import TestClient
+from moto import mock_aws
+
+import predictor
+from mlops.aws import OnlineFeatureStoreDynamoDB, put_latest_feature_version
+from mlops.model import get_model_config
+from mlops.predictor import CachedOnlineFeatureStore, FeatureCache, ModelReloader
+
+FEATURE_TABLE = "test_feature_store"
+AD_REQUESTS = [
+    {
+        "impression_id": f"impression_{i}",
+        "logged_at": "2018-12-13 07:44:00",
+        "user_id": user_id,
+        "app_code": 127,
+        "os_version": "latest",
+        "is_4g": 1,
+    }
+    for i, user_id in enumerate([87862, 16998, 87862, 1])
+]
+
+
+def create_feature_table(dynamodb):
+    # Same key schema as mlops-impression-feature in terraform/dynamodb.tf, one row per user
+    dynamodb.create_table(
+        TableName=FEATURE_TABLE,
+        KeySchema=[{"AttributeName": "user_id", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "user_id", "AttributeType": "N"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+
+
+def put_feature(dynamodb, user_id, version, device_type):
+    dynamodb.put_item(
+        TableName=FEATURE_TABLE,
+        Item={
+            "user_id": {"N": str(user_id)},
+            "version": {"N": version},
+            "previous_impression_count": {"N": "3"},
+            "device_type": {"S": device_type},
+        },
+    )
+
+
+@pytest.fixture
+def client(sgd_classifier_model):
+    os.environ["AWS_DEFAULT_REGION"] = "ap-northeast-1"
+    os.environ["AWS_ACCESS_KEY_ID"] = "testing"
+    os.environ["AWS_SECRET_ACCESS_KEY"] = "testing"
+
+    with mock_aws():
+        dynamodb = boto3.client("dynamodb")
+        create_feature_table(dynamodb)
+        for user_id, device_type in [(87862, "android"), (16998, "iphone")]:
+            put_feature(dynamodb, user_id=user_id, version="1", device_type=device_type)
+        put_latest_feature_version(table_name=FEATURE_TABLE, version="1")
+
+        model_config = get_model_config("sgd_classifier_ctr")
+        logged_predictions = []
+
+        async def log_prediction(record, prediction, model_version):
+            logged_predictions.append((record, prediction))
+
+        online_feature_store = CachedOnlineFeatureStore(
+            feature_store=OnlineFeatureStoreDynamoDB(table=FEATURE_TABLE, version="latest"), cache=FeatureCache()
+        )
+
+        @asynccontextmanager
+        async def lifespan(app):
+            model_reloader = ModelReloader(
+                model_config=model_config,
+                load_model=lambda version: sgd_classifier_model,
+                get_latest_version=lambda: "1",
+                warmup_batch_size=1,
+            )
+            await model_reloader.start(version="1")
+            yield {
+                "model_config": model_config,
+                "model_reloader": model_reloader,
+                "online_feature_store": online_feature_store,
+                "log_prediction": log_prediction,
+            }
+            await model_reloader.stop()
+            online_feature_store.close()
+
+        original_lifespan = predictor.app.router.lifespan_context
+        predictor.app.router.lifespan_context = lifespan
+        try:
+            with TestClient(predictor.app) as test_client:
+                test_client.logged_predictions = logged_predictions
+                yield test_client
+        finally:
+            predictor.app.router.lifespan_context = original_lifespan
+
+
+def test_predict_batch(client):
+    response = client.post("/predict/batch", json=AD_REQUESTS)
+
+    assert response.status_code == 200
+    response_data = response.json()
+    assert response_data["model"] == "sgd_classifier_ctr"
+    assert [p["impression_id"] for p in response_data["predictions"]] == [r["impression_id"] for r in AD_REQUESTS]
+    assert len(client.logged_predictions) == len(AD_REQUESTS)
+
+    expected = [client.post("/predict", json=ad_request).json()["prediction"] for ad_request in AD_REQUESTS]
+    np.testing.assert_allclose([p["prediction"] for p in response_data["predictions"]], expected, rtol=0, atol=1e-12)
+
+
+def test_predict(client):
+    response = client.post("/predict", json=AD_REQUESTS[0])
+
+    assert response.status_code == 200
+    response_data = response.json()
+    assert response_data["model"] == "sgd_classifier_ctr"
+    assert 0 <= response_data["prediction"] <= 1
+    assert client.logged_predictions[0][0]["device_type"] == "android"
+
+    stats = client.get("/stats/batcher").json()
+    assert stats["request_count"] == 1
+    assert stats["batch_count"] == 1
+
+    client.post("/predict", json=AD_REQUESTS[0])
+    stats = client.get("/stats/feature_cache").json()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["resolved_version"] == "1"
+    assert client.get("/stats/feature_store").json() == {"timeouts": 0, "errors": 0}
+
+
+@mock_aws
+def test_cached_online_feature_store_with_terraform_table(monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "ap-northeast-1")
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    dynamodb = boto3.client("dynamodb")
+    create_feature_table(dynamodb)
+    put_feature(dynamodb, user_id=1, version="1", device_type="android")
+    put_feature(dynamodb, user_id=2, version="2", device_type="iphone")
+    put_latest_feature_version(table_name=FEATURE_TABLE, version="2")
+    feature_store = OnlineFeatureStoreDynamoDB(table=FEATURE_TABLE, version="latest")
+    # moto does not check keys of BatchGetItem against the key schema as DynamoDB does
+    key_names = {key["AttributeName"] for key in dynamodb.describe_table(TableName=FEATURE_TABLE)["Table"]["KeySchema"]}
+    batch_get_item = feature_store.client.batch_get_item
+
+    def batch_get_item_with_key_schema(RequestItems):
+        for request in RequestItems.values():
+            if any(set(key) != key_names for key in request["Keys"]):
+                raise ValueError("The provided key element does not match the schema")
+        return batch_get_item(RequestItems=RequestItems)
+
+    monkeypatch.setattr(feature_store.client, "batch_get_item", batch_get_item_with_key_schema)
+    online_feature_store = CachedOnlineFeatureStore(feature_store=feature_store, cache=FeatureCache())
+
+    records = asyncio.run(online_feature_store.get_impression_features_async([1, 2]))
+    online_feature_store.close()
+
+    # The user without a row of the published version is served the latest row of the user
+    assert records[1]["device_type"] == "android"
+    assert records[2]["device_type"] == "iphone"
+    assert online_feature_store.resolved_version == "2"
+    assert online_feature_store.feature_store.stats_dict() == {"timeouts": 0, "errors": 0}
+
+
+def test_model_status(client):
+    response = client.get("/model")
+
+    assert response.status_code == 200
+    response_data = response.json()
+    assert response_data["model"] == "sgd_classifier_ctr"
+    assert response_data["version"] == "1"
+    assert response_data["reload_count"] == 0
+    assert response_data["load_seconds"] > 0
+
+
+def test_predict_batch_empty(client):
+    response = client.post("/predict/batch", json=[])
+
+    assert response.status_code == 200
+    assert response.json() == {"model": "sgd_classifier_ctr", "predictions": []}
+
+
+def test_predict_batch_invalid_request(client):
+    response = client.post("/predict/batch", json=[AD_REQUESTS[0], {"user_id": 1}])
+
+    assert response.status_code == 422
 
 
 @pytest.mark.e2e